@@ -1,4 +1,6 @@
+import multiprocessing
 import os
+from datetime import datetime
 from flask import Flask, render_template
 from flask_migrate import Migrate
 from flask_login import LoginManager
@@ -7,7 +9,7 @@ import logging
 from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 
-from app.models import db, User
+from app.models import db, User, json_serializer, json_deserializer
 from utils.logging_config import setup_logging
 
 def create_app(test_config=None):
@@ -33,11 +35,49 @@ def create_app(test_config=None):
         SECRET_KEY=os.getenv('SECRET_KEY', 'dev'),
         SQLALCHEMY_DATABASE_URI=os.getenv('DATABASE_URL', 'sqlite:///twikit.db'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # JSON columns go through orjson when it is installed
+        SQLALCHEMY_ENGINE_OPTIONS={'json_serializer': json_serializer, 'json_deserializer': json_deserializer},
         TWITTER_CONSUMER_KEY=os.getenv('CONSUMER_KEY'),
         TWITTER_CONSUMER_SECRET=os.getenv('CONSUMER_SECRET'),
         TWITTER_ACCESS_TOKEN=os.getenv('ACCESS_TOKEN'),
         TWITTER_ACCESS_TOKEN_SECRET=os.getenv('ACCESS_TOKEN_SECRET'),
-        SITE_URL=os.getenv('SITE_URL', 'http://localhost:5000')
+        SITE_URL=os.getenv('SITE_URL', 'http://localhost:5000'),
+        POST_DISPATCHER_ENABLED=os.getenv('POST_DISPATCHER_ENABLED', 'false').lower() in ('true', '1', 'yes'),
+        POST_DISPATCH_INTERVAL=int(os.getenv('POST_DISPATCH_INTERVAL', '5')),
+        POST_DISPATCH_BATCH_SIZE=int(os.getenv('POST_DISPATCH_BATCH_SIZE', '100')),
+        POST_DISPATCH_WORKERS=int(os.getenv('POST_DISPATCH_WORKERS', '8')),
+        POST_DISPATCH_LEASE_SECONDS=int(os.getenv('POST_DISPATCH_LEASE_SECONDS', '120')),
+        POST_TIMER_ENABLED=os.getenv('POST_TIMER_ENABLED', 'true').lower() in ('true', '1', 'yes'),
+        POST_TIMER_RECONCILE_INTERVAL=int(os.getenv('POST_TIMER_RECONCILE_INTERVAL', '60')),
+        POST_TIMER_POLL_INTERVAL=int(os.getenv('POST_TIMER_POLL_INTERVAL', '5')),
+        POST_CATCH_UP_ENABLED=os.getenv('POST_CATCH_UP_ENABLED', 'true').lower() in ('true', '1', 'yes'),
+        POST_CATCH_UP_RATE=float(os.getenv('POST_CATCH_UP_RATE', '0.5')),
+        POST_CATCH_UP_BURST=int(os.getenv('POST_CATCH_UP_BURST', '5')),
+        POST_STALE_AFTER=int(os.getenv('POST_STALE_AFTER', str(24 * 3600))),
+        POST_OUTBOX_WORKERS=int(os.getenv('POST_OUTBOX_WORKERS', '4')),
+        CLIENT_CACHE_SIZE=int(os.getenv('CLIENT_CACHE_SIZE', '256')),
+        CLIENT_CACHE_TTL=int(os.getenv('CLIENT_CACHE_TTL', '900')),
+        PROFILE_CACHE_TTL=int(os.getenv('PROFILE_CACHE_TTL', '300')),
+        USER_CACHE_TTL=int(os.getenv('USER_CACHE_TTL', '30')),
+        STREAM_API_URL=os.getenv('STREAM_API_URL', 'https://api.twitter.com/2'),
+        STREAM_BATCH_SIZE=int(os.getenv('STREAM_BATCH_SIZE', '500')),
+        STREAM_FLUSH_INTERVAL=float(os.getenv('STREAM_FLUSH_INTERVAL', '1.0')),
+        STREAM_QUEUE_SIZE=int(os.getenv('STREAM_QUEUE_SIZE', '10000')),
+        STREAM_RULE_SYNC_INTERVAL=int(os.getenv('STREAM_RULE_SYNC_INTERVAL', '60')),
+        STREAM_DEDUP_CAPACITY=int(os.getenv('STREAM_DEDUP_CAPACITY', '1000000')),
+        STREAM_DEDUP_ERROR_RATE=float(os.getenv('STREAM_DEDUP_ERROR_RATE', '0.000001')),
+        STREAM_RETENTION_DAYS=int(os.getenv('STREAM_RETENTION_DAYS', '30')),
+        STREAM_ARCHIVE_DIR=os.getenv('STREAM_ARCHIVE_DIR', os.path.join(app.instance_path, 'stream_archive')),
+        BACKTEST_WORKERS=int(os.getenv('BACKTEST_WORKERS', '0')),
+        QUOTA_WRITE_BEHIND=os.getenv('QUOTA_WRITE_BEHIND', 'false').lower() in ('true', '1', 'yes'),
+        QUOTA_FLUSH_INTERVAL=int(os.getenv('QUOTA_FLUSH_INTERVAL', '30')),
+        QUOTA_CACHE_TTL=int(os.getenv('QUOTA_CACHE_TTL', '30')),
+        QUOTA_RESERVATION_TTL=int(os.getenv('QUOTA_RESERVATION_TTL', '300')),
+        QUOTA_USER_15M_LIMIT=int(os.getenv('QUOTA_USER_15M_LIMIT', '25')),
+        QUOTA_USER_24H_LIMIT=int(os.getenv('QUOTA_USER_24H_LIMIT', '50')),
+        QUOTA_APP_15M_LIMIT=int(os.getenv('QUOTA_APP_15M_LIMIT', '100')),
+        QUOTA_APP_24H_LIMIT=int(os.getenv('QUOTA_APP_24H_LIMIT', '500')),
+        QUOTA_APP_MONTH_LIMIT=int(os.getenv('QUOTA_APP_MONTH_LIMIT', '1500'))
     )
 
     if test_config is None:
@@ -67,25 +107,67 @@ def create_app(test_config=None):
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Served from an in-process identity cache, without a SELECT on a hit
+        from utils.user_cache import UserCache
+        return UserCache.get(int(user_id))
 
     # Setup logging
     setup_logging(app)
 
+    # Size the process-wide cache of pooled 𝕏 API clients
+    from utils.client_registry import ClientRegistry
+    ClientRegistry.configure(app.config['CLIENT_CACHE_SIZE'], app.config['CLIENT_CACHE_TTL'])
+
+    # Rolling per-user and per-app posting limits
+    from utils.quota_engine import QuotaEngine
+    QuotaEngine.configure(app.config)
+
+    # Background services run in the main process only. A spawned worker
+    # process (e.g. of RuleBacktest's pool) re-imports the main module, which
+    # may call create_app() again, and must not start its own copies. Its name
+    # is set before that import, unlike multiprocessing.parent_process().
+    background = not app.testing and multiprocessing.current_process().name == 'MainProcess'
+
+    # Buffer read-only quota counters in memory instead of committing on every page view
+    if app.config['QUOTA_WRITE_BEHIND'] and background:
+        from utils.quota_tracker import QuotaTracker
+        QuotaTracker.start_write_behind(app)
+
     # Register blueprints
     try:
         from app.routes.auth import auth_bp
         from app.routes.main import main_bp
         from app.routes.posts import posts_bp
+        from app.routes.streams import streams_bp
         from app.routes.users import users_bp
 
         app.register_blueprint(auth_bp)
         app.register_blueprint(main_bp)
         app.register_blueprint(posts_bp)
+        app.register_blueprint(streams_bp)
         app.register_blueprint(users_bp)
+
+        # JSON API called with the session cookie; the view only accepts JSON bodies instead
+        csrf.exempt('app.routes.streams.backtest')
     except ImportError as e:
         app.logger.warning(f"Could not import blueprints: {e}")
 
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
+
+    # "Post now" requests are published by a background worker pool
+    if background:
+        from utils.post_outbox import PostOutbox
+        app.extensions['post_outbox'] = PostOutbox(app)
+
+    # Publish scheduled posts from inside the web process when enabled.
+    # Dedicated workers can run `flask dispatch-posts` instead.
+    if app.config['POST_DISPATCHER_ENABLED'] and background:
+        from utils.post_dispatcher import PostDispatcher
+        app.extensions['post_dispatcher'] = PostDispatcher(app)
+        app.extensions['post_dispatcher'].start()
+
     # Register error handlers
     @app.errorhandler(404)
     def page_not_found(e):
@@ -95,6 +177,11 @@ def create_app(test_config=None):
     def internal_server_error(e):
         return render_template('errors/500.html'), 500
 
+    # base.html prints the current year in its footer
+    @app.context_processor
+    def inject_now():
+        return {'now': datetime.utcnow()}
+
     # Add support for ngrok by automatically setting the ngrok-skip-browser-warning header
     @app.after_request
     def add_ngrok_headers(response):
@@ -0,0 +1,98 @@
+"""
+Flask CLI commands for the 𝕏-Pilot application.
+"""
+import click
+from flask import current_app
+
+
+def register_commands(app):
+    """Register the application's CLI commands."""
+
+    @app.cli.command('dispatch-posts')
+    @click.option('--once', is_flag=True, help='Publish everything currently due and exit.')
+    @click.option('--catch-up', is_flag=True, help='Drain the overdue backlog at the catch-up rate first.')
+    def dispatch_posts(once, catch_up):
+        """Publish scheduled posts as they become due."""
+        from utils.post_dispatcher import PostDispatcher
+
+        dispatcher = PostDispatcher(current_app._get_current_object())
+
+        if catch_up:
+            def report(progress):
+                click.echo(f"{progress['drained']} drained, {progress['remaining']} remaining, "
+                           f"{progress['expired']} expired, ETA {progress['eta_seconds']}s")
+
+            dispatcher.catch_up(on_progress=report)
+            # Already caught up, so the regular loop should not start another run
+            dispatcher.app.config['POST_CATCH_UP_ENABLED'] = False
+
+        if once:
+            total = dispatcher.drain()
+            click.echo(f"Dispatched {total} scheduled posts")
+            return
+
+        dispatcher.run_forever()
+
+    @app.cli.command('rebuild-search-index')
+    @click.option('--only', type=click.Choice(['posts', 'stream_results']), help='Rebuild a single index.')
+    def rebuild_search_index(only):
+        """Re-index posts and stream results for full-text search."""
+        from utils.full_text_search import FullTextSearch
+
+        def report(kind, done, total):
+            click.echo(f"{kind}: {done}/{total} rows indexed")
+
+        indexed = FullTextSearch.rebuild(kinds=[only] if only else None, on_progress=report)
+        for kind, count in indexed.items():
+            click.echo(f"Rebuilt {kind} search index ({count} rows)")
+
+    @app.cli.command('ingest-streams')
+    @click.option('--sync-rules', 'sync_only', is_flag=True, help='Sync the upstream rules with active streams and exit.')
+    def ingest_streams(sync_only):
+        """Store posts matched by active streams' filter rules."""
+        from utils.stream_ingest import StreamIngestor
+
+        ingestor = StreamIngestor(current_app._get_current_object())
+
+        if sync_only:
+            result = ingestor.sync_rules()
+            click.echo(f"{result['added']} rules added, {result['deleted']} rules deleted")
+            return
+
+        ingestor.run_forever()
+
+    @app.cli.command('archive-streams')
+    def archive_streams():
+        """Move stream results older than their stream's retention into archive segments."""
+        from utils.stream_archive import StreamArchive
+
+        archived = StreamArchive.rollover()
+        for stream_id, count in archived.items():
+            click.echo(f"Stream {stream_id}: archived {count} results")
+        click.echo(f"Archived {sum(archived.values())} stream results")
+
+    @app.cli.command('backtest-rules')
+    @click.argument('rules', nargs=-1, required=True)
+    @click.option('--user-id', type=int, default=None, help="Only scan this user's streams.")
+    @click.option('--days', type=int, default=None, help='Only scan results from the last DAYS days.')
+    @click.option('--workers', type=int, default=None, help='Worker processes (default: BACKTEST_WORKERS or one per CPU).')
+    @click.option('--sample', 'sample_size', type=int, default=5, show_default=True, help='Matched posts to print.')
+    def backtest_rules(rules, user_id, days, workers, sample_size):
+        """Run filter RULES over stored stream results and report what they match."""
+        from utils.rule_backtest import RuleBacktest
+        from utils.rule_matcher import RuleSyntaxError
+
+        try:
+            result = RuleBacktest.run(list(rules), user_id=user_id, days=days, workers=workers, sample_size=sample_size)
+        except RuleSyntaxError as e:
+            raise click.BadParameter(str(e), param_hint='RULES')
+
+        click.echo(f"Scanned {result['scanned']} results in {result['elapsed']}s: {result['hits']} posts matched")
+        for rule, count in zip(result['rules'], result['hits_by_rule']):
+            click.echo(f"  {count:>8}  {rule}")
+        if result['hits_per_hour']:
+            click.echo("Hits per hour:")
+            for hour, count in result['hits_per_hour'].items():
+                click.echo(f"  {hour}  {count}")
+        for match in result['sample']:
+            click.echo(f"- [{match['post_id']}] {match['text'][:100]}")
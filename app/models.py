@@ -1,10 +1,32 @@
 from datetime import datetime
+import uuid
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.ext.mutable import MutableDict, MutableList
 import json
 
+try:
+    import orjson
+except ImportError:  # optional faster codec
+    orjson = None
+
 db = SQLAlchemy()
 
+
+def json_serializer(value):
+    """Serialize JSON columns, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+def json_deserializer(value):
+    """Deserialize JSON columns, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
+
 class User(db.Model, UserMixin):
     """User model for𝕏authentication."""
     __tablename__ = 'users'
@@ -29,10 +51,17 @@ class User(db.Model, UserMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, nullable=True)
 
+    # Bumped on every UPDATE, which only applies if the row still has the version it was read with
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
     # Relationships
     posts = db.relationship('Post', backref='user', lazy=True, cascade='all, delete-orphan')
     streams = db.relationship('Stream', backref='user', lazy=True, cascade='all, delete-orphan')
     quota_usage = db.relationship('QuotaUsage', backref='user', lazy=True, cascade='all, delete-orphan')
+    quota_reservations = db.relationship('QuotaReservation', backref='user', lazy=True, cascade='all, delete-orphan')
+    quota_events = db.relationship('QuotaEvent', backref='user', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -46,34 +75,55 @@ class Post(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     text = db.Column(db.Text, nullable=False)
 
-    # Media attachments could be stored as JSON string
-    media_attachments = db.Column(db.Text, nullable=True)
+    # Media attachments, decoded once per load; in-place changes mark the post dirty
+    media_attachments = db.Column(MutableList.as_mutable(db.JSON(none_as_null=True)), nullable=True)
 
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     scheduled_at = db.Column(db.DateTime, nullable=True)
     posted_at = db.Column(db.DateTime, nullable=True)
+    # Set when a limit defers the post: the dispatcher leaves it alone until then
+    not_before = db.Column(db.DateTime, nullable=True)
 
-    # Status: draft, scheduled, posted, failed
+    # Status: draft, scheduled, dispatching, posted, failed, expired
     status = db.Column(db.String(16), default='draft')
 
+    # Dispatch lease, held by the worker currently publishing a scheduled post
+    lease_owner = db.Column(db.String(255), nullable=True)  # '<worker id>:<claim id>' lease token
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+
+    # Client-side idempotency key: one key is one post, however often it is submitted or retried
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=True, default=lambda: uuid.uuid4().hex)
+    # Number of times a dispatcher has claimed the post for publishing
+    publish_attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Lets the dispatcher range-scan due posts without touching the rest of the table
+        db.Index('ix_posts_status_scheduled_at', 'status', 'scheduled_at'),
+        # A user's posts newest first (posts list, dashboard)
+        db.Index('ix_posts_user_id_created_at', 'user_id', 'created_at'),
+        # A user's posts by status, e.g. their scheduled posts soonest first
+        db.Index('ix_posts_user_id_status_scheduled_at', 'user_id', 'status', 'scheduled_at'),
+        # A user's posts by publish time
+        db.Index('ix_posts_user_id_posted_at', 'user_id', 'posted_at'),
+    )
+
     def __repr__(self):
         return f'<Post {self.id}>'
 
     @property
     def media(self):
         """Get media attachments as a list."""
-        if self.media_attachments:
-            return json.loads(self.media_attachments)
-        return []
+        if self.media_attachments is None:
+            return []
+        return self.media_attachments
 
     @media.setter
     def media(self, attachments):
-        """Set media attachments from a list."""
-        if attachments:
-            self.media_attachments = json.dumps(attachments)
-        else:
-            self.media_attachments = None
+        """Set media attachments from a list (only written back if it changed)."""
+        attachments = list(attachments) if attachments else None
+        if attachments != self.media_attachments:
+            self.media_attachments = attachments
 
 
 class Stream(db.Model):
@@ -83,7 +133,7 @@ class Stream(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(128), nullable=False)
-    rules = db.Column(db.Text, nullable=False)  # JSON string of rules
+    rules = db.Column(MutableList.as_mutable(db.JSON), nullable=False)  # List of rule dicts
 
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -92,8 +142,13 @@ class Stream(db.Model):
     # Status
     active = db.Column(db.Boolean, default=False)
 
+    # Days results stay in stream_results before they are archived (None: STREAM_RETENTION_DAYS, 0: never)
+    retention_days = db.Column(db.Integer, nullable=True)
+
     # Relationship
     results = db.relationship('StreamResult', backref='stream', lazy=True, cascade='all, delete-orphan')
+    archive_segments = db.relationship('StreamArchiveSegment', backref='stream', lazy=True,
+                                       cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Stream {self.name}>'
@@ -101,17 +156,16 @@ class Stream(db.Model):
     @property
     def rules_list(self):
         """Get rules as a list of dictionaries."""
-        if self.rules:
-            return json.loads(self.rules)
-        return []
+        if self.rules is None:
+            return []
+        return self.rules
 
     @rules_list.setter
     def rules_list(self, rules_data):
-        """Set rules from a list of dictionaries."""
-        if rules_data:
-            self.rules = json.dumps(rules_data)
-        else:
-            self.rules = json.dumps([])
+        """Set rules from a list of dictionaries (only written back if they changed)."""
+        rules_data = list(rules_data) if rules_data else []
+        if rules_data != self.rules:
+            self.rules = rules_data
 
 
 class StreamResult(db.Model):
@@ -125,8 +179,15 @@ class StreamResult(db.Model):
     author_id = db.Column(db.String(64), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    # Additional data could be stored as JSON
-    data = db.Column(db.Text, nullable=True)
+    # Additional data, decoded once per load; in-place changes mark the result dirty
+    data = db.Column(MutableDict.as_mutable(db.JSON(none_as_null=True)), nullable=True)
+
+    __table_args__ = (
+        # A stream's results in arrival order
+        db.Index('ix_stream_results_stream_id_created_at', 'stream_id', 'created_at'),
+        # A post is stored once per stream, however often it is delivered
+        db.Index('uq_stream_results_stream_id_post_id', 'stream_id', 'post_id', unique=True),
+    )
 
     def __repr__(self):
         return f'<StreamResult {self.id}>'
@@ -134,17 +195,54 @@ class StreamResult(db.Model):
     @property
     def extra_data(self):
         """Get additional data as a dictionary."""
-        if self.data:
-            return json.loads(self.data)
-        return {}
+        if self.data is None:
+            return {}
+        return self.data
 
     @extra_data.setter
     def extra_data(self, data):
-        """Set additional data from a dictionary."""
-        if data:
-            self.data = json.dumps(data)
-        else:
-            self.data = None
+        """Set additional data from a dictionary (only written back if it changed)."""
+        data = dict(data) if data else None
+        if data != self.data:
+            self.data = data
+
+
+class StreamArchiveSegment(db.Model):
+    """A compressed file of archived results of one stream, see utils/stream_archive.py."""
+    __tablename__ = 'stream_archive_segments'
+
+    id = db.Column(db.Integer, primary_key=True)
+    stream_id = db.Column(db.Integer, db.ForeignKey('streams.id'), nullable=False)
+    path = db.Column(db.String(256), nullable=False)  # Relative to STREAM_ARCHIVE_DIR
+    row_count = db.Column(db.Integer, nullable=False)
+
+    # Ranges covered by the segment, so reads can skip it without opening it
+    min_created_at = db.Column(db.DateTime, nullable=False)
+    max_created_at = db.Column(db.DateTime, nullable=False)
+    min_post_id = db.Column(db.String(64), nullable=False)
+    max_post_id = db.Column(db.String(64), nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_stream_archive_segments_stream_id_min_created_at', 'stream_id', 'min_created_at'),
+    )
+
+    def __repr__(self):
+        return f'<StreamArchiveSegment {self.path}>'
+
+
+class DispatchLock(db.Model):
+    """A named lease held by one dispatcher process at a time, e.g. the backlog catch-up run."""
+    __tablename__ = 'dispatch_locks'
+
+    name = db.Column(db.String(32), primary_key=True)
+    owner = db.Column(db.String(255), nullable=False)  # Worker id of the holder
+    expires_at = db.Column(db.DateTime, nullable=False)  # Renewed by the holder while it runs
+    cutoff = db.Column(db.DateTime, nullable=True)  # Catch-up: posts due at or before it are the backlog
+
+    def __repr__(self):
+        return f'<DispatchLock {self.name} held by {self.owner}>'
 
 
 class QuotaUsage(db.Model):
@@ -156,6 +254,8 @@ class QuotaUsage(db.Model):
     month = db.Column(db.Integer, nullable=False)  # 1-12
     year = db.Column(db.Integer, nullable=False)
     posts_used = db.Column(db.Integer, default=0)
+    reads_used = db.Column(db.Integer, default=0)  # Read-only calls (profile, tokens...)
+    posts_reserved = db.Column(db.Integer, default=0)  # Open reservations, see QuotaReservation
     reset_date = db.Column(db.String(10), nullable=False)  # YYYY-MM-DD
 
     __table_args__ = (
@@ -164,3 +264,35 @@ class QuotaUsage(db.Model):
 
     def __repr__(self):
         return f'<QuotaUsage {self.year}-{self.month}: {self.posts_used}/1500>'
+
+class QuotaReservation(db.Model):
+    """A quota unit held for a publish attempt until it is committed or released."""
+    __tablename__ = 'quota_reservations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='SET NULL'), nullable=True)
+    month = db.Column(db.Integer, nullable=False)  # 1-12
+    year = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<QuotaReservation {self.id} for user {self.user_id}>'
+
+
+class QuotaEvent(db.Model):
+    """A published post in the append-only log that rolling quota windows are counted from."""
+    __tablename__ = 'quota_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # A user's events in a window, and pruning of their old events
+        db.Index('ix_quota_events_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<QuotaEvent {self.id} for user {self.user_id}>'
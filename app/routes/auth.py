@@ -7,6 +7,8 @@ import os
 from app.models import db, User
 from utils.twitter_auth import TwitterOAuth
 from utils.quota_tracker import QuotaTracker
+from utils.client_registry import ClientRegistry
+from utils.user_cache import UserCache
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -96,6 +98,11 @@ def twitter_callback():
     user = User.query.filter_by(twitter_id=user_info['twitter_id']).first()
 
     if user:
+        # Drop pooled clients and the cached identity built with the tokens being replaced
+        if user.access_token != tokens['access_token']:
+            ClientRegistry.invalidate(user.consumer_key, user.access_token)
+            UserCache.invalidate(user.id)
+
         # Update existing user
         user.username = user_info['username']
         user.name = user_info['name']
@@ -187,6 +194,10 @@ def revoke_tokens():
         # Save old username for the flash message
         username = current_user.username
 
+        # Drop pooled clients and the cached identity that still hold the tokens
+        ClientRegistry.invalidate(current_user.consumer_key, current_user.access_token)
+        UserCache.invalidate(current_user.id)
+
         # Clear tokens
         current_user.access_token = None
         current_user.access_token_secret = None
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, current_app
 from flask_login import login_required, current_user
-from app.models import Post
+from sqlalchemy import func
+from app.models import db, Post
 from utils.quota_tracker import QuotaTracker
 
 main_bp = Blueprint('main', __name__)
@@ -19,16 +20,18 @@ def dashboard():
     # Get quota information
     quota_status = QuotaTracker.get_quota_status(current_user)
 
-    # Get post counts and recent activity
-    posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
-    post_count = len(posts)
-    recent_posts = posts[:5]  # Get 5 most recent posts
+    # Get post counts per status in one aggregate query instead of loading every post
+    status_counts = dict(
+        db.session.query(Post.status, func.count(Post.id))
+        .filter(Post.user_id == current_user.id)
+        .group_by(Post.status)
+        .all()
+    )
+    post_count = sum(status_counts.values())
+    scheduled_count = status_counts.get('scheduled', 0)
 
-    # Get count of scheduled posts
-    scheduled_count = Post.query.filter_by(
-        user_id=current_user.id,
-        status='scheduled'
-    ).count()
+    # Get 5 most recent posts
+    recent_posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).limit(5).all()
 
     # For now, we can't get follower counts without additional API calls
     # We'll update this later when implementing profile management
@@ -1,21 +1,52 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, abort
 from flask_login import login_required, current_user
 import tweepy
+import uuid
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 
 from app.models import db, Post
 from utils.quota_tracker import QuotaTracker
+from utils.post_timer import ScheduledPostTimer
+from utils.post_outbox import PostOutbox
+from utils.client_registry import ClientRegistry
+from utils.rate_limit import RateLimitRegistry
+from utils.api_retry import ApiRetry
+from utils.quota_engine import QuotaEngine
+from utils.pagination import KeysetPagination
+from utils.full_text_search import FullTextSearch
+from utils.data_export import DataExport
 
 posts_bp = Blueprint('posts', __name__, url_prefix='/posts')
 
+def _already_submitted():
+    """Redirect a repeated submit of the compose form."""
+    flash('This post was already submitted.', 'info')
+    return redirect(url_for('posts.index'))
+
 @posts_bp.route('/')
 @login_required
 def index():
-    """List user's posts."""
-    posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
+    """List user's posts, newest first, one page at a time."""
+    try:
+        posts, next_cursor = KeysetPagination.paginate(
+            Post.query.filter_by(user_id=current_user.id),
+            Post.created_at,
+            Post.id,
+            cursor=request.args.get('cursor'),
+            descending=True
+        )
+    except ValueError:
+        abort(400)
+    next_url = url_for('posts.index', cursor=next_cursor) if next_cursor else None
+
+    # "Load more" requests only need the next batch of cards
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({"html": render_template('posts/_post_list.html', posts=posts), "next_url": next_url})
+
     # Get quota information for the user
     quota_status = QuotaTracker.get_quota_status(current_user)
-    return render_template('posts/index.html', posts=posts, quota=quota_status)
+    return render_template('posts/index.html', posts=posts, quota=quota_status, next_url=next_url)
 
 @posts_bp.route('/compose', methods=['GET', 'POST'])
 @login_required
@@ -24,6 +55,13 @@ def compose():
     if request.method == 'POST':
         text = request.form.get('text', '').strip()
 
+        # The form carries a key generated when it was rendered, so a double
+        # click or a resubmitted form cannot create (and publish) the post twice
+        idempotency_key = request.form.get('idempotency_key', '')[:64] or uuid.uuid4().hex
+        # Unique across all users, like the constraint that enforces it
+        if Post.query.filter_by(idempotency_key=idempotency_key).first():
+            return _already_submitted()
+
         if not text:
             flash('Post content cannot be empty.', 'error')
             return render_template('posts/compose.html', text='')
@@ -61,8 +99,17 @@ def compose():
                 post.text = text
                 post.status = 'scheduled'
                 post.scheduled_at = scheduled_at
+                post.idempotency_key = idempotency_key
                 db.session.add(post)
-                db.session.commit()
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    # A concurrent submit of the same form got there first
+                    db.session.rollback()
+                    return _already_submitted()
+
+                # Let the in-process timer fire it on time
+                ScheduledPostTimer.notify_scheduled(post)
 
                 flash('Post scheduled successfully!', 'success')
                 return redirect(url_for('posts.scheduled'))
@@ -87,59 +134,38 @@ def compose():
                                           premium=is_premium_user,
                                           char_limit=char_limit)
 
-                # Post to Twitter
-                auth = tweepy.OAuth1UserHandler(
-                    current_user.consumer_key,
-                    current_user.consumer_secret,
-                    current_user.access_token,
-                    current_user.access_token_secret
-                )
-
-                # Use v2 Client instead of v1.1 API
-                client = tweepy.Client(
-                    consumer_key=current_user.consumer_key,
-                    consumer_secret=current_user.consumer_secret,
-                    access_token=current_user.access_token,
-                    access_token_secret=current_user.access_token_secret
-                )
-
-                # Use create_post method from v2 API instead of update_status
-                twitter_response = client.create_tweet(text=text)
-
-                # Safely get the data from the response
-                response_data = getattr(twitter_response, 'data', None)
-                if response_data:
-                    post_id = response_data['id']
-                else:
-                    # Fallback for unexpected response format
-                    current_app.logger.warning("Unexpected response format from Twitter API")
-                    post_id = str(datetime.utcnow().timestamp())  # Use timestamp as fallback ID
+                # Rolling and app-wide limits; the dispatcher counts the post when it publishes
+                admission = QuotaEngine.check(current_user)
+                if not admission['allowed']:
+                    flash(QuotaEngine.describe(admission), 'error')
+                    return render_template('posts/compose.html',
+                                          text=text,
+                                          quota=quota_status,
+                                          premium=is_premium_user,
+                                          char_limit=char_limit)
 
-                # Record the post in our database
+                # Record the post as queued; the outbox publishes it in the background
                 post = Post()
                 post.user_id = current_user.id
-                post.twitter_id = post_id
                 post.text = text
-                post.status = 'posted'
-                post.posted_at = datetime.utcnow()
+                post.status = 'queued'
+                post.scheduled_at = datetime.utcnow()
+                post.idempotency_key = idempotency_key
                 db.session.add(post)
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    # A concurrent submit of the same form got there first
+                    db.session.rollback()
+                    return _already_submitted()
 
-                # Track API usage
-                QuotaTracker.track_api_call(current_user, "post")
-
-                db.session.commit()
+                PostOutbox.enqueue(post)
 
-                flash('Post posted successfully!', 'success')
+                flash('Post queued for publishing.', 'success')
                 return redirect(url_for('posts.index'))
 
-            except tweepy.TweepyException as e:
-                current_app.logger.error(f"Twitter API error: {str(e)}")
-                flash(f'Error posting post: {str(e)}', 'error')
-                return render_template('posts/compose.html',
-                                      text=text,
-                                      premium=is_premium_user,
-                                      char_limit=char_limit)
             except Exception as e:
+                db.session.rollback()
                 current_app.logger.error(f"Unexpected error: {str(e)}")
                 flash('An unexpected error occurred.', 'error')
                 return render_template('posts/compose.html',
@@ -154,11 +180,41 @@ def compose():
     is_premium_user = current_user.is_verified or current_user.verified_type in ['Business', 'Government', 'Blue']
     char_limit = 4000 if is_premium_user else 280
 
+    # Posts still on their way out, so the composer can watch them publish
+    pending_posts = Post.query.filter(
+        Post.user_id == current_user.id,
+        Post.status.in_(['queued', 'dispatching'])
+    ).order_by(Post.created_at.desc()).limit(5).all()
+
     return render_template('posts/compose.html',
                           quota=quota_status,
                           text='',
                           premium=is_premium_user,
-                          char_limit=char_limit)
+                          char_limit=char_limit,
+                          pending_posts=pending_posts,
+                          idempotency_key=uuid.uuid4().hex)
+
+@posts_bp.route('/status')
+@login_required
+def status():
+    """Return the publishing status of the current user's posts as JSON."""
+    ids = [int(post_id) for post_id in request.args.get('ids', '').split(',') if post_id.isdigit()]
+    if not ids:
+        return jsonify({"posts": {}})
+
+    posts = Post.query.filter(
+        Post.user_id == current_user.id,
+        Post.id.in_(ids[:100])
+    ).all()
+
+    return jsonify({"posts": {
+        str(post.id): {
+            "status": post.status,
+            "twitter_id": post.twitter_id,
+            "url": f"https://twitter.com/user/status/{post.twitter_id}" if post.twitter_id else None
+        }
+        for post in posts
+    }})
 
 @posts_bp.route('/<int:post_id>/delete', methods=['POST'])
 @login_required
@@ -175,16 +231,31 @@ def delete(post_id):
         # If the post has been posted to Twitter, delete it there too
         if post.status == 'posted' and post.twitter_id:
             try:
-                # Use v2 Client instead of v1.1 API
-                client = tweepy.Client(
-                    consumer_key=current_user.consumer_key,
-                    consumer_secret=current_user.consumer_secret,
-                    access_token=current_user.access_token,
-                    access_token_secret=current_user.access_token_secret
+                # Use the user's pooled v2 Client instead of v1.1 API
+                client = ClientRegistry.get_client(
+                    current_user.consumer_key,
+                    current_user.consumer_secret,
+                    current_user.access_token,
+                    current_user.access_token_secret
                 )
 
-                # Use delete_post method from v2 API
-                client.delete_tweet(post.twitter_id)
+                # Fail locally rather than spend a call on a certain 429
+                RateLimitRegistry.acquire(
+                    current_user.consumer_key,
+                    current_user.access_token,
+                    RateLimitRegistry.DELETE_TWEET
+                )
+
+                def delete_tweet():
+                    try:
+                        # Use delete_post method from v2 API
+                        client.delete_tweet(post.twitter_id)
+                    except tweepy.NotFound:
+                        # Already gone, e.g. an earlier attempt went through
+                        pass
+
+                # Deleting twice is harmless, so uncertain attempts can simply be retried
+                ApiRetry.call(delete_tweet, idempotent=True, description=f"Deleting post {post.id}")
 
                 # Track API usage (deletion counts as an API call)
                 QuotaTracker.track_api_call(current_user, "post")
@@ -193,12 +264,17 @@ def delete(post_id):
                 flash(f'Warning: Post deleted from database but could not be removed from X: {str(twitter_error)}', 'warning')
                 # Continue to delete from our database even if Twitter API fails
 
-        # Delete from our database
+        # Delete from our database; the instance is detached afterwards
+        was_scheduled = post.status == 'scheduled'
         db.session.delete(post)
         db.session.commit()
 
+        if was_scheduled:
+            ScheduledPostTimer.notify_removed(post_id)
+
         flash('Post deleted successfully.', 'success')
     except Exception as e:
+        db.session.rollback()
         flash('An unexpected error occurred.', 'error')
         current_app.logger.error(f"Unexpected error: {str(e)}")
 
@@ -207,12 +283,66 @@ def delete(post_id):
 @posts_bp.route('/scheduled')
 @login_required
 def scheduled():
-    """List scheduled posts."""
-    scheduled_posts = Post.query.filter_by(
-        user_id=current_user.id,
-        status='scheduled'
-    ).order_by(Post.scheduled_at.asc()).all()
+    """List scheduled posts, soonest first, one page at a time."""
+    try:
+        scheduled_posts, next_cursor = KeysetPagination.paginate(
+            Post.query.filter_by(user_id=current_user.id, status='scheduled'),
+            Post.scheduled_at,
+            Post.id,
+            cursor=request.args.get('cursor')
+        )
+    except ValueError:
+        abort(400)
+    next_url = url_for('posts.scheduled', cursor=next_cursor) if next_cursor else None
+
+    # "Load more" requests only need the next batch of cards
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({"html": render_template('posts/_scheduled_list.html', posts=scheduled_posts),
+                        "next_url": next_url})
 
     # Get quota information for the user
     quota_status = QuotaTracker.get_quota_status(current_user)
-    return render_template('posts/scheduled.html', posts=scheduled_posts, quota=quota_status)
+    return render_template('posts/scheduled.html', posts=scheduled_posts, quota=quota_status, next_url=next_url)
+
+@posts_bp.route('/search')
+@login_required
+def search():
+    """Search the user's posts or stream results by keyword, best match first."""
+    query = request.args.get('q', '').strip()
+    source = request.args.get('source', 'posts')
+    if source not in ('posts', 'streams'):
+        abort(400)
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        abort(400)
+
+    results, has_next = [], False
+    if query:
+        if source == 'posts':
+            results, has_next = FullTextSearch.search_posts(current_user.id, query, page=page)
+        else:
+            results, has_next = FullTextSearch.search_stream_results(current_user.id, query, page=page)
+    next_url = url_for('posts.search', q=query, source=source, page=page + 1) if has_next else None
+
+    # "Load more" requests only need the next batch of results
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({"html": render_template('posts/_search_results.html', results=results, source=source),
+                        "next_url": next_url})
+
+    return render_template('posts/search.html', query=query, source=source, results=results, next_url=next_url)
+
+@posts_bp.route('/export')
+@login_required
+def export():
+    """Download the user's post history as CSV or JSON lines, resumable with since_id."""
+    fmt = request.args.get('format', 'csv')
+    since_id = request.args.get('since_id', 0, type=int)
+    if fmt not in DataExport.FORMATS or since_id < 0:
+        abort(400)
+
+    return DataExport.response(
+        DataExport.posts(current_user.id, since_id),
+        DataExport.POST_COLUMNS,
+        fmt,
+        f"posts-{current_user.username}"
+    )
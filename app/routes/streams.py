@@ -0,0 +1,63 @@
+from flask import Blueprint, request, current_app, jsonify, abort
+from flask_login import login_required, current_user
+
+from app.models import db, Stream
+from utils.data_export import DataExport
+from utils.rule_backtest import RuleBacktest
+from utils.rule_matcher import RuleSyntaxError
+
+streams_bp = Blueprint('streams', __name__, url_prefix='/streams')
+
+@streams_bp.route('/backtest', methods=['POST'])
+@login_required
+def backtest():
+    """
+    Run candidate filter rules over the current user's stored stream results.
+
+    Exempt from CSRF tokens, so only JSON bodies are accepted: a cross-site
+    form cannot send one without a CORS preflight.
+    """
+    if not request.is_json:
+        return jsonify({"error": "expected a JSON body"}), 415
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "body must be a JSON object"}), 400
+    rules = payload.get('rules')
+    if isinstance(rules, str):
+        rules = rules.splitlines()
+    if not isinstance(rules, list) or not all(isinstance(rule, str) for rule in rules):
+        return jsonify({"error": "rules must be a list of strings"}), 400
+
+    try:
+        days = int(payload['days']) if payload.get('days') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "days must be a whole number"}), 400
+
+    try:
+        return jsonify(RuleBacktest.run(rules, user_id=current_user.id, days=days))
+    except RuleSyntaxError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error backtesting rules for user {current_user.id}: {str(e)}")
+        return jsonify({"error": "Backtest failed"}), 500
+
+@streams_bp.route('/<int:stream_id>/export')
+@login_required
+def export(stream_id):
+    """Download a stream's results, archived and live, as CSV or JSON lines, resumable with since_id."""
+    stream = db.session.get(Stream, stream_id)
+    if stream is None or stream.user_id != current_user.id:
+        abort(404)
+
+    fmt = request.args.get('format', 'csv')
+    since_id = request.args.get('since_id', 0, type=int)
+    if fmt not in DataExport.FORMATS or since_id < 0:
+        abort(400)
+
+    return DataExport.response(
+        DataExport.stream_results(stream.id, since_id),
+        DataExport.STREAM_RESULT_COLUMNS,
+        fmt,
+        f"stream-{stream.id}-results"
+    )
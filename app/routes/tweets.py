@@ -123,6 +123,7 @@ def compose():
                 post.status = 'posted'
                 post.posted_at = datetime.utcnow()
                 db.session.add(post)
+                QuotaTracker.record_post(current_user, post.posted_at)
 
                 # Track API usage
                 QuotaTracker.track_api_call(current_user, "post")
@@ -1,22 +1,24 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
-import tweepy
 from datetime import datetime
 import os
+from sqlalchemy import func
 
-from app.models import db, User
+from app.models import db, User, Post
 from utils.twitter_auth import TwitterOAuth
 from utils.quota_tracker import QuotaTracker
+from utils.rate_limit import RateLimitRegistry
+from utils.profile_cache import ProfileCache
 
 users_bp = Blueprint('users', __name__, url_prefix='/users')
 
 @users_bp.route('/profile')
 @login_required
 def profile():
-    """Display the current user's profile with updated statistics from Twitter."""
+    """Display the current user's profile with statistics from Twitter."""
     try:
-        # Track this API call for quota
-        quota_info = QuotaTracker.track_api_call(current_user.id, "profile")
+        # Cached snapshot; the profile fetch itself is counted when it happens
+        quota_info = QuotaTracker.get_quota_status(current_user)
 
         # We can access our own user information in the free tier
         # Initialize with bearer token
@@ -26,7 +28,7 @@ def profile():
         profile_data = {
             'following_count': 0,
             'followers_count': 0,
-            'post_count': len(current_user.posts) if current_user.posts else 0,
+            'post_count': db.session.query(func.count(Post.id)).filter(Post.user_id == current_user.id).scalar(),
             'created_at': current_user.last_login or datetime.utcnow(),
             'description': f"Profile for @{current_user.username}",
             'username': current_user.username,
@@ -39,72 +41,18 @@ def profile():
             flash("Missing API credentials. Check your .env file.", "error")
             return render_template('users/profile.html',
                                   profile_data=profile_data,
-                                  quota_info=quota_info)
-
-        try:
-            # Try to get updated data from Twitter
-            import tweepy
-            client = tweepy.Client(bearer_token=bearer_token)
-
-            # This will fetch user data from Twitter, which should work in the free tier
-            current_app.logger.debug(f"Attempting to fetch user data for {current_user.username}")
-
-            # Following tweepy's client.get_user documentation format
-            user_data = client.get_user(
-                username=current_user.username,
-                user_fields=["description", "created_at", "profile_image_url", "public_metrics", "verified", "verified_type"]
-            )
-
-            # Log the response structure to debug
-            current_app.logger.debug(f"User data response: {user_data}")
-
-            # If we successfully got data, update our profile_data
-            # Handle the tweepy Response object properly
-            if user_data:
-                # Use getattr to safely access the data attribute
-                user_data_dict = getattr(user_data, 'data', None)
-                if user_data_dict:
-                    user = user_data_dict
-                    current_app.logger.info(f"Successfully fetched profile data for {current_user.username}")
-
-                    # Try to extract metrics if they exist
-                    try:
-                        metrics = {}
-                        if hasattr(user, 'public_metrics'):
-                            metrics = user.public_metrics
-
-                        # Save verification status to the user model
-                        if hasattr(user, 'verified'):
-                            current_user.is_verified = user.verified
-
-                        # Save verification type to the user model
-                        if hasattr(user, 'verified_type'):
-                            current_user.verified_type = user.verified_type
-
-                        # Update profile data with real metrics from Twitter
-                        profile_data.update({
-                            'following_count': metrics.get('following_count', 0),
-                            'followers_count': metrics.get('followers_count', 0),
-                            'post_count': metrics.get('post_count', 0),
-                            'created_at': getattr(user, 'created_at', profile_data['created_at']),
-                            'description': getattr(user, 'description', profile_data['description']),
-                            'verified': getattr(user, 'verified', False),
-                            'verified_type': getattr(user, 'verified_type', None)
-                        })
-
-                        # Save changes to user model
-                        db.session.commit()
-
-                    except Exception as metrics_error:
-                        current_app.logger.error(f"Error extracting metrics: {metrics_error}")
-
-        except Exception as api_error:
-            current_app.logger.error(f"Error fetching profile from Twitter API: {str(api_error)}")
-            # We'll just use the database profile data initialized above
+                                  quota_info=quota_info,
+                                  rate_limits=RateLimitRegistry.get_budget(current_user.consumer_key, current_user.access_token))
+
+        # Last known 𝕏 data, refreshed in the background once it is stale
+        twitter_data = ProfileCache.get(current_user, bearer_token)
+        if twitter_data:
+            profile_data.update({key: value for key, value in twitter_data.items() if value is not None})
 
         return render_template('users/profile.html',
                               profile_data=profile_data,
-                              quota_info=quota_info)
+                              quota_info=quota_info,
+                              rate_limits=RateLimitRegistry.get_budget(current_user.consumer_key, current_user.access_token))
 
     except Exception as e:
         current_app.logger.error(f"Error preparing profile data: {str(e)}")
@@ -0,0 +1,44 @@
+"""
+Shared pytest fixtures: an app on a fresh SQLite database with two users.
+
+Modules pass extra config by overriding the `app_config` fixture, and add
+their own rows by overriding `app` (requesting this one).
+"""
+import pytest
+
+from app import create_app
+from app.models import db, User
+from utils.quota_engine import QuotaEngine
+
+
+@pytest.fixture
+def app_config():
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, app_config):
+    # create_app() configures the class-level quota limits; keep them out of other tests
+    monkeypatch.setattr(QuotaEngine, 'LIMITS', dict(QuotaEngine.LIMITS))
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+        **app_config,
+    })
+    with app.app_context():
+        db.create_all()
+        for i, name in ((1, 'alice'), (2, 'bob')):
+            db.session.add(User(id=i, twitter_id=str(i), username=name, name=name.title(), consumer_key='ck',
+                                consumer_secret='cs', access_token=f'at{i}', access_token_secret='ats'))
+        db.session.commit()
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as user 1."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
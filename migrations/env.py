@@ -51,6 +51,20 @@ def get_metadata():
     return target_db.metadata
 
 
+# Full-text search tables are created by raw SQL (see utils/full_text_search.py)
+# and have no models; keep autogenerate from dropping them
+FTS_TABLES = ('posts_fts', 'stream_results_fts')
+FTS_SHADOW_SUFFIXES = ('', '_data', '_idx', '_docsize', '_config', '_content')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'table' and name in {
+        table + suffix for table in FTS_TABLES for suffix in FTS_SHADOW_SUFFIXES
+    }:
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +79,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +108,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
@@ -0,0 +1,59 @@
+"""Add FTS5 full-text search over posts and stream results
+
+Revision ID: a6c3e8f1b947
+Revises: f4b1d6c8a352
+Create Date: 2025-04-08 09:41:27.319604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c3e8f1b947'
+down_revision = 'f4b1d6c8a352'
+branch_labels = None
+depends_on = None
+
+# (FTS table, source table, indexed column)
+INDEXES = [
+    ('posts_fts', 'posts', 'text'),
+    ('stream_results_fts', 'stream_results', 'post_text'),
+]
+
+
+def upgrade():
+    # FTS5 is SQLite only; other databases fall back to LIKE searches
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for fts_table, source_table, column in INDEXES:
+        op.execute(
+            f"CREATE VIRTUAL TABLE {fts_table} USING fts5("
+            f"{column}, content='{source_table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            f"CREATE TRIGGER {fts_table}_ai AFTER INSERT ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER {fts_table}_ad AFTER DELETE ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER {fts_table}_au AFTER UPDATE OF {column} ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+            f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END"
+        )
+        # Index existing rows; large tables can use `flask rebuild-search-index` instead
+        op.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for fts_table, source_table, column in reversed(INDEXES):
+        for suffix in ('au', 'ad', 'ai'):
+            op.execute(f"DROP TRIGGER IF EXISTS {fts_table}_{suffix}")
+        op.execute(f"DROP TABLE IF EXISTS {fts_table}")
@@ -60,6 +60,12 @@ document.addEventListener('DOMContentLoaded', function() {
     // Add smooth scrolling for anchor links
     setupSmoothScrolling();
 
+    // Poll the status of posts that are still being published
+    setupPostStatusPolling();
+
+    // Load further pages of long post lists
+    setupLoadMore();
+
     // Add dark mode toggle (if needed)
     // setupDarkModeToggle();
 });
@@ -195,3 +201,102 @@ function setupSmoothScrolling() {
         });
     });
 }
+
+/**
+ * Poll the status of queued posts until they are published or fail
+ */
+function setupPostStatusPolling() {
+    const container = document.querySelector('[data-status-url]');
+    if (!container) return;
+
+    const pendingStatuses = ['queued', 'dispatching'];
+    const statusUrl = container.dataset.statusUrl;
+
+    function pendingItems() {
+        return Array.from(container.querySelectorAll('[data-post-id]'))
+            .filter(item => pendingStatuses.includes(item.dataset.status));
+    }
+
+    function updateItem(item, post) {
+        item.dataset.status = post.status;
+
+        const badge = item.querySelector('.post-status');
+        if (badge) {
+            badge.className = 'post-status ' + post.status;
+            badge.textContent = post.status;
+        }
+
+        const metrics = item.querySelector('.post-metrics');
+        if (post.status === 'posted' && post.url && metrics && !metrics.querySelector('.post-link')) {
+            const link = document.createElement('a');
+            link.href = post.url;
+            link.target = '_blank';
+            link.className = 'post-link';
+            link.textContent = 'View on 𝕏';
+            metrics.appendChild(link);
+        }
+    }
+
+    function poll() {
+        const items = pendingItems();
+        if (items.length === 0) return;
+
+        const ids = items.map(item => item.dataset.postId).join(',');
+        fetch(statusUrl + '?ids=' + ids, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(data => {
+                items.forEach(item => {
+                    const post = data.posts[item.dataset.postId];
+                    if (post) updateItem(item, post);
+                });
+            })
+            .catch(() => {})
+            .finally(() => setTimeout(poll, 2000));
+    }
+
+    poll();
+}
+
+/**
+ * Append the next page of a paginated list, on click or when scrolled into view
+ */
+function setupLoadMore() {
+    document.querySelectorAll('.load-more').forEach(button => {
+        const target = document.querySelector(button.dataset.target);
+        if (!target) return;
+
+        let loading = false;
+
+        function loadMore() {
+            if (loading || !button.dataset.nextUrl) return;
+            loading = true;
+            button.disabled = true;
+
+            fetch(button.dataset.nextUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+                .then(response => response.json())
+                .then(data => {
+                    target.insertAdjacentHTML('beforeend', data.html);
+                    if (data.next_url) {
+                        button.dataset.nextUrl = data.next_url;
+                    } else {
+                        button.remove();
+                    }
+                })
+                .catch(() => {})
+                .finally(() => {
+                    loading = false;
+                    button.disabled = false;
+                });
+        }
+
+        button.addEventListener('click', loadMore);
+
+        // Infinite scroll where supported; the button remains as a fallback
+        if ('IntersectionObserver' in window) {
+            const observer = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) loadMore();
+            }, { rootMargin: '200px' });
+            observer.observe(button);
+        }
+    });
+}
@@ -0,0 +1,123 @@
+"""
+Checks that retried and re-claimed publish attempts never post twice.
+"""
+import time
+from datetime import datetime
+
+import pytest
+import requests
+import tweepy
+
+from utils.api_retry import ApiRetry
+from utils.client_registry import ClientRegistry
+from utils.post_dispatcher import PostDispatcher
+
+
+def http_error(cls, status_code, detail, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = 'Forbidden'
+    response.headers.update(headers or {})
+    return cls(response, response_json={'detail': detail})
+
+
+class FakeClient:
+    """Stands in for tweepy.Client: each call pops the next outcome (an exception or a value)."""
+
+    def __init__(self, creates, timeline=None):
+        self.creates = list(creates)
+        self.timeline = timeline
+        self.create_calls = 0
+
+    def create_tweet(self, text):
+        self.create_calls += 1
+        outcome = self.creates.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return tweepy.Response(data={'id': outcome, 'text': text}, includes={}, errors=[], meta={})
+
+    def get_users_tweets(self, author_id, **kwargs):
+        if isinstance(self.timeline, Exception):
+            raise self.timeline
+        return tweepy.Response(data=self.timeline, includes={}, errors=[], meta={})
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(ApiRetry, 'BASE_DELAY', 0)
+
+
+def publish(monkeypatch, client, reconcile_first=False):
+    monkeypatch.setattr(ClientRegistry, 'get_client', staticmethod(lambda *credentials: client))
+    return PostDispatcher.publish(('ck', 'cs', 'at', 'ats'), 'hello', author_id='1',
+                                  since=datetime(2025, 1, 1), reconcile_first=reconcile_first)
+
+
+def test_transient_error_is_retried(monkeypatch):
+    client = FakeClient([tweepy.TwitterServerError(requests.Response()), '10'], timeline=[])
+    assert publish(monkeypatch, client) == '10'
+    assert client.create_calls == 2
+
+
+def test_timeout_that_went_through_is_not_retried(monkeypatch):
+    client = FakeClient([requests.Timeout()], timeline=[tweepy.Tweet({'id': '10', 'text': 'hello', 'edit_history_tweet_ids': ['10']})])
+    assert publish(monkeypatch, client) == '10'
+    assert client.create_calls == 1
+
+
+def test_reclaimed_post_found_in_timeline(monkeypatch):
+    client = FakeClient([], timeline=[tweepy.Tweet({'id': '10', 'text': 'hello', 'edit_history_tweet_ids': ['10']})])
+    assert publish(monkeypatch, client, reconcile_first=True) == '10'
+    assert client.create_calls == 0
+
+
+def test_reclaimed_post_without_timeline_access(monkeypatch):
+    # Free tier: the timeline lookup is forbidden, 𝕏 rejects the repeat as a duplicate
+    client = FakeClient([http_error(tweepy.Forbidden, 403, 'You are not allowed to create a Tweet with duplicate content.')],
+                        timeline=http_error(tweepy.Forbidden, 403, 'Unsupported Authentication'))
+    assert publish(monkeypatch, client, reconcile_first=True) is None
+    assert client.create_calls == 1
+
+
+def test_reclaimed_post_that_was_never_published(monkeypatch):
+    client = FakeClient(['10'], timeline=http_error(tweepy.Forbidden, 403, 'Unsupported Authentication'))
+    assert publish(monkeypatch, client, reconcile_first=True) == '10'
+
+
+def test_timeout_then_duplicate_without_timeline_access(monkeypatch):
+    client = FakeClient([requests.Timeout(), http_error(tweepy.Forbidden, 403, 'duplicate content')],
+                        timeline=http_error(tweepy.Forbidden, 403, 'Unsupported Authentication'))
+    assert publish(monkeypatch, client) is None
+    assert client.create_calls == 2
+
+
+def test_duplicate_of_an_unrelated_post_still_fails(monkeypatch):
+    client = FakeClient([http_error(tweepy.Forbidden, 403, 'duplicate content')], timeline=[])
+    with pytest.raises(tweepy.Forbidden):
+        publish(monkeypatch, client)
+
+
+def rate_limited(reset_in):
+    reset = str(int(time.time() + reset_in))
+    return http_error(tweepy.TooManyRequests, 429, 'Too Many Requests', headers={'x-rate-limit-reset': reset})
+
+
+def test_429_waits_for_the_reset_header(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+    client = FakeClient([rate_limited(2), '10'])
+
+    assert publish(monkeypatch, client) == '10'
+    assert client.create_calls == 2
+    assert 1 <= sleeps[0] <= 4
+
+
+def test_429_resetting_too_late_is_not_retried(monkeypatch):
+    error = rate_limited(ApiRetry.MAX_DELAY + 60)
+    assert ApiRetry.get_delay(error, 0) is None
+    assert ApiRetry.MAX_DELAY + 50 <= PostDispatcher.get_retry_after(error) <= ApiRetry.MAX_DELAY + 61
+
+    client = FakeClient([error])
+    with pytest.raises(tweepy.TooManyRequests):
+        publish(monkeypatch, client)
+    assert client.create_calls == 1
@@ -0,0 +1,110 @@
+"""
+Checks that the overdue backlog is drained fairly, at the catch-up rate, by
+one process at a time, while posts falling due meanwhile still go out.
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, DispatchLock, Post
+from utils.backlog_catch_up import BacklogCatchUp
+from utils.post_dispatcher import PostDispatcher
+
+
+@pytest.fixture
+def app_config():
+    return {'POST_CATCH_UP_RATE': 1000, 'POST_CATCH_UP_BURST': 1000}
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """Replace the 𝕏 call; records the text of every post published."""
+    texts = []
+
+    def publish(credentials, text, **kwargs):
+        texts.append(text)
+        return str(len(texts))
+
+    monkeypatch.setattr(PostDispatcher, 'publish', staticmethod(publish))
+    return texts
+
+
+def add_post(user_id, text, minutes_ago):
+    post = Post(user_id=user_id, text=text, status='scheduled',
+                scheduled_at=datetime.utcnow() - timedelta(minutes=minutes_ago))
+    db.session.add(post)
+    db.session.commit()
+    return post.id
+
+
+def hold_lock(owner, cutoff, expires_in=60):
+    """Take the catch-up lock the way a run in another process would."""
+    db.session.add(DispatchLock(name=BacklogCatchUp.LOCK_NAME, owner=owner, cutoff=cutoff,
+                                expires_at=datetime.utcnow() + timedelta(seconds=expires_in)))
+    db.session.commit()
+
+
+def test_backlog_is_drained_round_robin_and_stale_posts_expire(app, published):
+    add_post(1, 'a1', 30)
+    add_post(1, 'a2', 20)
+    add_post(1, 'a3', 10)
+    add_post(2, 'b1', 25)
+    stale = add_post(2, 'too old', 2 * 24 * 60)
+
+    progress = PostDispatcher(app).catch_up()
+
+    assert published == ['a1', 'b1', 'a2', 'a3']
+    assert (progress['posted'], progress['expired'], progress['remaining']) == (4, 1, 0)
+    assert db.session.get(Post, stale).status == 'expired'
+    assert DispatchLock.query.count() == 0  # Released
+
+
+def test_catch_up_runs_at_the_configured_rate(app, published):
+    for i in range(5):
+        add_post(1 + i % 2, f'post {i}', 10 - i)
+    dispatcher = PostDispatcher(app)
+
+    started = time.monotonic()
+    BacklogCatchUp(dispatcher, rate=20, burst=1).run()
+    # The first post uses the burst; the other four wait 1/20s each
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+    assert len(published) == 5
+
+
+def test_only_one_process_catches_up(app, published):
+    add_post(1, 'overdue', 10)
+    hold_lock('other-process', cutoff=datetime.utcnow())
+
+    progress = PostDispatcher(app).catch_up()
+    assert published == [] and progress['drained'] == 0
+
+    # Once the other run stops renewing its lock, it can be taken over
+    DispatchLock.query.update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    PostDispatcher(app).catch_up()
+    assert published == ['overdue']
+
+
+def test_sweep_publishes_posts_due_after_the_backlog(app, published):
+    add_post(1, 'backlog', 10)
+    hold_lock('other-process', cutoff=datetime.utcnow() - timedelta(minutes=5))
+    add_post(2, 'due since', 1)
+
+    PostDispatcher(app).sweep()
+    assert published == ['due since']
+
+    # Once the run is over, sweeps drain everything again
+    DispatchLock.query.delete()
+    db.session.commit()
+    PostDispatcher(app).sweep()
+    assert published == ['due since', 'backlog']
+
+
+def test_sweep_before_the_local_run_takes_its_lock(app, published):
+    add_post(1, 'backlog', 10)
+    dispatcher = PostDispatcher(app)
+    dispatcher.catch_up_cutoff = datetime.utcnow()  # As set by start() before the catch-up job runs
+
+    dispatcher.sweep()
+    assert published == []
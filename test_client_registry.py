@@ -0,0 +1,124 @@
+"""
+Checks ClientRegistry's pooled clients: reuse, LRU and idle eviction, request
+timeouts, and that evicted clients are not closed under a thread still using
+them.
+"""
+import threading
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.client_registry import ClientRegistry
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    ClientRegistry.clear()
+    yield ClientRegistry
+    ClientRegistry.clear()
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Replace the network: records the timeout of every request sent."""
+    timeouts = []
+
+    def send(adapter, request, timeout=None, **kwargs):
+        timeouts.append(timeout)
+        response = requests.Response()
+        response.status_code = 200
+        response.request = request
+        return response
+
+    monkeypatch.setattr(HTTPAdapter, 'send', send)
+    return timeouts
+
+
+def test_requests_get_a_default_timeout(sent):
+    client = ClientRegistry.get_client('ck', 'cs', 'at', 'ats')
+    client.session.get('https://api.twitter.com/2/users/me')
+    client.session.get('https://api.twitter.com/2/users/me', timeout=3)
+
+    assert sent == [(ClientRegistry.CONNECT_TIMEOUT, ClientRegistry.READ_TIMEOUT), 3]
+    assert ClientRegistry.get_api('ck', 'cs', 'at', 'ats').timeout == (
+        ClientRegistry.CONNECT_TIMEOUT, ClientRegistry.READ_TIMEOUT
+    )
+
+
+def test_evicted_client_is_closed_once_its_request_finishes(monkeypatch):
+    started, finish = threading.Event(), threading.Event()
+    closed = []
+
+    def send(adapter, request, **kwargs):
+        started.set()
+        finish.wait(5)
+        response = requests.Response()
+        response.status_code = 200
+        response.request = request
+        return response
+
+    monkeypatch.setattr(HTTPAdapter, 'send', send)
+    monkeypatch.setattr(HTTPAdapter, 'close', lambda adapter: closed.append(adapter))
+
+    client = ClientRegistry.get_client('ck', 'cs', 'at', 'ats')
+    request = threading.Thread(target=client.session.get, args=('https://api.twitter.com/2/users/me',))
+    request.start()
+    assert started.wait(5)
+
+    ClientRegistry.invalidate('ck', 'at')  # Evicted while the request is in flight
+    assert closed == []
+
+    finish.set()
+    request.join(5)
+    assert closed == [client.session.get_adapter('https://')]
+
+
+def test_idle_evicted_client_is_closed_at_once(monkeypatch):
+    closed = []
+    monkeypatch.setattr(HTTPAdapter, 'close', lambda adapter: closed.append(adapter))
+
+    client = ClientRegistry.get_client('ck', 'cs', 'at', 'ats')
+    ClientRegistry.invalidate('ck', 'at')
+    assert closed == [client.session.get_adapter('https://')]
+
+
+def get(access_token, secret='ats'):
+    return ClientRegistry.get_client('ck', 'cs', access_token, secret)
+
+
+def test_client_is_reused_until_its_secret_changes():
+    client = get('at1')
+    assert get('at1') is client
+    assert get('at1', secret='rotated') is not client
+
+
+def test_least_recently_used_client_is_evicted(monkeypatch):
+    monkeypatch.setattr(ClientRegistry, 'MAX_SIZE', 2)
+    first, second = get('at1'), get('at2')
+    get('at1')  # Now the most recently used
+
+    get('at3')
+    assert get('at1') is first
+    assert get('at2') is not second
+
+
+def test_idle_client_is_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('utils.client_registry.time.monotonic', lambda: now[0])
+    idle = get('at1')
+
+    now[0] += ClientRegistry.IDLE_TTL + 1
+    get('at2')
+    assert get('at1') is not idle
+
+
+def test_invalidate_drops_every_client_of_the_tokens():
+    client = get('at1')
+    api = ClientRegistry.get_api('ck', 'cs', 'at1', 'ats')
+    other = get('at2')
+
+    ClientRegistry.invalidate('ck', 'at1')
+    assert get('at1') is not client
+    assert ClientRegistry.get_api('ck', 'cs', 'at1', 'ats') is not api
+    assert get('at2') is other
@@ -0,0 +1,66 @@
+"""
+Checks the dashboard's post counts, which come from one grouped query
+instead of loading every post.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import template_rendered
+from sqlalchemy import event
+
+from app.models import db, Post
+
+
+@pytest.fixture
+def app(app):
+    start = datetime(2026, 1, 1)
+    statuses = ['posted'] * 4 + ['scheduled'] * 3 + ['draft', 'failed']
+    for i, status in enumerate(statuses):
+        db.session.add(Post(user_id=1, text=f'post {i}', status=status, created_at=start + timedelta(minutes=i)))
+    db.session.add(Post(user_id=2, text='theirs', status='scheduled', created_at=start + timedelta(days=1)))
+    db.session.commit()
+    return app
+
+
+@pytest.fixture
+def rendered(app):
+    """Context of every template rendered."""
+    contexts = []
+
+    def record(sender, template, context, **extra):
+        contexts.append(context)
+
+    template_rendered.connect(record, app)
+    yield contexts
+    template_rendered.disconnect(record, app)
+
+
+def test_counts_and_recent_posts(client, rendered):
+    assert client.get('/dashboard').status_code == 200
+
+    context = rendered[0]
+    assert (context['post_count'], context['scheduled_count']) == (9, 3)
+    assert [post.text for post in context['recent_posts']] == ['post 8', 'post 7', 'post 6', 'post 5', 'post 4']
+
+
+def test_queries_do_not_grow_with_the_number_of_posts(app, client):
+    def post_queries():
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if 'FROM posts' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            client.get('/dashboard')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return statements
+
+    before = post_queries()
+    for i in range(50):
+        db.session.add(Post(user_id=1, text=f'more {i}', status='posted'))
+    db.session.commit()
+
+    assert len(post_queries()) == len(before) == 2
@@ -0,0 +1,84 @@
+"""
+Checks that the FTS5 triggers keep the search index in step with every kind
+of write, and that user input cannot break a search.
+"""
+import pytest
+from sqlalchemy import text
+
+from app.models import db, Post, Stream, StreamResult
+from utils.full_text_search import FullTextSearch
+
+
+@pytest.fixture
+def app(app):
+    FullTextSearch.rebuild()  # create_all() does not create the FTS tables and triggers
+    return app
+
+
+def add_post(text_, user_id=1):
+    post = Post(user_id=user_id, text=text_, status='posted')
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def found(query, user_id=1):
+    return [post.text for post, _ in FullTextSearch.search_posts(user_id, query)[0]]
+
+
+def test_insert_update_and_delete_are_indexed(app):
+    post = add_post('Launching our new café today')
+    assert found('cafe') == ['Launching our new café today']  # Diacritics are folded
+
+    post.text = 'Launch postponed'
+    db.session.commit()
+    assert found('cafe') == []
+    assert found('postponed') == ['Launch postponed']
+
+    db.session.delete(post)
+    db.session.commit()
+    assert found('postponed') == []
+
+
+def test_raw_sql_writes_are_indexed(app):
+    db.session.execute(text(
+        "INSERT INTO posts (user_id, text, status, publish_attempts) VALUES (1, 'written by a script', 'draft', 0)"
+    ))
+    db.session.commit()
+    assert found('script') == ['written by a script']
+
+
+def test_results_are_limited_to_the_owner(app):
+    add_post('shared word', user_id=1)
+    add_post('shared word', user_id=2)
+    assert len(found('shared')) == 1
+
+    db.session.add(Stream(id=1, user_id=2, name='s', rules=['shared']))
+    db.session.add(StreamResult(stream_id=1, post_id='9', post_text='shared result', author_id='3'))
+    db.session.commit()
+    assert FullTextSearch.search_stream_results(1, 'shared')[0] == []
+    (result, snippet), = FullTextSearch.search_stream_results(2, 'shared')[0]
+    assert str(snippet) == '<mark>shared</mark> result'
+
+
+@pytest.mark.parametrize('query', ['"unbalanced', 'NOT', 'a AND OR', 'col:on', '-minus', '***'])
+def test_user_input_never_breaks_the_match_syntax(app, query):
+    add_post('plain text')
+    FullTextSearch.search_posts(1, query)
+
+
+def test_prefix_search_and_snippet_escaping(app):
+    add_post('<b>Scheduling</b> made simple')
+    (post, snippet), = FullTextSearch.search_posts(1, 'sched*')[0]
+    assert str(snippet) == '&lt;b&gt;<mark>Scheduling</mark>&lt;/b&gt; made simple'
+
+
+def test_rebuild_reindexes_every_row(app):
+    for i in range(5):
+        add_post(f'backfill {i}')
+    db.session.execute(text("INSERT INTO posts_fts(posts_fts) VALUES ('delete-all')"))
+    db.session.commit()
+    assert found('backfill') == []
+
+    assert FullTextSearch.rebuild(kinds=['posts']) == {'posts': 5}
+    assert len(found('backfill')) == 5
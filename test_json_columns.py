@@ -0,0 +1,84 @@
+"""
+Checks that JSON-backed columns are decoded once per load, track in-place
+changes, and are only written back when their value changed.
+"""
+import pytest
+from sqlalchemy import event, text
+
+from app.models import db, Post, Stream, StreamResult
+
+
+@pytest.fixture
+def app(app):
+    db.session.add(Stream(id=1, user_id=1, name='news', rules=[{'value': 'news'}]))
+    db.session.add(StreamResult(id=1, stream_id=1, post_id='100', post_text='news', author_id='9', data={'n': 1}))
+    db.session.add(Post(id=1, user_id=1, text='hello', status='draft'))
+    db.session.commit()
+    return app
+
+
+@pytest.fixture
+def updates(app):
+    """Every UPDATE statement run."""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith('UPDATE'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def reload(model, ident):
+    db.session.expire_all()
+    return db.session.get(model, ident)
+
+
+def test_value_is_decoded_once_per_load(app):
+    stream = reload(Stream, 1)
+    assert stream.rules_list is stream.rules_list
+    assert stream.rules_list == [{'value': 'news'}]
+
+
+def test_in_place_changes_are_saved(app):
+    db.session.expire_all()
+    stream, result = db.session.get(Stream, 1), db.session.get(StreamResult, 1)
+    stream.rules_list.append({'value': 'sport'})
+    result.extra_data['n'] = 2
+    db.session.commit()
+
+    assert reload(Stream, 1).rules_list == [{'value': 'news'}, {'value': 'sport'}]
+    assert reload(StreamResult, 1).extra_data == {'n': 2}
+
+
+def test_setting_an_equal_value_writes_nothing(app, updates):
+    db.session.expire_all()
+    stream, result, post = db.session.get(Stream, 1), db.session.get(StreamResult, 1), db.session.get(Post, 1)
+    stream.rules_list = [{'value': 'news'}]
+    result.extra_data = {'n': 1}
+    post.media = []
+    db.session.commit()
+
+    assert updates == []
+
+
+def test_empty_media_is_stored_as_null(app):
+    post = reload(Post, 1)
+    post.media = ['a.png']
+    db.session.commit()
+    assert reload(Post, 1).media == ['a.png']
+
+    reload(Post, 1).media = []
+    db.session.commit()
+    assert db.session.execute(text('SELECT media_attachments FROM posts WHERE id = 1')).scalar() is None
+    assert reload(Post, 1).media == []
+
+
+def test_rows_written_as_json_text_still_load(app):
+    # As the text columns stored them before they became JSON columns
+    db.session.execute(text("""UPDATE streams SET rules = '[{"value": "old"}]' WHERE id = 1"""))
+    db.session.commit()
+
+    assert reload(Stream, 1).rules_list == [{'value': 'old'}]
@@ -0,0 +1,77 @@
+"""
+Checks that keyset pagination visits every post exactly once, in order,
+even with equal sort values and posts added between pages.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, Post
+from utils.pagination import KeysetPagination
+
+
+@pytest.fixture
+def app(app):
+    start = datetime(2025, 1, 1)
+    # Pairs of posts share a created_at, so the id has to break ties
+    for i in range(25):
+        db.session.add(Post(user_id=1, text=f'post {i}', status='posted', created_at=start + timedelta(minutes=i // 2)))
+    db.session.commit()
+    return app
+
+
+def walk(per_page, descending=True, between_pages=None):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = KeysetPagination.paginate(
+            Post.query.filter_by(user_id=1), Post.created_at, Post.id,
+            cursor=cursor, per_page=per_page, descending=descending
+        )
+        pages.append([post.id for post in rows])
+        if cursor is None:
+            return pages
+        if between_pages:
+            between_pages()
+
+
+def newest_first():
+    return [post.id for post in Post.query.order_by(Post.created_at.desc(), Post.id.desc())]
+
+
+@pytest.mark.parametrize('per_page', [1, 2, 7, 25, 30])
+def test_pages_cover_every_post_once(app, per_page):
+    pages = walk(per_page)
+    assert [post_id for page in pages for post_id in page] == newest_first()
+    assert all(len(page) == per_page for page in pages[:-1])
+
+
+def test_ascending(app):
+    pages = walk(10, descending=False)
+    assert [post_id for page in pages for post_id in page] == newest_first()[::-1]
+
+
+def test_posts_added_between_pages_do_not_shift_pages(app):
+    expected = newest_first()
+
+    def publish():
+        db.session.add(Post(user_id=1, text='new', status='posted', created_at=datetime(2026, 1, 1)))
+        db.session.commit()
+
+    pages = walk(10, between_pages=publish)
+    assert [post_id for page in pages for post_id in page] == expected
+
+
+@pytest.mark.parametrize('cursor', ['garbage', 'WzFd', KeysetPagination.encode_cursor('not a date', 1)])
+def test_malformed_cursor(client, cursor):
+    with pytest.raises(ValueError):
+        KeysetPagination.decode_cursor(cursor)
+
+    assert client.get('/posts/', query_string={'cursor': cursor}).status_code == 400
+
+
+def test_load_more_returns_next_page(client):
+    first = client.get('/posts/', headers={'X-Requested-With': 'XMLHttpRequest'}).get_json()
+    assert first['html'].count('post 24') == 1
+    second = client.get(first['next_url'], headers={'X-Requested-With': 'XMLHttpRequest'}).get_json()
+    assert second['next_url'] is None
+    assert 'post 24' not in second['html'] and 'post 0' in second['html']
@@ -0,0 +1,116 @@
+"""
+Checks how PostDispatcher claims (under a lease), defers and publishes due posts.
+"""
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, Post, QuotaEvent
+from utils.post_dispatcher import PostDispatcher
+from utils.quota_engine import QuotaEngine
+from utils.quota_tracker import QuotaTracker
+
+
+@pytest.fixture
+def app_config():
+    return {'POST_DISPATCH_BATCH_SIZE': 2, 'QUOTA_USER_15M_LIMIT': 1}
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """Replace the 𝕏 call; records the text of every post published."""
+    texts = []
+
+    def publish(credentials, text, **kwargs):
+        texts.append(text)
+        return str(len(texts))
+
+    monkeypatch.setattr(PostDispatcher, 'publish', staticmethod(publish))
+    return texts
+
+
+def add_post(user_id, text, minutes_ago, status='scheduled'):
+    at = datetime.utcnow() - timedelta(minutes=minutes_ago)
+    post = Post(user_id=user_id, text=text, status=status, scheduled_at=at,
+                posted_at=at if status == 'posted' else None)
+    db.session.add(post)
+    if status == 'posted':
+        QuotaTracker.record_post(user_id, at)
+    db.session.commit()
+    return post.id
+
+
+def test_deferred_posts_do_not_starve_other_users(app, published):
+    add_post(1, 'already out', 5, status='posted')  # User 1 is at their 15-minute limit
+    deferred = [add_post(1, f'over limit {i}', 30 - i) for i in range(3)]  # Oldest due posts
+    add_post(2, 'within limit', 1)
+
+    PostDispatcher(app).drain()
+
+    assert published == ['within limit']
+    for post_id in deferred:
+        post = db.session.get(Post, post_id)
+        assert (post.status, post.publish_attempts) == ('scheduled', 0)
+        # Not tried again until the post from 5 minutes ago leaves the window
+        assert post.not_before > datetime.utcnow() + timedelta(minutes=9)
+        assert post.scheduled_at < datetime.utcnow()  # Still shown as scheduled when the user chose
+
+
+def test_deferred_post_is_published_once_due_again(app, published):
+    add_post(1, 'already out', 5, status='posted')
+    post_id = add_post(1, 'over limit', 1)
+    dispatcher = PostDispatcher(app)
+
+    assert dispatcher.dispatch_due_posts()["deferred"] == 1
+    assert dispatcher.dispatch_due_posts()["deferred"] == 0  # Not claimed again meanwhile
+
+    later = db.session.get(Post, post_id).not_before
+    QuotaEngine.LIMITS[("user", "15m")] = 2
+    assert dispatcher.dispatch_due_posts(now=later)["posted"] == 1
+    assert published == ['over limit']
+    assert QuotaEvent.query.filter_by(user_id=1).count() == 2  # Counted in the rolling windows
+
+
+def test_concurrent_claims_never_share_a_post(app):
+    for i in range(5):
+        add_post(i % 2 + 1, f'post {i}', 10 - i)
+    first, second = PostDispatcher(app, worker_id='a'), PostDispatcher(app, worker_id='b')
+
+    _, claimed_a = first.claim_due_posts(batch_size=3)
+    _, claimed_b = second.claim_due_posts(batch_size=3)
+    _, claimed_c = first.claim_due_posts(batch_size=3)
+
+    ids_a, ids_b = {post.id for post in claimed_a}, {post.id for post in claimed_b}
+    assert (len(ids_a), len(ids_b), claimed_c) == (3, 2, [])
+    assert ids_a.isdisjoint(ids_b)
+    # The oldest posts are claimed first
+    assert [post.text for post in claimed_a] == ['post 0', 'post 1', 'post 2']
+
+
+def test_expired_lease_is_reclaimed_and_old_holder_cannot_finish(app):
+    post_id = add_post(1, 'hello', 1)
+    crashed, other = PostDispatcher(app, worker_id='crashed'), PostDispatcher(app, worker_id='other')
+
+    old_token, (post,) = crashed.claim_due_posts()
+    assert PostDispatcher.reclaim_expired_leases() == 0  # Lease still valid
+
+    later = datetime.utcnow() + timedelta(seconds=PostDispatcher.LEASE_SECONDS + 1)
+    assert PostDispatcher.reclaim_expired_leases(now=later) == 1
+    new_token, (reclaimed,) = other.claim_due_posts(now=later)
+    assert reclaimed.publish_attempts == 2  # Triggers a reconcile lookup before publishing again
+
+    # The crashed worker comes back: its lease is gone
+    assert not PostDispatcher.finish(post, old_token, status='posted')
+    assert PostDispatcher.finish(reclaimed, new_token, status='posted')
+    db.session.commit()
+    stored = db.session.get(Post, post_id)
+    assert (stored.status, stored.lease_owner) == ('posted', None)
+
+
+def test_lease_token_fits_with_a_long_hostname(app, monkeypatch):
+    monkeypatch.setattr(socket, 'gethostname', lambda: 'h' * 253)
+    add_post(1, 'hello', 1)
+
+    lease_token, _ = PostDispatcher(app).claim_due_posts()
+    assert len(lease_token) <= Post.lease_owner.type.length
@@ -0,0 +1,82 @@
+"""
+Checks that "post now" posts are published by the outbox workers, exactly
+once, and by the dispatcher sweep when no outbox picked them up.
+"""
+from datetime import datetime
+
+import pytest
+
+from app.models import db, Post
+from utils.post_dispatcher import PostDispatcher
+from utils.post_outbox import PostOutbox
+
+
+@pytest.fixture
+def app_config():
+    return {'WTF_CSRF_ENABLED': False}
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """Replace the 𝕏 call; records the text of every post published."""
+    texts = []
+
+    def publish(credentials, text, **kwargs):
+        texts.append(text)
+        return str(100 + len(texts))
+
+    monkeypatch.setattr(PostDispatcher, 'publish', staticmethod(publish))
+    return texts
+
+
+@pytest.fixture
+def outbox(app):
+    outbox = app.extensions['post_outbox'] = PostOutbox(app)
+    yield outbox
+    outbox.shutdown()
+
+
+def queue_post(text):
+    # As posts.compose queues it: due right away
+    post = Post(user_id=1, text=text, status='queued', scheduled_at=datetime.utcnow())
+    db.session.add(post)
+    db.session.commit()
+    return post.id
+
+
+def test_compose_publishes_through_the_outbox(client, outbox, published):
+    response = client.post('/posts/compose', data={'text': 'right now', 'idempotency_key': 'key-1'})
+    assert response.status_code == 302
+
+    outbox.shutdown()  # Waits for the publish
+    db.session.expire_all()
+    post = Post.query.one()
+    assert (post.status, post.twitter_id, published) == ('posted', '101', ['right now'])
+    assert post.posted_at is not None
+
+
+def test_post_submitted_twice_is_published_once(app, outbox, published):
+    post_id = queue_post('once')
+    first, second = outbox.submit(post_id), outbox.submit(post_id)
+    first.result(5), second.result(5)
+
+    assert published == ['once']
+    assert db.session.get(Post, post_id).status == 'posted'
+
+
+def test_sweep_publishes_posts_no_outbox_picked_up(app, published):
+    with app.test_request_context():
+        PostOutbox.enqueue(db.session.get(Post, queue_post('left behind')))  # No outbox in this process
+    assert published == []
+
+    PostDispatcher(app).sweep()
+    assert published == ['left behind']
+
+
+def test_status_only_reports_own_posts(client):
+    own = queue_post('mine')
+    db.session.add(Post(user_id=2, text='theirs', status='queued'))
+    db.session.commit()
+
+    response = client.get(f'/posts/status?ids={own},{own + 1},nope')
+    assert response.get_json() == {'posts': {str(own): {'status': 'queued', 'twitter_id': None, 'url': None}}}
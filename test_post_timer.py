@@ -0,0 +1,93 @@
+"""
+Checks that ScheduledPostTimer fires posts on time, including posts
+scheduled by another process.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, Post
+from utils.post_timer import ScheduledPostTimer
+
+
+@pytest.fixture
+def app_config():
+    return {'POST_TIMER_POLL_INTERVAL': 0}
+
+
+def schedule_elsewhere(seconds, status='scheduled'):
+    """Schedule a post the way another process would: in the database only."""
+    post = Post(user_id=1, text='hello', status=status, scheduled_at=datetime.utcnow() + timedelta(seconds=seconds))
+    db.session.add(post)
+    db.session.commit()
+    return post.id
+
+
+def test_reconcile_loads_posts_within_horizon(app):
+    soon = schedule_elsewhere(60)
+    schedule_elsewhere(ScheduledPostTimer.HORIZON + 60)
+    schedule_elsewhere(-60)  # Overdue posts are left to the sweep
+    schedule_elsewhere(60, status='draft')
+
+    timer = ScheduledPostTimer(app, on_due=lambda post_ids: None)
+    assert timer.reconcile() == 1
+    assert list(timer._entries) == [soon]
+
+
+def test_reschedule_and_cancel(app):
+    timer = ScheduledPostTimer(app, on_due=lambda post_ids: None)
+    now = datetime.utcnow()
+    timer.schedule(1, now + timedelta(seconds=10))
+    timer.schedule(2, now + timedelta(seconds=20))
+    timer.schedule(1, now + timedelta(seconds=30))  # Moved later
+    timer.cancel(2)
+
+    assert timer._pop_due(now + timedelta(seconds=25)) == []
+    assert timer._pop_due(now + timedelta(seconds=35)) == [1]
+    assert len(timer) == 0
+
+
+def test_poll_picks_up_posts_scheduled_by_other_processes(app):
+    timer = ScheduledPostTimer(app, on_due=lambda post_ids: None)
+    timer.schedule(999, datetime.utcnow() + timedelta(seconds=40))
+
+    first = schedule_elsewhere(20)
+    schedule_elsewhere(ScheduledPostTimer.RECONCILE_INTERVAL + 30)  # Left to the next reconcile
+    schedule_elsewhere(-5)
+
+    assert timer.poll() == 1
+    assert timer._heap[0][1] == first
+    assert timer.poll() == 0
+
+
+def test_poll_picks_up_posts_due_after_the_next_entry(app, monkeypatch):
+    monkeypatch.setattr(ScheduledPostTimer, 'POLL_LIMIT', 2)
+    timer = ScheduledPostTimer(app, on_due=lambda post_ids: None)
+    held = [schedule_elsewhere(seconds) for seconds in (10, 11, 12)]
+    assert timer.poll() == 3
+
+    # Scheduled after the heap's first entry but before the next poll
+    later = schedule_elsewhere(30)
+    assert timer.poll() == 1
+    assert sorted(timer._entries) == sorted(held + [later])
+
+
+def test_post_scheduled_by_other_process_fires_on_time(app):
+    app.config['POST_TIMER_POLL_INTERVAL'] = 0.05
+    fired = []
+    done = threading.Event()
+
+    def on_due(post_ids):
+        fired.extend(post_ids)
+        done.set()
+
+    timer = ScheduledPostTimer(app, on_due)
+    timer.start()
+    try:
+        post_id = schedule_elsewhere(0.5)
+        assert done.wait(5)
+    finally:
+        timer.stop()
+
+    assert fired == [post_id]
@@ -0,0 +1,78 @@
+"""
+Checks that a compose form is only ever turned into one post, however often
+(or concurrently) it is submitted, and that deleting a post updates the timer.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.models import db, Post
+
+
+@pytest.fixture
+def app_config():
+    return {'WTF_CSRF_ENABLED': False}
+
+
+def compose(client, key, **form):
+    return client.post('/posts/compose', data=dict({'text': 'hello', 'idempotency_key': key}, **form))
+
+
+def schedule_form():
+    at = datetime.utcnow() + timedelta(days=1)
+    return {'schedule': 'on', 'schedule_date': at.strftime('%Y-%m-%d'), 'schedule_time': at.strftime('%H:%M')}
+
+
+def test_resubmitted_form_creates_one_post(client):
+    compose(client, 'key-1', **schedule_form())
+    response = compose(client, 'key-1', **schedule_form())
+
+    assert response.status_code == 302 and response.location.endswith('/posts/')
+    assert Post.query.count() == 1
+
+
+def test_key_is_unique_across_users(client):
+    db.session.add(Post(user_id=2, text='theirs', status='draft', idempotency_key='key-1'))
+    db.session.commit()
+
+    assert compose(client, 'key-1').status_code == 302
+    assert Post.query.filter_by(user_id=1).count() == 0
+
+
+@pytest.mark.parametrize('form', [{}, schedule_form()], ids=['queued', 'scheduled'])
+def test_concurrent_submit_is_reported_not_raised(client, form):
+    raced = []
+
+    def submit_elsewhere(session, flush_context, instances):
+        # Another request commits the same key between the lookup and this insert
+        raced.append(True)
+        with db.engine.begin() as conn:
+            conn.execute(Post.__table__.insert().values(
+                user_id=1, text='hello', status='queued', idempotency_key='key-1', publish_attempts=0
+            ))
+
+    event.listen(db.session, 'before_flush', submit_elsewhere, once=True)
+    try:
+        response = compose(client, 'key-1', **form)
+    finally:
+        if event.contains(db.session, 'before_flush', submit_elsewhere):
+            event.remove(db.session, 'before_flush', submit_elsewhere)
+
+    assert raced and response.status_code == 302 and response.location.endswith('/posts/')
+    assert Post.query.count() == 1
+    with client.session_transaction() as session:
+        assert ('info', 'This post was already submitted.') in session['_flashes']
+
+
+def test_deleting_a_scheduled_post_removes_it_from_the_timer(app, client):
+    cancelled = []
+    app.extensions['post_timer'] = type('Timer', (), {'cancel': lambda self, post_id: cancelled.append(post_id)})()
+    post = Post(user_id=1, text='later', status='scheduled', scheduled_at=datetime.utcnow() + timedelta(days=1))
+    db.session.add(post)
+    db.session.commit()
+    post_id = post.id
+
+    assert client.post(f'/posts/{post_id}/delete').status_code == 302
+    assert cancelled == [post_id]
+    assert db.session.get(Post, post_id) is None
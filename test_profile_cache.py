@@ -0,0 +1,111 @@
+"""
+Checks that ProfileCache serves stale profiles at once while a single
+background fetch refreshes them, and how fetch failures are cached.
+"""
+import threading
+import time
+import types
+
+import pytest
+
+from app.models import db, QuotaUsage, User
+from utils.client_registry import ClientRegistry
+from utils.profile_cache import ProfileCache
+from utils.rate_limit import RateLimitRegistry
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(monkeypatch):
+    monkeypatch.setattr(ProfileCache, '_entries', {})
+    monkeypatch.setattr(ProfileCache, '_refreshing', set())
+    RateLimitRegistry.clear()
+    yield
+    RateLimitRegistry.clear()
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replace the 𝕏 call: returns the next queued result; `release` unblocks it."""
+    fetches = types.SimpleNamespace(calls=0, results=[], release=threading.Event())
+    fetches.release.set()
+
+    def fetch(user_id, bearer_token):
+        fetches.calls += 1
+        fetches.release.wait(5)
+        return fetches.results.pop(0)
+
+    monkeypatch.setattr(ProfileCache, '_fetch', staticmethod(fetch))
+    return fetches
+
+
+def expire(user_id):
+    _, profile = ProfileCache._entries[user_id]
+    ProfileCache._entries[user_id] = (time.monotonic() - 1, profile)
+
+
+def wait_for_refresh(user_id):
+    deadline = time.monotonic() + 5
+    while user_id in ProfileCache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_fresh_profile_is_served_from_memory(app, fetches):
+    user = db.session.get(User, 1)
+    fetches.results = [{'followers_count': 1}]
+
+    assert ProfileCache.get(user, 'token') == {'followers_count': 1}
+    assert ProfileCache.get(user, 'token') == {'followers_count': 1}
+    assert fetches.calls == 1
+
+
+def test_stale_profile_is_served_while_one_refresh_runs(app, fetches):
+    user = db.session.get(User, 1)
+    fetches.results = [{'followers_count': 1}, {'followers_count': 2}]
+    ProfileCache.get(user, 'token')
+    expire(1)
+
+    fetches.release.clear()  # The refresh hangs on the API
+    assert ProfileCache.get(user, 'token') == {'followers_count': 1}
+    assert ProfileCache.get(user, 'token') == {'followers_count': 1}
+    fetches.release.set()
+    wait_for_refresh(1)
+
+    assert fetches.calls == 2  # One refresh, however many stale views
+    assert ProfileCache.get(user, 'token') == {'followers_count': 2}
+
+
+def test_failed_refresh_keeps_the_profile_and_backs_off(app, fetches):
+    user = db.session.get(User, 1)
+    fetches.results = [{'followers_count': 1}, None]
+    ProfileCache.get(user, 'token')
+    expire(1)
+
+    ProfileCache.get(user, 'token')
+    wait_for_refresh(1)
+    assert ProfileCache.get(user, 'token') == {'followers_count': 1}
+    assert fetches.calls == 2  # Not retried until FAILURE_TTL has passed
+    assert ProfileCache._entries[1][0] <= time.monotonic() + ProfileCache.FAILURE_TTL
+
+
+def test_fetch_saves_verification_and_counts_a_read(app, monkeypatch):
+    data = types.SimpleNamespace(public_metrics={'followers_count': 5, 'following_count': 3},
+                                 created_at=None, description='hi', profile_image_url=None,
+                                 verified=True, verified_type='blue')
+    client = types.SimpleNamespace(get_user=lambda **kwargs: types.SimpleNamespace(data=data))
+    monkeypatch.setattr(ClientRegistry, 'get_bearer_client', classmethod(lambda cls, token: client))
+
+    profile = ProfileCache._fetch(1, 'token')
+    assert (profile['followers_count'], profile['verified_type']) == (5, 'blue')
+    user = db.session.get(User, 1)
+    assert (user.is_verified, user.verified_type) == (True, 'blue')
+    assert QuotaUsage.query.filter_by(user_id=1).one().reads_used == 1
+
+
+def test_fetch_skips_the_call_when_the_rate_limit_is_spent(app, monkeypatch):
+    monkeypatch.setattr(ClientRegistry, 'get_bearer_client',
+                        classmethod(lambda cls, token: pytest.fail("API called past its rate limit")))
+    RateLimitRegistry.record(ClientRegistry.bearer_key('token'), None, RateLimitRegistry.GET_USER_BY_USERNAME, {
+        'x-rate-limit-limit': '10', 'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(int(time.time()) + 60)
+    })
+
+    assert ProfileCache._fetch(1, 'token') is None
@@ -0,0 +1,119 @@
+"""
+Checks that the hot queries on posts and stream_results are served by indexes.
+
+Each query is built the same way the app builds it, then run through SQLite's
+EXPLAIN QUERY PLAN. A plan that scans a whole table (a "SCAN <table>" step that
+does not go through an index) fails the test.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models import db, Post, StreamResult
+from utils.pagination import KeysetPagination
+from utils.quota_engine import QuotaEngine
+
+
+def explain(statement):
+    """Return the detail column of every step of the statement's query plan."""
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = tuple(
+        value.isoformat(' ') if isinstance(value, datetime) else value
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return [row[-1] for row in rows]
+
+
+def assert_uses_index(statement, table):
+    plan = explain(statement)
+    full_scans = [
+        step for step in plan
+        if step.startswith(f"SCAN {table}") and 'USING' not in step
+    ]
+    assert not full_scans, f"Full table scan of {table}: {plan}"
+    return plan
+
+
+def keyset_page(query, sort_column, descending):
+    """The statement KeysetPagination.paginate() runs for a page after the first."""
+    cursor = KeysetPagination.encode_cursor(datetime(2025, 4, 1), 100)
+    captured = {}
+
+    class Capture:
+        def __init__(self, query):
+            self.query = query
+
+        def filter(self, *criteria):
+            return Capture(self.query.filter(*criteria))
+
+        def order_by(self, *clauses):
+            return Capture(self.query.order_by(*clauses))
+
+        def limit(self, n):
+            captured['statement'] = self.query.limit(n).statement
+            return self
+
+        def all(self):
+            return []
+
+    KeysetPagination.paginate(Capture(query), sort_column, Post.id, cursor=cursor, descending=descending)
+    return captured['statement']
+
+
+def test_posts_by_user_newest_first(app):
+    statement = keyset_page(Post.query.filter_by(user_id=1), Post.created_at, descending=True)
+    plan = assert_uses_index(statement, 'posts')
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+def test_recent_posts_by_user(app):
+    statement = select(Post).filter_by(user_id=1).order_by(Post.created_at.desc()).limit(5)
+    plan = assert_uses_index(statement, 'posts')
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+def test_scheduled_posts_by_user(app):
+    statement = keyset_page(
+        Post.query.filter_by(user_id=1, status='scheduled'), Post.scheduled_at, descending=False
+    )
+    plan = assert_uses_index(statement, 'posts')
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+def test_post_counts_by_status(app):
+    statement = (
+        select(Post.status, func.count(Post.id))
+        .where(Post.user_id == 1)
+        .group_by(Post.status)
+    )
+    assert_uses_index(statement, 'posts')
+
+
+def test_due_posts(app):
+    statement = (
+        select(Post.id)
+        .where(Post.status == 'scheduled', Post.scheduled_at <= datetime(2025, 4, 1))
+        .order_by(Post.scheduled_at.asc())
+        .limit(20)
+    )
+    plan = assert_uses_index(statement, 'posts')
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+@pytest.mark.parametrize('scope, key', [('user', 1), ('app', 'consumer-key')])
+def test_quota_window_events(app, scope, key):
+    events = QuotaEngine._events(scope, key, datetime(2025, 4, 1))
+    assert_uses_index(select(func.count()).select_from(events), 'quota_events')
+
+
+def test_stream_results_by_stream(app):
+    statement = (
+        select(StreamResult)
+        .where(StreamResult.stream_id == 1, StreamResult.created_at >= datetime(2025, 4, 1))
+        .order_by(StreamResult.created_at.asc())
+    )
+    plan = assert_uses_index(statement, 'stream_results')
+    assert not any('TEMP B-TREE' in step for step in plan), plan
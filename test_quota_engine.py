@@ -0,0 +1,102 @@
+"""
+Checks QuotaEngine's rolling windows, which every process counts from the
+same quota event log.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, Post, QuotaEvent, User
+from utils.quota_engine import QuotaEngine
+from utils.quota_tracker import QuotaTracker
+
+
+@pytest.fixture
+def app_config():
+    return {
+        'QUOTA_USER_15M_LIMIT': 2,
+        'QUOTA_USER_24H_LIMIT': 5,
+        'QUOTA_APP_15M_LIMIT': 3,
+        'QUOTA_APP_24H_LIMIT': 0,
+        'QUOTA_APP_MONTH_LIMIT': 0,
+    }
+
+
+def publish(user_id, minutes_ago):
+    posted_at = datetime.utcnow() - timedelta(minutes=minutes_ago)
+    post = Post(user_id=user_id, text='hello', status='posted', posted_at=posted_at)
+    db.session.add(post)
+    QuotaTracker.record_post(user_id, posted_at)
+    db.session.commit()
+    return post
+
+
+def test_user_window_rejects_at_limit(app):
+    user = db.session.get(User, 1)
+    publish(1, 10)
+    assert QuotaEngine.check(user)["allowed"]
+
+    publish(1, 5)
+    result = QuotaEngine.check(user)
+    assert (result["allowed"], result["scope"], result["window"]) == (False, "user", "15m")
+    # The post from 10 minutes ago leaves the 15-minute window in about 5 minutes
+    assert 4 * 60 <= result["retry_after"] <= 5 * 60
+
+
+def test_posts_outside_window_do_not_count(app):
+    publish(1, 20)
+    publish(1, 30)
+    assert QuotaEngine.check(db.session.get(User, 1))["allowed"]
+
+
+def test_in_flight_reservation_from_another_process_counts(app):
+    user = db.session.get(User, 1)
+    publish(1, 1)
+    reservation_id = QuotaTracker.reserve(1)  # Another dispatcher is publishing
+    assert not QuotaEngine.check(user)["allowed"]
+
+    # Deferred or failed: the slot is given back
+    QuotaTracker.release_reservation(reservation_id, 1)
+    assert QuotaEngine.check(user)["allowed"]
+
+
+def test_own_reservation_is_not_counted_twice(app):
+    user = db.session.get(User, 1)
+    publish(1, 1)
+    QuotaTracker.reserve(1)
+    assert QuotaEngine.check(user, reserved=True)["allowed"]
+
+    QuotaTracker.reserve(1)
+    assert not QuotaEngine.check(user, reserved=True)["allowed"]
+
+
+def test_app_window_is_shared_by_users(app):
+    publish(1, 1)
+    publish(2, 2)
+    publish(2, 3)
+    result = QuotaEngine.check(db.session.get(User, 1))
+    assert (result["allowed"], result["scope"], result["window"]) == (False, "app", "15m")
+
+
+def test_disabled_window(app, monkeypatch):
+    monkeypatch.setitem(QuotaEngine.LIMITS, ("user", "15m"), 0)
+    monkeypatch.setitem(QuotaEngine.LIMITS, ("app", "15m"), 0)
+    for minutes in range(4):
+        publish(1, minutes)
+    assert QuotaEngine.check(db.session.get(User, 1))["allowed"]
+
+
+def test_deleted_post_keeps_its_slot(app):
+    user = db.session.get(User, 1)
+    publish(1, 1)
+    db.session.delete(publish(1, 2))
+    db.session.commit()
+    assert not QuotaEngine.check(user)["allowed"]
+
+
+def test_old_events_are_pruned(app):
+    publish(1, 3 * 24 * 60)
+    publish(2, 3 * 24 * 60)
+    publish(1, 1)
+    # Only the publishing user's old events go
+    assert [event.user_id for event in QuotaEvent.query.order_by(QuotaEvent.id)] == [2, 1]
@@ -0,0 +1,148 @@
+"""
+Checks that QuotaTracker's counters never lose an update, that its status
+snapshots are served from memory until they expire or are invalidated, and
+that reservations stop publishers exactly at the monthly limit.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, update
+
+from app.models import db, QuotaReservation, QuotaUsage
+from utils.quota_tracker import QuotaTracker
+
+
+@pytest.fixture(autouse=True)
+def isolated_tracker(monkeypatch):
+    # Class-level caches and buffers must not leak between tests
+    monkeypatch.setattr(QuotaTracker, '_status_cache', {})
+    monkeypatch.setattr(QuotaTracker, '_pending_reads', {})
+    monkeypatch.setattr(QuotaTracker, 'MONTHLY_LIMIT', 3)
+
+
+@pytest.fixture
+def queries(app):
+    """Statements run against the database."""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def usage():
+    db.session.expire_all()
+    quota = QuotaUsage.query.filter_by(user_id=1).one()
+    return quota.posts_used, quota.posts_reserved, quota.reads_used
+
+
+def test_concurrent_increments_are_not_lost(app):
+    def track():
+        with app.app_context():
+            for _ in range(10):
+                QuotaTracker.track_api_call(1, "post")
+            db.session.remove()
+
+    threads = [threading.Thread(target=track) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # One row per user and month, created by whichever thread got there first
+    assert QuotaUsage.query.count() == 1
+    assert usage()[0] == 40
+
+
+def test_read_calls_do_not_count_as_posts(app):
+    QuotaTracker.track_api_call(1, "profile")
+    QuotaTracker.track_api_call(1, "post")
+    assert usage() == (1, 0, 1)
+
+
+def test_write_behind_buffers_reads_until_flush(app):
+    app.config['QUOTA_WRITE_BEHIND'] = True
+    QuotaTracker.track_api_call(1, "profile")
+    QuotaTracker.track_api_call(1, "tokens")
+    assert usage()[2] == 0
+
+    assert QuotaTracker.flush_pending() == 2
+    assert usage()[2] == 2
+
+
+def test_status_snapshot_is_invalidated_by_tracking(app):
+    assert QuotaTracker.get_quota_status(1)["posts_used"] == 0
+    QuotaTracker.track_api_call(1, "post")
+    assert QuotaTracker.get_quota_status(1)["posts_used"] == 1
+
+
+def test_status_snapshot_is_served_without_queries(app, queries):
+    QuotaTracker.get_quota_status(1)
+    # Written by another process: not seen until the snapshot expires
+    db.session.execute(update(QuotaUsage).values(posts_used=2))
+    db.session.commit()
+    queries.clear()
+
+    status = QuotaTracker.get_quota_status(1)
+    assert (status["posts_used"], queries) == (0, [])
+    status["posts_used"] = 99  # Callers get a copy
+    assert QuotaTracker.get_quota_status(1)["posts_used"] == 0
+
+    assert QuotaTracker.get_quota_status(1, fresh=True)["posts_used"] == 2
+
+
+def test_status_snapshot_expires(app):
+    app.config['QUOTA_CACHE_TTL'] = 0
+    QuotaTracker.get_quota_status(1)
+    db.session.execute(update(QuotaUsage).values(posts_used=2))
+    db.session.commit()
+    assert QuotaTracker.get_quota_status(1)["posts_used"] == 2
+
+
+def test_status_snapshot_from_an_earlier_period_is_not_served(app):
+    QuotaTracker.get_quota_status(1)
+    expires_at, _, status = QuotaTracker._status_cache[1]
+    QuotaTracker._status_cache[1] = (expires_at, datetime(2000, 1, 1), dict(status, posts_used=7))
+    assert QuotaTracker.get_quota_status(1)["posts_used"] == 0
+
+
+def test_reserving_invalidates_the_snapshot(app):
+    QuotaTracker.get_quota_status(1)
+    QuotaTracker.commit_reservation(QuotaTracker.reserve(1), 1)
+    assert QuotaTracker.get_quota_status(1)["posts_used"] == 1
+
+
+def test_reservations_stop_at_the_limit(app):
+    reservations = [QuotaTracker.reserve(1, post_id) for post_id in range(4)]
+    assert None not in reservations[:3]
+    assert reservations[3] is None
+    assert usage()[:2] == (0, 3)
+
+    QuotaTracker.commit_reservation(reservations[0], 1)  # Published
+    QuotaTracker.release_reservation(reservations[1], 1)  # Failed or deferred
+    assert usage()[:2] == (1, 1)
+
+    # The released unit is free again, the used one is not
+    assert QuotaTracker.reserve(1) is not None
+    assert QuotaTracker.reserve(1) is None
+
+
+def test_abandoned_reservation_expires(app):
+    QuotaTracker.reserve(1)
+    later = datetime.utcnow() + timedelta(seconds=QuotaTracker.RESERVATION_TTL + 1)
+
+    assert QuotaTracker.expire_reservations(now=later) == 1
+    assert usage()[:2] == (0, 0)
+    assert QuotaReservation.query.count() == 0
+
+
+def test_committing_an_expired_reservation_still_counts(app):
+    reservation_id = QuotaTracker.reserve(1)
+    QuotaTracker.expire_reservations(now=datetime.utcnow() + timedelta(seconds=QuotaTracker.RESERVATION_TTL + 1))
+
+    QuotaTracker.commit_reservation(reservation_id, 1)
+    assert usage()[:2] == (1, 0)
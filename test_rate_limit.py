@@ -0,0 +1,114 @@
+"""
+Checks TokenBucket's burst and refill behaviour, and that RateLimitRegistry
+fails calls locally once the budget reported by 𝕏 is spent.
+"""
+import threading
+import types
+
+import pytest
+import requests
+
+from utils import rate_limit
+from utils.rate_limit import RateLimitExceeded, RateLimitRegistry, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for the module; sleeping advances it."""
+    now = types.SimpleNamespace(value=1000.0)
+    fake = types.SimpleNamespace(
+        monotonic=lambda: now.value,
+        time=lambda: now.value,
+        sleep=lambda seconds: setattr(now, 'value', now.value + seconds),
+    )
+    monkeypatch.setattr(rate_limit, 'time', fake)
+    return now
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    RateLimitRegistry.clear()
+    yield RateLimitRegistry
+    RateLimitRegistry.clear()
+
+
+def headers(limit, remaining, reset_at):
+    return {'x-rate-limit-limit': str(limit), 'x-rate-limit-remaining': str(remaining),
+            'x-rate-limit-reset': str(reset_at)}
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+    clock.value += 1  # Two tokens back, never more than the capacity
+    assert [bucket.try_acquire() for _ in range(3)] == [True, True, False]
+    clock.value += 60
+    assert bucket.tokens == 3
+
+
+def test_bucket_acquire_waits_for_a_token(clock):
+    bucket = TokenBucket(rate=4, capacity=1)
+    started = clock.value
+    for _ in range(5):
+        bucket.acquire()
+    assert clock.value - started == pytest.approx(1.0)
+
+
+def test_bucket_rejects_a_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_acquire_spends_the_recorded_budget(clock):
+    endpoint = RateLimitRegistry.CREATE_TWEET
+    RateLimitRegistry.acquire('ck', 'at', endpoint)  # Nothing recorded yet
+
+    RateLimitRegistry.record('ck', 'at', endpoint, headers(10, 2, 1900))
+    RateLimitRegistry.acquire('ck', 'at', endpoint)
+    RateLimitRegistry.acquire('ck', 'at', endpoint)
+    with pytest.raises(RateLimitExceeded) as exceeded:
+        RateLimitRegistry.acquire('ck', 'at', endpoint)
+    assert exceeded.value.reset_at == 1900
+    assert RateLimitRegistry.check('ck', 'at', endpoint) == 900
+
+    RateLimitRegistry.acquire('ck', 'other', endpoint)  # Budgets are per user
+
+    clock.value = 1900  # The window resets
+    RateLimitRegistry.acquire('ck', 'at', endpoint)
+    assert RateLimitRegistry.get_budget('ck', 'at') == []
+
+
+def test_concurrent_callers_cannot_overspend(clock):
+    RateLimitRegistry.record('ck', 'at', RateLimitRegistry.CREATE_TWEET, headers(10, 5, 1900))
+    allowed = []
+
+    def call():
+        try:
+            RateLimitRegistry.acquire('ck', 'at', RateLimitRegistry.CREATE_TWEET)
+            allowed.append(True)
+        except RateLimitExceeded:
+            pass
+
+    threads = [threading.Thread(target=call) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(allowed) == 5
+
+
+def test_response_hook_records_the_normalised_endpoint(clock):
+    response = requests.Response()
+    response.headers.update(headers(50, 49, 1900))
+    response.request = requests.Request('DELETE', 'https://api.twitter.com/2/tweets/1234567890').prepare()
+
+    RateLimitRegistry.response_hook('ck', 'at')(response)
+    (budget,) = RateLimitRegistry.get_budget('ck', 'at')
+    assert (budget['endpoint'], budget['limit'], budget['remaining']) == (RateLimitRegistry.DELETE_TWEET, 50, 49)
+
+
+def test_responses_without_rate_limit_headers_are_ignored():
+    RateLimitRegistry.record('ck', 'at', RateLimitRegistry.CREATE_TWEET, {'x-rate-limit-limit': '10'})
+    assert RateLimitRegistry.get_budget('ck', 'at') == []
@@ -0,0 +1,115 @@
+"""
+Checks RuleBacktest's counts, that the worker pool finds what the in-process
+scan finds, and the JSON route that runs it for the current user.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, Stream, StreamResult
+from utils import rule_backtest
+from utils.rule_backtest import RuleBacktest
+from utils.rule_matcher import RuleSyntaxError
+from utils.stream_archive import StreamArchive
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {'STREAM_ARCHIVE_DIR': str(tmp_path / 'archive'), 'STREAM_RETENTION_DAYS': 7}
+
+
+@pytest.fixture
+def app(app):
+    db.session.add(Stream(id=1, user_id=1, name='news', rules=['news']))
+    db.session.add(Stream(id=2, user_id=1, name='sport', rules=['sport']))
+    db.session.add(Stream(id=3, user_id=2, name='theirs', rules=['news']))
+    now = datetime.utcnow()
+    rows = [
+        (1, '100', 'breaking news', 10),  # Old enough to be archived
+        (1, '101', 'more news', 2),
+        (2, '101', 'more news', 2),  # The same post, stored for two streams
+        (2, '102', 'sport results', 1),
+        (1, '103', 'weather', 1),
+        (3, '104', 'news for bob', 1),
+    ]
+    for stream_id, post_id, text, days_ago in rows:
+        db.session.add(StreamResult(stream_id=stream_id, post_id=post_id, post_text=text, author_id='9',
+                                    created_at=now - timedelta(days=days_ago), data={'lang': 'en'}))
+    db.session.commit()
+    return app
+
+
+@pytest.fixture
+def pool():
+    yield
+    # Stop the spawned workers so they do not outlive the test
+    if rule_backtest._pool is not None:
+        rule_backtest._pool.shutdown(wait=True)
+        rule_backtest._pool = None
+
+
+def summary(result):
+    return {key: value for key, value in result.items() if key != 'elapsed'}
+
+
+def test_shard_covers_the_range():
+    assert RuleBacktest.shard(1, 10, 3) == [(1, 4), (5, 8), (9, 10)]
+    assert RuleBacktest.shard(5, 5, 4) == [(5, 5)]
+
+
+def test_repeated_rules_are_counted_separately(app):
+    result = RuleBacktest.run(['news', 'sport', 'news'], user_id=1, workers=1)
+
+    assert result['hits_by_rule'] == [2, 1, 2]
+    assert result['hits'] == 3  # Post 101 is counted once
+    assert [match['post_id'] for match in result['sample']] == ['102', '101', '100']  # Newest first
+
+
+def test_user_and_days_filters(app):
+    assert RuleBacktest.run(['news'], workers=1)['hits'] == 3
+    assert RuleBacktest.run(['news'], user_id=1, days=5, workers=1)['hits'] == 1
+
+
+def test_archived_results_are_scanned(app):
+    StreamArchive.rollover()
+    assert StreamResult.query.filter_by(post_id='100').count() == 0
+
+    result = RuleBacktest.run(['news'], user_id=1, workers=1)
+    assert (result['scanned'], result['hits']) == (5, 2)
+
+
+def test_pool_matches_the_inline_scan(app, pool, monkeypatch):
+    StreamArchive.rollover()
+    rules = ['news', 'sport OR weather']
+    inline = RuleBacktest.run(rules, user_id=1, workers=1)
+
+    monkeypatch.setattr(RuleBacktest, 'INLINE_ROWS', 0)
+    pooled = RuleBacktest.run(rules, user_id=1, workers=2)
+
+    assert rule_backtest._pool is not None  # The scan really went through the pool
+    assert summary(pooled) == summary(inline)
+    assert inline['hits_by_rule'] == [2, 2]
+
+
+def test_malformed_rule_is_rejected(app):
+    with pytest.raises(RuleSyntaxError):
+        RuleBacktest.run(['(news'])
+
+
+def test_route_runs_over_the_users_results(client):
+    # CSRF protection stays on: the JSON-only route is exempt
+    response = client.post('/streams/backtest', json={'rules': ['news', 'sport']})
+
+    assert response.status_code == 200
+    assert response.get_json()['hits_by_rule'] == [2, 1]
+
+
+def test_route_only_accepts_json(client):
+    assert client.post('/streams/backtest', data={'rules': 'news'}).status_code == 415
+    assert client.post('/streams/backtest', json=['news']).status_code == 400
+    assert client.post('/streams/backtest', json={'rules': ['(news']}).status_code == 400
+
+
+def test_route_needs_a_login(app):
+    response = app.test_client().post('/streams/backtest', json={'rules': ['news']})
+    assert response.status_code == 302 and '/auth/login' in response.location
@@ -0,0 +1,117 @@
+"""
+Checks that RuleMatcher tags posts the way 𝕏's filtered-stream rules would.
+"""
+import pytest
+
+from utils.rule_matcher import RuleCompiler, RuleMatcher, RuleSyntaxError
+
+
+def matches(rule, text, **post):
+    matcher = RuleMatcher()
+    matcher.load({1: [rule]})
+    return matcher.match(dict(post, text=text)) == {1}
+
+
+@pytest.mark.parametrize('rule, text, expected', [
+    ('cat', 'A cat!', True),
+    ('cat', 'concatenate', False),
+    ('cat', 'I love #cat pictures', True),
+    ('cat', 'cc @cat', True),
+    ('#cat', 'I love #cat', True),
+    ('#cat', 'a cat', False),
+    ('"cat video"', 'best #cat video ever', True),
+    ('"cat video"', 'video of a cat', False),
+    ('cat dog', 'dog and cat', True),
+    ('cat dog', 'just a cat', False),
+    ('cat OR dog', 'just a dog', True),
+    ('cat -dog', 'cat and dog', False),
+    ('(cat OR dog) -is:retweet', 'a dog', True),
+])
+def test_keywords(rule, text, expected):
+    assert matches(rule, text) is expected
+
+
+def test_quoted_operator_value():
+    assert RuleCompiler.parse('url:"https://example.com/a b"') == ('operator', 'url', 'https://example.com/a b')
+
+    rule = 'cats url:"https://example.com/cats"'
+    assert matches(rule, 'cats! https://example.com/cats')
+    assert not matches(rule, 'cats at https://example.com/dogs', entities=None)
+    assert not matches(rule, 'example com cats', entities=None)
+    # Shortened links only show their full URL in the entities
+    assert matches(rule, 'cats https://t.co/x', entities={'urls': [{'expanded_url': 'https://example.com/cats'}]})
+
+
+def test_negated_quoted_operator_value():
+    rule = 'cats -from:"12"'
+    assert matches(rule, 'cats', author_id='9')
+    assert not matches(rule, 'cats', author_id='12')
+
+
+def test_operators():
+    assert matches('lang:en cats', 'cats', lang='en')
+    assert not matches('lang:en cats', 'cats', lang='de')
+    assert matches('is:reply', 'hi', referenced_tweets=[{'type': 'replied_to', 'id': '1'}])
+    assert matches('has:hashtags', 'so #cute')
+
+
+# A post as the ingestor stores it: every requested field present, None when 𝕏 left it out
+PLAIN = {'author_id': '9', 'in_reply_to_user_id': None, 'entities': None, 'attachments': None, 'geo': None,
+         'media': [], 'author_verified': False, 'lang': 'en'}
+PHOTO = dict(PLAIN, attachments={'media_keys': ['3_1']}, media=[{'media_key': '3_1', 'type': 'photo'}])
+VIDEO = dict(PLAIN, attachments={'media_keys': ['7_1']}, media=[{'media_key': '7_1', 'type': 'video'}])
+GEO = dict(PLAIN, geo={'place_id': 'abc'})
+VERIFIED = dict(PLAIN, author_verified=True)
+
+
+@pytest.mark.parametrize('operator, having, lacking', [
+    ('has:images', PHOTO, VIDEO),
+    ('has:videos', VIDEO, PHOTO),
+    ('has:media', PHOTO, PLAIN),
+    ('has:geo', GEO, PLAIN),
+    ('is:verified', VERIFIED, PLAIN),
+    ('from:9', PLAIN, dict(PLAIN, author_id='10')),
+    ('lang:en', PLAIN, dict(PLAIN, lang='de')),
+])
+def test_operators_on_stored_posts(operator, having, lacking):
+    assert matches(f'cats {operator}', 'cats', **having)
+    assert not matches(f'cats {operator}', 'cats', **lacking)
+    assert not matches(f'cats -{operator}', 'cats', **having)
+    assert matches(f'cats -{operator}', 'cats', **lacking)
+
+
+def test_nullcast_posts_never_reach_the_stream():
+    assert matches('cats -is:nullcast', 'cats', **PLAIN)
+    assert not matches('cats is:nullcast', 'cats', **PLAIN)
+
+
+@pytest.mark.parametrize('operator', [
+    'is:verified', 'has:images', 'has:videos', 'has:media', 'has:geo', 'place_country:US', 'from:TwitterDev',
+    'to:TwitterDev', 'bio:python',
+])
+def test_unknown_operators_never_reject(operator):
+    # The post does not carry what the operator needs: neither it nor its negation can hide the post
+    assert matches(f'cats {operator}', 'I love cats')
+    assert matches(f'cats -{operator}', 'I love cats')
+    assert matches(f'cats (-{operator} OR dogs)', 'I love cats')
+    # Unknown never turns a definite rejection into a match
+    assert not matches(f'cats -{operator}', 'I love dogs')
+    assert not matches(f'cats -{operator} -love', 'I love cats')
+
+
+@pytest.mark.parametrize('rule', ['(cats', 'cats)', '', 'OR'])
+def test_syntax_errors(rule):
+    with pytest.raises(RuleSyntaxError):
+        RuleCompiler.parse(rule)
+
+
+def test_streams_are_updated_independently():
+    matcher = RuleMatcher()
+    matcher.load({1: ['cats'], 2: ['dogs']})
+    assert matcher.match({'text': 'cats and dogs'}) == {1, 2}
+
+    assert matcher.load({1: ['cats'], 2: ['birds']}) == 1
+    assert matcher.match({'text': 'cats and dogs'}) == {1}
+
+    matcher.remove_stream(1)
+    assert matcher.match({'text': 'cats and birds'}) == {2}
@@ -0,0 +1,94 @@
+"""
+Checks that archiving stream results into segment files loses nothing and
+that overlapping rollovers leave each other's files alone.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, Stream, StreamResult, StreamArchiveSegment
+from utils.stream_archive import StreamArchive
+
+
+@pytest.fixture
+def app_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(StreamArchive, 'SEGMENT_ROWS', 10)
+    monkeypatch.setattr(StreamArchive, 'BLOCK_ROWS', 4)
+    return {'STREAM_ARCHIVE_DIR': str(tmp_path / 'archive'), 'STREAM_RETENTION_DAYS': 7}
+
+
+@pytest.fixture
+def app(app):
+    db.session.add(Stream(id=1, user_id=1, name='news', rules=['news']))
+    now = datetime.utcnow()
+    # 25 results ten days old or more, 5 from today
+    for i in range(30):
+        age = timedelta(days=10, hours=30 - i) if i < 25 else timedelta(minutes=30 - i)
+        db.session.add(StreamResult(stream_id=1, post_id=str(1000 + i), post_text=f'news {i}', author_id='9',
+                                    created_at=now - age, data={'lang': 'en', 'n': i}))
+    db.session.commit()
+    return app
+
+
+def texts(results):
+    return [result.post_text for result in results]
+
+
+def test_rollover_moves_old_results_into_segments(app):
+    expected = texts(StreamResult.query.order_by(StreamResult.created_at))
+
+    assert StreamArchive.rollover() == {1: 25}
+    assert StreamResult.query.count() == 5
+    assert [segment.row_count for segment in StreamArchiveSegment.query.order_by(StreamArchiveSegment.id)] == [10, 10, 5]
+
+    # Archived results come back in arrival order, followed by the live ones
+    results = list(StreamArchive.results(1))
+    assert texts(results) == expected
+    assert results[0].data == {'lang': 'en', 'n': 0}
+
+    # Nothing is left to archive
+    assert StreamArchive.rollover() == {}
+
+
+def test_archived_results_can_be_filtered(app):
+    StreamArchive.rollover()
+
+    assert texts(StreamArchive.results(1, post_id='1013')) == ['news 13']
+    assert texts(StreamArchive.results(1, post_id='1027')) == ['news 27']
+
+    since = datetime.utcnow() - timedelta(days=10, hours=6, minutes=30)
+    assert texts(StreamArchive.results(1, since=since)) == [f'news {i}' for i in range(24, 30)]
+
+
+def test_prune_keeps_recent_unrecorded_files(app):
+    StreamArchive.rollover()
+    root = StreamArchive.archive_dir()
+    # Another rollover is still writing this segment
+    in_progress = os.path.join(root, '1', '000000000100-000000000110.jsonl.gz.tmp')
+    with open(in_progress, 'wb') as f:
+        f.write(b'partial')
+
+    assert StreamArchive.prune() == 0
+    assert os.path.exists(in_progress)
+
+    # Left behind by a crash long ago
+    old = time.time() - StreamArchive.PRUNE_GRACE - 1
+    os.utime(in_progress, (old, old))
+    assert StreamArchive.prune() == 1
+    assert not os.path.exists(in_progress)
+
+    # Recorded segments are never touched
+    assert all(os.path.exists(os.path.join(root, segment.path)) for segment in StreamArchiveSegment.query)
+
+
+def test_overlapping_rollover_is_skipped(app):
+    with StreamArchive._locked() as acquired:
+        assert acquired
+        with StreamArchive._locked() as second:
+            assert not second
+        assert StreamArchive.rollover() == {}
+
+    assert StreamResult.query.count() == 30
+    assert StreamArchive.rollover() == {1: 25}
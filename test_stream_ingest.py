@@ -0,0 +1,143 @@
+"""
+Checks that StreamIngestor stores each streamed post once per stream and
+does not lose a batch to a transient database error.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.models import db, Stream, StreamResult
+from utils.bloom_filter import RotatingBloomFilter
+from utils.stream_archive import StreamArchive
+from utils.stream_ingest import StreamIngestor
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {'STREAM_ARCHIVE_DIR': str(tmp_path / 'archive'), 'STREAM_RETENTION_DAYS': 7}
+
+
+@pytest.fixture
+def app(app):
+    db.session.add_all([
+        Stream(id=1, user_id=1, name='python', rules=['python'], active=True),
+        Stream(id=2, user_id=1, name='flask', rules=['flask'], active=True),
+    ])
+    db.session.commit()
+    return app
+
+
+@pytest.fixture
+def ingestor(app, monkeypatch):
+    monkeypatch.setattr(StreamIngestor, 'STORE_RETRY_DELAY', 0)
+    ingestor = StreamIngestor(app, bearer_token='token')
+    ingestor.matcher.sync(Stream.query.all())
+    return ingestor
+
+
+def line(post_id, text, stream_ids=()):
+    return json.dumps({
+        'data': {'id': post_id, 'text': text, 'author_id': '9'},
+        'matching_rules': [{'id': '1', 'tag': StreamIngestor.tag_for(stream_id)} for stream_id in stream_ids]
+    }).encode()
+
+
+def stored():
+    return sorted(db.session.query(StreamResult.stream_id, StreamResult.post_id).all())
+
+
+def test_post_is_stored_for_every_matching_stream(ingestor):
+    assert ingestor.store([line('10', 'python and flask')]) == 2
+    assert stored() == [(1, '10'), (2, '10')]
+
+
+def test_repeats_within_and_across_batches(ingestor):
+    assert ingestor.store([line('10', 'python', [1]), line('10', 'python', [1]), line('11', 'python')]) == 2
+    # A reconnect delivers the same posts again
+    assert ingestor.store([line('10', 'python'), line('11', 'python')]) == 0
+
+    assert stored() == [(1, '10'), (1, '11')]
+    assert ingestor.stats['duplicates'] == 3
+
+
+def test_repeats_past_the_bloom_filter_hit_the_unique_index(app, ingestor):
+    ingestor.store([line('10', 'python')])
+    # A restarted ingestor remembers nothing
+    restarted = StreamIngestor(app, bearer_token='token')
+    restarted.matcher.sync(Stream.query.all())
+
+    assert restarted.store([line('10', 'python'), line('12', 'python')]) == 1
+    assert stored() == [(1, '10'), (1, '12')]
+    assert restarted.stats['duplicates'] == 1
+
+
+def test_repeats_of_archived_posts_are_skipped(app, ingestor):
+    ingestor.store([line('10', 'python'), line('12', 'python')])
+    StreamResult.query.update({'created_at': datetime.utcnow() - timedelta(days=10)})
+    db.session.commit()
+    assert StreamArchive.rollover() == {1: 2}
+    restarted = StreamIngestor(app, bearer_token='token')
+    restarted.matcher.sync(Stream.query.all())
+
+    # 11 falls inside the archived segment's post id range but was never stored
+    assert restarted.store([line('10', 'python'), line('11', 'python'), line('13', 'python')]) == 2
+    assert stored() == [(1, '11'), (1, '13')]
+    assert restarted.stats['duplicates'] == 1
+
+
+def test_results_for_deleted_streams_are_skipped(ingestor):
+    assert ingestor.store([line('10', 'news', [7])]) == 0
+    assert stored() == []
+
+
+def test_failed_batch_is_retried(ingestor, monkeypatch):
+    failures = [OperationalError('INSERT', {}, Exception('database is locked'))]
+    insert_new = StreamIngestor._insert_new
+
+    def flaky_insert(rows):
+        if failures:
+            raise failures.pop()
+        return insert_new(rows)
+
+    monkeypatch.setattr(StreamIngestor, '_insert_new', staticmethod(flaky_insert))
+    ingestor._store_with_retry([line('10', 'python'), line('10', 'python')])
+
+    assert stored() == [(1, '10')]
+    assert (ingestor.stats['stored'], ingestor.stats['duplicates'], ingestor.stats['dropped']) == (1, 1, 0)
+
+
+def test_batch_is_dropped_after_repeated_failures(ingestor, monkeypatch):
+    def failing_insert(rows):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(StreamIngestor, '_insert_new', staticmethod(failing_insert))
+    ingestor._store_with_retry([line('10', 'python'), line('11', 'python')])
+
+    assert stored() == []
+    assert ingestor.stats['dropped'] == 2
+    # Nothing was remembered as stored, so the posts are accepted when delivered again
+    assert '1:10' not in ingestor.recent
+
+
+def test_bloom_filter_rotates_old_keys_out():
+    seen = RotatingBloomFilter(capacity=10, error_rate=0.001)
+    assert not seen.add('a')
+    assert seen.add('a')
+
+    for i in range(20):
+        seen.add(f'key-{i}')
+    assert 'a' not in seen
+
+
+def test_expansions_are_folded_into_the_stored_post():
+    post = StreamIngestor.expand(
+        {'id': '1', 'text': 'hi', 'author_id': '9', 'attachments': {'media_keys': ['3_1']}},
+        {'media': [{'media_key': '3_1', 'type': 'photo'}], 'users': [{'id': '9', 'verified': True}]}
+    )
+    assert post['media'] == [{'media_key': '3_1', 'type': 'photo'}]
+    assert (post['author_verified'], post['geo'], post['entities']) == (True, None, None)
+
+    # Media that was not expanded stays unknown
+    assert 'media' not in StreamIngestor.expand({'id': '1', 'attachments': {'media_keys': ['3_1']}}, {})
@@ -0,0 +1,126 @@
+"""
+Checks that UserCache serves users from memory without a query, picks up
+changes made by other processes once an entry expires, and never lets a
+stale copy overwrite them.
+"""
+import pytest
+from sqlalchemy import event, update
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import db, User
+from utils.user_cache import UserCache
+
+
+@pytest.fixture
+def app(app):
+    db.session.remove()
+    UserCache.clear()
+    yield app
+    UserCache.clear()
+
+
+def new_request():
+    """Start from an empty session, as a new request would."""
+    db.session.remove()
+
+
+def update_elsewhere(**values):
+    """Change the user the way another worker process would: in the database only."""
+    with db.engine.begin() as conn:
+        conn.execute(update(User).where(User.id == 1).values(version=User.version + 1, **values))
+
+
+def expire():
+    """Age every entry past its TTL."""
+    for user_id, (expires_at, values) in list(UserCache._entries.items()):
+        UserCache._entries[user_id] = (0, values)
+
+
+@pytest.fixture
+def queries(app):
+    """Statements run against the database."""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_cache_hit_runs_no_queries(app, queries):
+    UserCache.get(1)
+    new_request()
+    queries.clear()
+
+    user = UserCache.get(1)
+    assert user.username == 'alice'
+    assert user in db.session
+    assert queries == []
+
+
+def test_expired_entry_only_checks_the_version(app, queries):
+    UserCache.get(1)
+    new_request()
+    expire()
+    queries.clear()
+
+    assert UserCache.get(1).username == 'alice'
+    assert len(queries) == 1 and 'version' in queries[0]
+
+    # Renewed, so the next request is served from memory again
+    new_request()
+    queries.clear()
+    UserCache.get(1)
+    assert queries == []
+
+
+def test_change_in_other_process_is_seen_once_expired(app):
+    UserCache.get(1)
+    new_request()
+    update_elsewhere(access_token='new')
+    expire()
+
+    assert UserCache.get(1).access_token == 'new'
+
+
+def test_write_through_stale_copy_is_rejected(app):
+    UserCache.get(1)
+    new_request()
+    update_elsewhere(name='Renamed')
+
+    user = UserCache.get(1)  # Still the cached copy
+    user.access_token = 'revoked'
+    with pytest.raises(StaleDataError):
+        db.session.commit()
+    db.session.rollback()
+
+    # The failed write dropped the entry, so a retry goes through a fresh copy
+    new_request()
+    user = UserCache.get(1)
+    user.access_token = 'revoked'
+    db.session.commit()
+
+    new_request()
+    stored = db.session.get(User, 1)
+    assert (stored.name, stored.access_token) == ('Renamed', 'revoked')
+
+
+def test_local_write_invalidates_entry(app):
+    user = UserCache.get(1)
+    user.name = 'Changed'
+    db.session.commit()
+    new_request()
+
+    assert UserCache.get(1).name == 'Changed'
+
+
+def test_deleted_user(app):
+    UserCache.get(1)
+    new_request()
+    with db.engine.begin() as conn:
+        conn.execute(User.__table__.delete())
+    expire()
+
+    assert UserCache.get(1) is None
@@ -0,0 +1,160 @@
+"""
+Retry helpers for idempotent calls to the 𝕏 API.
+"""
+import logging
+import random
+import time
+
+import requests
+import tweepy
+from flask import current_app, has_app_context
+
+from utils.rate_limit import RateLimitExceeded
+
+
+class ApiRetry:
+    """
+    Retries 𝕏 API calls that failed for a transient reason, with jittered exponential backoff.
+
+    Errors are classified as:
+
+    - transient: 5xx responses, timeouts and connection errors, and 429s whose
+      window resets within MAX_DELAY. These are retried.
+    - permanent: everything else (4xx, bad credentials, duplicate content...).
+      These are raised straight away.
+
+    A timeout, connection error or 5xx is also *ambiguous*: the request may
+    have been applied even though no response came back. Before retrying
+    after one of these, the caller's `reconcile` callable is asked whether the
+    earlier attempt went through, so a retry never publishes a post twice. If
+    the caller cannot reconcile, ambiguous errors are only retried for calls
+    marked `idempotent` (e.g. deletes).
+
+    A duplicate-content 403 after an ambiguous attempt (or for a call marked
+    `maybe_applied`) means the earlier attempt did go through. If `reconcile`
+    cannot tell its result either (the Free tier cannot read timelines), the
+    call is treated as applied and returns None.
+    """
+
+    ATTEMPTS = 3  # Total attempts, including the first one
+    BASE_DELAY = 0.5  # Seconds before the first retry (before jitter)
+    MAX_DELAY = 8.0  # Upper bound on any single wait, including 429 resets
+
+    @staticmethod
+    def _logger():
+        return current_app.logger if has_app_context() else logging.getLogger(__name__)
+
+    @staticmethod
+    def is_ambiguous(error):
+        """True if the request may have been applied despite the error."""
+        if isinstance(error, (requests.Timeout, requests.ConnectionError, tweepy.TwitterServerError)):
+            return True
+        # tweepy.API wraps transport errors in a plain TweepyException
+        cause = error.__cause__
+        return isinstance(error, tweepy.TweepyException) and isinstance(
+            cause, (requests.Timeout, requests.ConnectionError)
+        )
+
+    @staticmethod
+    def is_duplicate(error):
+        """True if 𝕏 rejected the post as a duplicate of one already published."""
+        return isinstance(error, tweepy.Forbidden) and 'duplicate' in str(error).lower()
+
+    @staticmethod
+    def get_reset_at(error):
+        """
+        Epoch time at which the rate limit behind `error` resets.
+
+        RateLimitExceeded carries it; a tweepy.TooManyRequests only has the
+        429 response, whose `x-rate-limit-reset` header gives it.
+
+        Returns:
+            float: The reset time, or None if unknown
+        """
+        reset_at = getattr(error, 'reset_at', None)
+        if reset_at is not None:
+            return reset_at
+        response = getattr(error, 'response', None)
+        reset = getattr(response, 'headers', None) or {}
+        reset = reset.get('x-rate-limit-reset')
+        return int(reset) if reset and str(reset).isdigit() else None
+
+    @classmethod
+    def get_delay(cls, error, attempt):
+        """
+        Seconds to wait before retrying after `error`.
+
+        Args:
+            error: The exception raised by the call
+            attempt: Zero-based number of the attempt that failed
+
+        Returns:
+            float: Delay in seconds, or None if the error is permanent
+        """
+        if isinstance(error, (RateLimitExceeded, tweepy.TooManyRequests)):
+            reset_at = cls.get_reset_at(error)
+            if reset_at is None:
+                return None
+            wait = reset_at - time.time() + 1
+            return max(0.0, wait) if wait <= cls.MAX_DELAY else None
+
+        if not cls.is_ambiguous(error):
+            return None
+
+        # "Full jitter" so concurrent workers do not retry in lockstep
+        return random.uniform(0, min(cls.MAX_DELAY, cls.BASE_DELAY * 2 ** attempt))
+
+    @classmethod
+    def call(cls, func, reconcile=None, idempotent=False, attempts=None, description="API call",
+             maybe_applied=False):
+        """
+        Call `func`, retrying transient failures.
+
+        Args:
+            func: Zero-argument callable making the API call
+            reconcile: Optional zero-argument callable returning the result of an
+                earlier attempt that did go through, or None if it did not
+            idempotent: True if repeating an applied call is harmless
+            attempts: Total number of attempts (default: ATTEMPTS)
+            description: Label used in log messages
+            maybe_applied: An earlier call, made before this one, may have gone through
+
+        Returns:
+            The return value of `func` (or of `reconcile`), or None for a
+            duplicate of an applied call whose result is unknown
+        """
+        attempts = attempts or cls.ATTEMPTS
+        ambiguous = maybe_applied
+
+        for attempt in range(attempts):
+            if ambiguous and reconcile:
+                found = reconcile()
+                if found is not None:
+                    cls._logger().info(f"{description} had already gone through, not retrying")
+                    return found
+
+            try:
+                return func()
+            except Exception as e:
+                # A duplicate after an ambiguous attempt means that attempt succeeded
+                if ambiguous and cls.is_duplicate(e):
+                    found = reconcile() if reconcile else None
+                    if found is not None:
+                        return found
+                    cls._logger().warning(f"{description} was rejected as a duplicate, an earlier attempt went through")
+                    return None
+
+                delay = cls.get_delay(e, attempt)
+                if delay is None or attempt == attempts - 1:
+                    raise
+
+                if cls.is_ambiguous(e) and not idempotent:
+                    if not reconcile:
+                        raise
+                    ambiguous = True
+
+                cls._logger().warning(
+                    f"{description} failed ({type(e).__name__}: {str(e)}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt + 2}/{attempts})"
+                )
+                time.sleep(delay)
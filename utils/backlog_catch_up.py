@@ -0,0 +1,257 @@
+"""
+Catch-up mode for draining overdue scheduled posts after downtime.
+"""
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, DispatchLock, Post
+from utils.rate_limit import TokenBucket
+
+
+class BacklogCatchUp:
+    """
+    Drains the backlog of overdue scheduled posts at a controlled rate.
+
+    Posts older than the staleness cutoff are marked `expired` instead of being
+    published. The rest are published oldest-first through a token bucket,
+    taking one post per user per round so a single busy account cannot starve
+    everybody else.
+
+    Only one process catches up at a time: a run holds the `catch_up`
+    DispatchLock (renewed while it makes progress), so the bucket's rate is
+    also the rate across every dispatcher. The lock records the run's
+    cutoff; every dispatcher's sweep leaves posts due at or before it to the
+    run and keeps publishing posts that fall due after it.
+    """
+
+    RATE = 0.5  # Posts per second across all users
+    BURST = 5  # Posts that may go out back to back
+    STALE_AFTER = 24 * 3600  # Seconds after which an overdue post is expired
+    PAGE_SIZE = 50  # Post ids loaded per user at a time
+    PROGRESS_INTERVAL = 10  # Seconds between progress reports
+    LOCK_NAME = 'catch_up'
+    LOCK_SECONDS = 120  # Lifetime of the run's lock, renewed well before it runs out
+
+    def __init__(self, dispatcher, rate=None, burst=None, stale_after=None, on_progress=None):
+        """
+        Args:
+            dispatcher: PostDispatcher used to claim and publish each post
+            rate: Posts per second (default: POST_CATCH_UP_RATE)
+            burst: Token bucket capacity (default: POST_CATCH_UP_BURST)
+            stale_after: Seconds after which overdue posts expire (default: POST_STALE_AFTER)
+            on_progress: Optional callable receiving the progress dict
+        """
+        config = current_app.config
+        self.dispatcher = dispatcher
+        self.rate = rate or config.get('POST_CATCH_UP_RATE', self.RATE)
+        self.burst = burst or config.get('POST_CATCH_UP_BURST', self.BURST)
+        self.stale_after = stale_after or config.get('POST_STALE_AFTER', self.STALE_AFTER)
+        self.on_progress = on_progress
+        self.bucket = TokenBucket(self.rate, self.burst)
+
+        self.progress = {
+            "expired": 0,
+            "drained": 0,
+            "posted": 0,
+            "failed": 0,
+            "remaining": 0,
+            "eta_seconds": 0,
+            "started_at": None
+        }
+
+    @classmethod
+    def current_cutoff(cls, now=None):
+        """
+        Cutoff of the catch-up run in progress in any process.
+
+        Returns:
+            datetime: Posts due at or before it belong to the run, or None if no run is in progress
+        """
+        now = now or datetime.utcnow()
+        return db.session.scalar(
+            select(DispatchLock.cutoff).where(DispatchLock.name == cls.LOCK_NAME, DispatchLock.expires_at > now)
+        )
+
+    def _lock_seconds(self):
+        # Long enough to outlast the wait for the next token
+        return max(self.LOCK_SECONDS, 4 / self.rate)
+
+    def _acquire_lock(self, cutoff, now):
+        """Take the catch-up lock, or take over one whose holder stopped renewing it."""
+        owner = self.dispatcher.worker_id
+        values = {'owner': owner, 'expires_at': now + timedelta(seconds=self._lock_seconds()), 'cutoff': cutoff}
+
+        taken = db.session.execute(
+            update(DispatchLock)
+            .where(DispatchLock.name == self.LOCK_NAME,
+                   or_(DispatchLock.expires_at <= now, DispatchLock.owner == owner))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not taken:
+            db.session.add(DispatchLock(name=self.LOCK_NAME, **values))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Held by a live run elsewhere
+            db.session.rollback()
+            return False
+        return True
+
+    def _renew_lock(self):
+        """Extend the lock. Returns False if another process has taken it over."""
+        renewed = db.session.execute(
+            update(DispatchLock)
+            .where(DispatchLock.name == self.LOCK_NAME, DispatchLock.owner == self.dispatcher.worker_id)
+            .values(expires_at=datetime.utcnow() + timedelta(seconds=self._lock_seconds()))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return bool(renewed)
+
+    def _release_lock(self):
+        db.session.execute(
+            delete(DispatchLock)
+            .where(DispatchLock.name == self.LOCK_NAME, DispatchLock.owner == self.dispatcher.worker_id)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    @staticmethod
+    def expire_stale(stale_before):
+        """
+        Mark scheduled posts due before `stale_before` as expired.
+
+        Returns:
+            int: Number of posts expired
+        """
+        result = db.session.execute(
+            update(Post)
+            .where(Post.status == 'scheduled', Post.scheduled_at < stale_before)
+            .values(status='expired')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def count_backlog(cutoff):
+        """Count scheduled posts due at or before `cutoff`."""
+        return Post.query.filter(
+            Post.status == 'scheduled',
+            Post.scheduled_at <= cutoff
+        ).count()
+
+    def _next_page(self, user_id, cutoff, after):
+        """Load the next page of a user's overdue posts after the (scheduled_at, id) keyset."""
+        query = db.session.query(Post.id, Post.scheduled_at).filter(
+            Post.user_id == user_id,
+            Post.status == 'scheduled',
+            Post.scheduled_at <= cutoff
+        )
+        if after:
+            last_at, last_id = after
+            query = query.filter(or_(
+                Post.scheduled_at > last_at,
+                and_(Post.scheduled_at == last_at, Post.id > last_id)
+            ))
+
+        return query.order_by(Post.scheduled_at.asc(), Post.id.asc()).limit(self.PAGE_SIZE).all()
+
+    def _round_robin(self, cutoff):
+        """Yield overdue post ids, one per user per round, users ordered by their oldest post."""
+        heads = db.session.query(Post.user_id).filter(
+            Post.status == 'scheduled',
+            Post.scheduled_at <= cutoff
+        ).group_by(Post.user_id).order_by(func.min(Post.scheduled_at)).all()
+
+        queues = OrderedDict((user_id, deque()) for (user_id,) in heads)
+        cursors = {}
+
+        while queues:
+            for user_id in list(queues):
+                queue = queues[user_id]
+                if not queue:
+                    page = self._next_page(user_id, cutoff, cursors.get(user_id))
+                    if not page:
+                        del queues[user_id]
+                        continue
+                    queue.extend(page)
+                    cursors[user_id] = (page[-1].scheduled_at, page[-1].id)
+
+                yield queue.popleft().id
+
+    def _report(self):
+        self.progress["eta_seconds"] = round(self.progress["remaining"] / self.rate)
+        current_app.logger.info(
+            f"Catch-up progress: {self.progress['drained']} drained, "
+            f"{self.progress['remaining']} remaining, "
+            f"{self.progress['expired']} expired, ETA {self.progress['eta_seconds']}s"
+        )
+        if self.on_progress:
+            self.on_progress(dict(self.progress))
+
+    def run(self, now=None):
+        """
+        Drain the overdue backlog. Must be called inside an application context.
+
+        Only posts already due when the run starts are part of the backlog;
+        posts that fall due afterwards are left to the regular dispatcher.
+        If another process is already catching up, the backlog is left to it.
+
+        Returns:
+            dict: Final progress counters
+        """
+        cutoff = now or datetime.utcnow()
+        if not self._acquire_lock(cutoff, datetime.utcnow()):
+            current_app.logger.info("Another dispatcher is catching up on the backlog, leaving it to that one")
+            return dict(self.progress)
+
+        try:
+            return self._run(cutoff)
+        finally:
+            db.session.rollback()
+            self._release_lock()
+
+    def _run(self, cutoff):
+        self.progress["started_at"] = cutoff
+        self.progress["expired"] = self.expire_stale(cutoff - timedelta(seconds=self.stale_after))
+        self.progress["remaining"] = self.count_backlog(cutoff)
+
+        current_app.logger.info(
+            f"Catching up on {self.progress['remaining']} overdue posts at {self.rate} posts/s "
+            f"({self.progress['expired']} stale posts expired)"
+        )
+        self._report()
+
+        last_report = last_renewal = time.monotonic()
+        for post_id in self._round_robin(cutoff):
+            self.bucket.acquire()
+
+            if time.monotonic() - last_renewal >= self._lock_seconds() / 4:
+                if not self._renew_lock():
+                    current_app.logger.warning("Catch-up lock was taken over by another dispatcher, stopping")
+                    break
+                last_renewal = time.monotonic()
+
+            result = self.dispatcher.dispatch_due_posts(post_ids=[post_id])
+            handled = result["posted"] + result["failed"]
+            self.progress["posted"] += result["posted"]
+            self.progress["failed"] += result["failed"]
+            self.progress["drained"] += handled
+
+            # Posts claimed elsewhere or deleted meanwhile also leave the backlog
+            self.progress["remaining"] = max(0, self.progress["remaining"] - 1)
+
+            if time.monotonic() - last_report >= self.PROGRESS_INTERVAL:
+                self._report()
+                last_report = time.monotonic()
+
+        self.progress["remaining"] = 0
+        self._report()
+        return dict(self.progress)
@@ -0,0 +1,72 @@
+"""
+Rotating Bloom filter for dropping recently seen 𝕏 stream deliveries.
+"""
+import hashlib
+import math
+import threading
+
+
+class RotatingBloomFilter:
+    """
+    Remembers roughly the last 2 * `capacity` keys in fixed memory.
+
+    Keys are added to the current generation; once it holds `capacity` keys
+    it becomes the previous generation and a fresh one takes over, so old
+    keys age out instead of slowly raising the false positive rate. A key
+    counts as seen if either generation may contain it.
+
+    Like any Bloom filter it never misses a key it holds (within the last two
+    generations), but may report an unseen key as seen with probability of
+    about 2 * `error_rate`.
+    """
+
+    def __init__(self, capacity, error_rate):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))  # Bits per generation
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+
+        self._current = bytearray((self.size + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        # Double hashing: k positions from two independent 64-bit hashes
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    @staticmethod
+    def _contains(bits, positions):
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in positions)
+
+    def __contains__(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            return self._contains(self._current, positions) or self._contains(self._previous, positions)
+
+    def add(self, key):
+        """
+        Add a key, rotating generations when the current one is full.
+
+        Returns:
+            bool: Whether the key may already have been seen
+        """
+        positions = self._positions(key)
+        with self._lock:
+            if self._contains(self._current, positions):
+                return True
+            seen = self._contains(self._previous, positions)
+
+            if self._count >= self.capacity:
+                self._previous = self._current
+                self._current = bytearray(len(self._previous))
+                self._count = 0
+            for position in positions:
+                self._current[position >> 3] |= 1 << (position & 7)
+            self._count += 1
+            return seen
@@ -0,0 +1,233 @@
+"""
+Process-wide cache of Tweepy clients so outbound calls reuse keep-alive connections.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import tweepy
+from requests.adapters import HTTPAdapter
+
+from utils.rate_limit import RateLimitRegistry
+
+
+class _PooledAdapter(HTTPAdapter):
+    """
+    Keep-alive adapter that applies a default timeout and counts in-flight
+    requests, so an evicted client's connections are only closed once no
+    thread is using them any more.
+    """
+
+    def __init__(self, timeout, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+        self._in_flight = 0
+        self._retired = False
+        self._count_lock = threading.Lock()
+
+    def send(self, request, timeout=None, **kwargs):
+        with self._count_lock:
+            self._in_flight += 1
+        try:
+            # tweepy.Client never passes a timeout, which would let a call hang forever
+            return super().send(request, timeout=timeout or self.timeout, **kwargs)
+        finally:
+            with self._count_lock:
+                self._in_flight -= 1
+                idle = self._retired and not self._in_flight
+            if idle:
+                super().close()
+
+    def retire(self):
+        """Close the connections now if idle, otherwise when the last request finishes."""
+        with self._count_lock:
+            self._retired = True
+            idle = not self._in_flight
+        if idle:
+            super().close()
+
+
+class ClientRegistry:
+    """
+    LRU cache of Tweepy clients keyed by (kind, consumer_key, access_token).
+
+    Each client owns a `requests.Session`, so reusing the client reuses its
+    pooled HTTPS connections instead of paying a new TLS handshake on every
+    request. Entries are evicted when the cache is full or when they have been
+    idle for longer than IDLE_TTL, and must be invalidated whenever a user's
+    tokens change. Every session reports its rate-limit headers to
+    RateLimitRegistry under the client's (consumer_key, access_token) pair.
+
+    Every request gets CONNECT_TIMEOUT/READ_TIMEOUT unless the caller passes
+    its own, short enough that a publish with its retries finishes well
+    within the dispatcher's lease. An evicted client may still be in use by
+    the thread that fetched it, so its connections are closed only once its
+    in-flight requests have finished.
+
+    Safe to use without an application context, e.g. from worker threads.
+    """
+
+    MAX_SIZE = 256  # Maximum number of cached clients
+    IDLE_TTL = 900  # Seconds an unused client is kept around
+    POOL_MAXSIZE = 10  # Keep-alive connections per host for each client
+    CONNECT_TIMEOUT = 5  # Seconds to establish a connection
+    READ_TIMEOUT = 15  # Seconds to wait for each read; PostDispatcher.LEASE_SECONDS is 120
+
+    _clients = OrderedDict()  # key -> (client, secrets, last_used)
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, max_size=None, idle_ttl=None):
+        """Override the cache size and idle TTL (called from the app factory)."""
+        if max_size:
+            cls.MAX_SIZE = max_size
+        if idle_ttl:
+            cls.IDLE_TTL = idle_ttl
+
+    @classmethod
+    def _timeout(cls):
+        return (cls.CONNECT_TIMEOUT, cls.READ_TIMEOUT)
+
+    @classmethod
+    def _pool_session(cls, session):
+        """Mount a larger keep-alive pool so concurrent calls share connections."""
+        adapter = _PooledAdapter(cls._timeout(), pool_connections=1, pool_maxsize=cls.POOL_MAXSIZE)
+        session.mount('https://', adapter)
+        return session
+
+    @staticmethod
+    def _close(client):
+        """Close an evicted client's connections once it is no longer in use."""
+        adapter = client.session.get_adapter('https://')
+        if isinstance(adapter, _PooledAdapter):
+            adapter.retire()
+        else:
+            client.session.close()
+
+    @classmethod
+    def _evict(cls, now):
+        """Drop idle entries and trim the cache to MAX_SIZE. Caller holds the lock."""
+        evicted = []
+
+        # Entries are kept in last-used order, so idle ones sit at the front
+        while cls._clients:
+            key, (client, secrets, last_used) = next(iter(cls._clients.items()))
+            if now - last_used <= cls.IDLE_TTL and len(cls._clients) <= cls.MAX_SIZE:
+                break
+            del cls._clients[key]
+            evicted.append(client)
+
+        return evicted
+
+    @classmethod
+    def _get(cls, key, secrets, factory):
+        now = time.monotonic()
+
+        with cls._lock:
+            entry = cls._clients.get(key)
+
+            # A changed secret means the cached client holds stale credentials
+            if entry and entry[1] == secrets:
+                client = entry[0]
+                cls._clients.move_to_end(key)
+            else:
+                client = factory()
+                cls._pool_session(client.session)
+                client.session.hooks['response'].append(RateLimitRegistry.response_hook(key[1], key[2]))
+
+            cls._clients[key] = (client, secrets, now)
+            evicted = cls._evict(now)
+
+        for old_client in evicted:
+            cls._close(old_client)
+
+        return client
+
+    @classmethod
+    def get_client(cls, consumer_key, consumer_secret, access_token, access_token_secret):
+        """
+        Get a cached v2 `tweepy.Client` for a user context.
+
+        Returns:
+            tweepy.Client: Client authenticated with OAuth 1.0a user context
+        """
+        return cls._get(
+            ('client', consumer_key, access_token),
+            (consumer_secret, access_token_secret),
+            lambda: tweepy.Client(
+                consumer_key=consumer_key,
+                consumer_secret=consumer_secret,
+                access_token=access_token,
+                access_token_secret=access_token_secret
+            )
+        )
+
+    @classmethod
+    def get_api(cls, consumer_key, consumer_secret, access_token, access_token_secret):
+        """
+        Get a cached v1.1 `tweepy.API` for a user context.
+
+        Returns:
+            tweepy.API: API instance authenticated with OAuth 1.0a user context
+        """
+        def factory():
+            auth = tweepy.OAuth1UserHandler(
+                consumer_key,
+                consumer_secret,
+                access_token,
+                access_token_secret
+            )
+            # tweepy.API passes its own timeout (60s by default) on every request
+            return tweepy.API(auth, timeout=cls._timeout())
+
+        return cls._get(
+            ('api', consumer_key, access_token),
+            (consumer_secret, access_token_secret),
+            factory
+        )
+
+    @staticmethod
+    def bearer_key(bearer_token):
+        """Digest identifying a bearer token in cache and rate-limit keys."""
+        # Key on a digest so the raw token is not kept twice in memory
+        return hashlib.sha256(bearer_token.encode()).hexdigest()
+
+    @classmethod
+    def get_bearer_client(cls, bearer_token):
+        """
+        Get a cached v2 `tweepy.Client` using app-only (bearer token) auth.
+
+        Returns:
+            tweepy.Client: Client authenticated with the bearer token
+        """
+        return cls._get(
+            ('bearer', cls.bearer_key(bearer_token), None),
+            None,
+            lambda: tweepy.Client(bearer_token=bearer_token)
+        )
+
+    @classmethod
+    def invalidate(cls, consumer_key, access_token):
+        """
+        Drop every cached client for a user's tokens.
+
+        Call this whenever the tokens are rotated or revoked.
+        """
+        with cls._lock:
+            keys = [key for key in cls._clients if key[1] == consumer_key and key[2] == access_token]
+            evicted = [cls._clients.pop(key)[0] for key in keys]
+
+        RateLimitRegistry.forget(consumer_key, access_token)
+        for client in evicted:
+            cls._close(client)
+
+    @classmethod
+    def clear(cls):
+        """Drop every cached client."""
+        with cls._lock:
+            evicted = [entry[0] for entry in cls._clients.values()]
+            cls._clients.clear()
+
+        for client in evicted:
+            cls._close(client)
@@ -0,0 +1,244 @@
+"""
+Streaming CSV/JSONL export of 𝕏-Pilot posts and stream results.
+"""
+import csv
+import heapq
+import io
+import zlib
+
+from flask import Response, request, stream_with_context
+from sqlalchemy import func, select
+
+from app.models import db, json_serializer, Post, StreamResult
+from utils.stream_archive import StreamArchive
+
+
+class DataExport:
+    """
+    Renders rows as CSV or JSON lines in chunks, so an export of any size
+    runs in constant memory.
+
+    Rows are read in id order in batches of BATCH_SIZE (`yield_per`, which
+    streams the result set instead of buffering it) and encoded into chunks
+    of about CHUNK_SIZE bytes, optionally gzip-compressed as they go. Every
+    row carries its `id`; an interrupted export resumes from the last id
+    received by passing it as `since_id`.
+    """
+
+    FORMATS = {
+        'csv': 'text/csv',
+        'jsonl': 'application/x-ndjson'
+    }
+    BATCH_SIZE = 1000  # Rows fetched per round trip
+    CHUNK_SIZE = 64 * 1024  # Bytes encoded before a chunk is sent
+
+    POST_COLUMNS = ['id', 'twitter_id', 'text', 'status', 'created_at', 'scheduled_at', 'posted_at', 'media_attachments']
+    STREAM_RESULT_COLUMNS = ['id', 'stream_id', 'post_id', 'post_text', 'author_id', 'created_at', 'data']
+
+    # Sources
+
+    @classmethod
+    def posts(cls, user_id, since_id=0):
+        """
+        A user's posts with ids above `since_id`, in id order.
+
+        Must be iterated inside an application context.
+
+        Yields:
+            dict: Post column values
+        """
+        table = Post.__table__
+        query = (
+            select(*(table.c[column] for column in cls.POST_COLUMNS))
+            .where(table.c.user_id == user_id, table.c.id > since_id)
+            .order_by(table.c.id)
+            .execution_options(yield_per=cls.BATCH_SIZE)
+        )
+        for row in db.session.execute(query):
+            yield row._asdict()
+
+    @classmethod
+    def stream_results(cls, stream_id, since_id=0):
+        """
+        A stream's results with ids above `since_id`, in id order, archived and live.
+
+        The export is a snapshot: rollovers are paused until it finishes, so
+        no result moves between the table and the archive mid-export, and live
+        results above the highest id stored when it started are left for the
+        next export (resumed with that id as `since_id`). Archive segments
+        and live results are each read in id order and merged; a segment (or
+        the live query) is only started once the export reaches its lowest
+        id. Must be iterated inside an application context.
+
+        Yields:
+            dict: StreamResult column values
+        """
+        table = StreamResult.__table__
+        with StreamArchive.paused():
+            min_id, max_id = db.session.execute(
+                select(func.min(table.c.id), func.max(table.c.id))
+                .where(table.c.stream_id == stream_id, table.c.id > since_id)
+            ).one()
+
+            root = StreamArchive.archive_dir()
+            sources = [
+                (first_id, cls._segment_records(root, path, stream_id, since_id))
+                for (first_id, last_id), path in sorted(
+                    (StreamArchive.id_range(segment.path), segment.path)
+                    for segment in StreamArchive.segments_for([stream_id])
+                ) if last_id > since_id
+            ]
+            if min_id is not None:
+                sources.append((min_id, cls._live_records(stream_id, min_id, max_id)))
+            sources.sort(key=lambda source: source[0])
+
+            for record in cls._merge_by_id(sources):
+                yield record
+
+    @classmethod
+    def _live_records(cls, stream_id, min_id, max_id):
+        """A stream's results in the table with ids in [min_id, max_id], read in yield_per batches."""
+        table = StreamResult.__table__
+        query = (
+            select(*(table.c[column] for column in cls.STREAM_RESULT_COLUMNS))
+            .where(table.c.stream_id == stream_id, table.c.id.between(min_id, max_id))
+            .order_by(table.c.id)
+            .execution_options(yield_per=cls.BATCH_SIZE)
+        )
+        for row in db.session.execute(query):
+            yield row._asdict()
+
+    @classmethod
+    def _segment_records(cls, root, path, stream_id, since_id):
+        """A segment's records with ids above `since_id`, read lazily."""
+        for record in StreamArchive.read_segment(root, path):
+            if record['id'] > since_id:
+                record['stream_id'] = stream_id
+                yield {column: record[column] for column in cls.STREAM_RESULT_COLUMNS}
+
+    @staticmethod
+    def _merge_by_id(sources):
+        """
+        Merge id-ordered record iterators into one, in id order.
+
+        Args:
+            sources: (lowest possible id, iterator) pairs, sorted by that id;
+                an iterator is started only once the merge reaches its id
+
+        Yields:
+            dict: The records of every source
+        """
+        heap = []
+        sources = iter(sources)
+        pending = next(sources, None)
+        while heap or pending:
+            # Start every source that may hold the next lowest id
+            while pending and (not heap or pending[0] <= heap[0][0]):
+                records = pending[1]
+                record = next(records, None)
+                if record is not None:
+                    heapq.heappush(heap, (record['id'], id(records), record, records))
+                pending = next(sources, None)
+            if not heap:
+                continue
+
+            _, _, record, records = heapq.heappop(heap)
+            yield record
+            record = next(records, None)
+            if record is not None:
+                heapq.heappush(heap, (record['id'], id(records), record, records))
+
+    # Encoding
+
+    @staticmethod
+    def _value(value):
+        """A row value as JSON-compatible data."""
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    @classmethod
+    def _csv_value(cls, value):
+        """A row value as a CSV cell, with lists and dicts as JSON."""
+        if value is None:
+            return ''
+        if isinstance(value, (dict, list)):
+            return json_serializer(value)
+        return cls._value(value)
+
+    @classmethod
+    def encode(cls, rows, columns, fmt='csv', compress=False):
+        """
+        Encode rows as CSV (with a header line) or JSON lines.
+
+        Args:
+            rows: Iterable of dicts
+            columns: Column names, in output order
+            fmt: "csv" or "jsonl"
+            compress: Gzip the output on the fly
+
+        Yields:
+            bytes: Chunks of about CHUNK_SIZE bytes (before compression)
+
+        Raises:
+            ValueError: If the format is not supported
+        """
+        if fmt not in cls.FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        compressor = zlib.compressobj(wbits=31) if compress else None  # 31: gzip container
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(columns)
+
+        def take():
+            data = buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            return compressor.compress(data) if compressor else data
+
+        for row in rows:
+            if writer:
+                writer.writerow([cls._csv_value(row[column]) for column in columns])
+            else:
+                buffer.write(json_serializer({column: cls._value(row[column]) for column in columns}))
+                buffer.write('\n')
+            if buffer.tell() >= cls.CHUNK_SIZE:
+                chunk = take()
+                if chunk:
+                    yield chunk
+
+        chunk = take()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+
+    @classmethod
+    def response(cls, rows, columns, fmt, filename):
+        """
+        A streaming download of the rows, gzip-encoded if the client accepts it.
+
+        Must be called while handling a request; the rows are read as the
+        response is sent, within the same request context.
+
+        Args:
+            rows: Iterable of dicts, e.g. from posts() or stream_results()
+            columns: Column names, in output order
+            fmt: "csv" or "jsonl"
+            filename: Download name, without extension
+
+        Returns:
+            Response: The streaming response
+        """
+        compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+        response = Response(
+            stream_with_context(cls.encode(rows, columns, fmt, compress)),
+            mimetype=cls.FORMATS[fmt]
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+        response.headers['Vary'] = 'Accept-Encoding'
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
@@ -0,0 +1,211 @@
+"""
+Full-text search over 𝕏 posts and captured stream results using SQLite FTS5.
+"""
+from markupsafe import Markup, escape
+from sqlalchemy import text
+
+from app.models import db, Post, Stream, StreamResult
+
+
+class FullTextSearch:
+    """
+    Keyword search backed by FTS5 external-content tables.
+
+    `posts_fts` indexes `posts.text` and `stream_results_fts` indexes
+    `stream_results.post_text`. The FTS tables only hold the inverted index;
+    the text itself stays in the source tables, and triggers on those tables
+    keep the index in sync on every insert, update and delete, whether the
+    write came from the ORM or from raw SQL.
+
+    The tables and triggers are created by a migration. rebuild() recreates
+    them if missing and re-indexes every row in one transaction per table.
+    """
+
+    PER_PAGE = 20  # Results per page
+
+    # Snippet markers; the snippet is HTML-escaped before they become <mark> tags
+    _MARK_START = '\x02'
+    _MARK_END = '\x03'
+
+    # (FTS table, source table, indexed column)
+    INDEXES = {
+        'posts': ('posts_fts', 'posts', 'text'),
+        'stream_results': ('stream_results_fts', 'stream_results', 'post_text'),
+    }
+
+    @staticmethod
+    def _schema(fts_table, source_table, column):
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+            f"{column}, content='{source_table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column} ON {source_table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+            f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        ]
+
+    @staticmethod
+    def is_supported():
+        """True if the database is SQLite (the only backend with FTS5)."""
+        return db.engine.dialect.name == 'sqlite'
+
+    @staticmethod
+    def to_match_query(query):
+        """
+        Turn free text typed by a user into an FTS5 MATCH expression.
+
+        Every word is quoted, so characters with a meaning in FTS5 syntax
+        (quotes, hyphens, colons, AND/OR/NOT) are searched for literally and
+        never cause a syntax error. A trailing '*' keeps its prefix meaning.
+
+        Args:
+            query: Search text
+
+        Returns:
+            str: MATCH expression requiring every word, or '' if there are none
+        """
+        terms = []
+        for word in query.split():
+            prefix = word.endswith('*')
+            word = word.rstrip('*')
+            if word:
+                terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+        return ' '.join(terms)
+
+    @classmethod
+    def _highlight(cls, snippet):
+        return Markup(
+            str(escape(snippet or ''))
+            .replace(cls._MARK_START, Markup('<mark>'))
+            .replace(cls._MARK_END, Markup('</mark>'))
+        )
+
+    @classmethod
+    def _search(cls, kind, owner_filter, user_id, query, page, per_page):
+        fts_table, source_table, column = cls.INDEXES[kind]
+        per_page = per_page or cls.PER_PAGE
+        match = cls.to_match_query(query)
+        if not match:
+            return [], False
+
+        rows = db.session.execute(text(
+            f"SELECT src.id, snippet({fts_table}, 0, :start, :end, '…', 16) AS snippet "
+            f"FROM {fts_table} JOIN {source_table} src ON src.id = {fts_table}.rowid "
+            f"WHERE {fts_table} MATCH :match AND {owner_filter} "
+            f"ORDER BY bm25({fts_table}), src.id DESC LIMIT :limit OFFSET :offset"
+        ), {
+            'start': cls._MARK_START,
+            'end': cls._MARK_END,
+            'match': match,
+            'user_id': user_id,
+            'limit': per_page + 1,
+            'offset': (page - 1) * per_page
+        }).all()
+
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        return [(row.id, cls._highlight(row.snippet)) for row in rows], has_next
+
+    @classmethod
+    def search_posts(cls, user_id, query, page=1, per_page=None):
+        """
+        Search a user's posts, best match first.
+
+        Args:
+            user_id: Owner of the posts
+            query: Search text
+            page: 1-based page number
+            per_page: Results per page (default: PER_PAGE)
+
+        Returns:
+            tuple: (list of (Post, highlighted snippet), whether there is a next page)
+        """
+        if not cls.is_supported():
+            return cls._search_like(Post, Post.text, Post.user_id == user_id, query, page, per_page)
+
+        hits, has_next = cls._search('posts', 'src.user_id = :user_id', user_id, query, page, per_page)
+        return cls._load(Post, hits), has_next
+
+    @classmethod
+    def search_stream_results(cls, user_id, query, page=1, per_page=None):
+        """
+        Search the results captured by a user's streams, best match first.
+
+        Args:
+            user_id: Owner of the streams
+            query: Search text
+            page: 1-based page number
+            per_page: Results per page (default: PER_PAGE)
+
+        Returns:
+            tuple: (list of (StreamResult, highlighted snippet), whether there is a next page)
+        """
+        if not cls.is_supported():
+            owned = StreamResult.stream_id.in_(db.session.query(Stream.id).filter(Stream.user_id == user_id))
+            return cls._search_like(StreamResult, StreamResult.post_text, owned, query, page, per_page)
+
+        hits, has_next = cls._search(
+            'stream_results', 'src.stream_id IN (SELECT id FROM streams WHERE user_id = :user_id)',
+            user_id, query, page, per_page
+        )
+        return cls._load(StreamResult, hits), has_next
+
+    @staticmethod
+    def _load(model, hits):
+        """Load the matched rows in one query, keeping the ranking order."""
+        if not hits:
+            return []
+        rows = {row.id: row for row in model.query.filter(model.id.in_([row_id for row_id, _ in hits])).all()}
+        return [(rows[row_id], snippet) for row_id, snippet in hits if row_id in rows]
+
+    @classmethod
+    def _search_like(cls, model, column, owned, query, page, per_page):
+        """Unranked substring search for databases without FTS5."""
+        per_page = per_page or cls.PER_PAGE
+        words = query.replace('*', ' ').split()
+        if not words:
+            return [], False
+
+        found = model.query.filter(owned, *[column.ilike(f"%{word}%") for word in words]).order_by(
+            model.id.desc()
+        ).limit(per_page + 1).offset((page - 1) * per_page).all()
+        return [(row, escape(getattr(row, column.key))) for row in found[:per_page]], len(found) > per_page
+
+    @classmethod
+    def rebuild(cls, kinds=None, on_progress=None):
+        """
+        Create the FTS tables if needed and re-index every row.
+
+        Each index is rebuilt with FTS5's 'rebuild' command, in one transaction
+        per index: searches keep reading the old index until the new one is
+        committed, so there is never a window with a partial or empty index,
+        and writes made meanwhile wait for the commit instead of being missed.
+
+        Args:
+            kinds: Index names to rebuild (default: all of INDEXES)
+            on_progress: Optional callable taking (kind, rows indexed, total rows)
+
+        Returns:
+            dict: Number of rows indexed per index name
+        """
+        if not cls.is_supported():
+            raise RuntimeError("Full-text search needs SQLite with FTS5")
+
+        indexed = {}
+
+        for kind in kinds or cls.INDEXES:
+            fts_table, source_table, column = cls.INDEXES[kind]
+            for statement in cls._schema(fts_table, source_table, column):
+                db.session.execute(text(statement))
+            db.session.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+            total = db.session.execute(text(f"SELECT COUNT(*) FROM {source_table}")).scalar()
+            db.session.commit()
+
+            indexed[kind] = total
+            if on_progress:
+                on_progress(kind, total, total)
+
+        return indexed
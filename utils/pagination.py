@@ -0,0 +1,92 @@
+"""
+Keyset (cursor) pagination helpers.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+class KeysetPagination:
+    """
+    Paginates a query on a (sort column, id) keyset.
+
+    Each page filters on "after the last row of the previous page" instead
+    of using OFFSET, so with an index on the sort columns page 5000 costs
+    the same as page 1. The position is handed to clients as an opaque,
+    URL-safe cursor.
+    """
+
+    PER_PAGE = 20  # Rows per page
+
+    @staticmethod
+    def encode_cursor(sort_value, row_id):
+        """Encode a (sort value, id) position as an opaque cursor."""
+        if isinstance(sort_value, datetime):
+            sort_value = sort_value.isoformat()
+        raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Decode a cursor made by encode_cursor().
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            sort_value, row_id = json.loads(raw)
+            return datetime.fromisoformat(sort_value), int(row_id)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+    @staticmethod
+    def paginate(query, sort_column, id_column, cursor=None, per_page=None, descending=False):
+        """
+        Fetch one page of `query`.
+
+        Args:
+            query: Query to paginate (without ordering)
+            sort_column: Column to sort on, e.g. Post.created_at
+            id_column: Unique tie-breaker column, e.g. Post.id
+            cursor: Cursor of the previous page's last row, or None for the first page
+            per_page: Rows per page (default: PER_PAGE)
+            descending: Sort newest first
+
+        Returns:
+            tuple: (rows, cursor of the next page or None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        per_page = per_page or KeysetPagination.PER_PAGE
+
+        if cursor:
+            sort_value, last_id = KeysetPagination.decode_cursor(cursor)
+            if descending:
+                query = query.filter(or_(
+                    sort_column < sort_value,
+                    and_(sort_column == sort_value, id_column < last_id)
+                ))
+            else:
+                query = query.filter(or_(
+                    sort_column > sort_value,
+                    and_(sort_column == sort_value, id_column > last_id)
+                ))
+
+        if descending:
+            query = query.order_by(sort_column.desc(), id_column.desc())
+        else:
+            query = query.order_by(sort_column.asc(), id_column.asc())
+
+        # One extra row tells us whether there is a next page
+        rows = query.limit(per_page + 1).all()
+        if len(rows) <= per_page:
+            return rows, None
+
+        rows = rows[:per_page]
+        last = rows[-1]
+        return rows, KeysetPagination.encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
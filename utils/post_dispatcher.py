@@ -0,0 +1,537 @@
+"""
+Background dispatcher that publishes scheduled posts to 𝕏.
+"""
+import html
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import tweepy
+from apscheduler.schedulers.background import BackgroundScheduler
+from flask import current_app
+from sqlalchemy import or_, select, update
+
+from app.models import db, Post
+from utils.quota_tracker import QuotaTracker
+from utils.post_timer import ScheduledPostTimer
+from utils.backlog_catch_up import BacklogCatchUp
+from utils.client_registry import ClientRegistry
+from utils.rate_limit import RateLimitRegistry, RateLimitExceeded
+from utils.api_retry import ApiRetry
+from utils.quota_engine import QuotaEngine
+
+
+class PostDispatcher:
+    """
+    Publishes due `scheduled` and `queued` posts and moves them to `posted` or `failed`.
+
+    Any number of dispatchers can run at once. Each batch is claimed with a
+    conditional UPDATE that moves rows from `scheduled` to `dispatching` under
+    a lease, so a post is only ever handled by the worker holding its lease.
+    Leases left behind by crashed workers are returned to `scheduled` once
+    they expire (a `queued` post whose lease expired is simply overdue).
+
+    `queued` posts are "post now" posts written by posts.compose. They are
+    normally published straight away by the PostOutbox worker pool; the
+    sweep only picks up ones it did not get to.
+
+    Transient API errors are retried through ApiRetry. A post claimed more
+    than once, or whose publish attempt timed out, is first looked up among
+    the author's recent posts so it is never published twice.
+
+    When POST_TIMER_ENABLED is set, an in-process ScheduledPostTimer fires each
+    post as it becomes due and the database poll drops to a slow
+    reconciliation sweep.
+
+    With POST_CATCH_UP_ENABLED, the overdue backlog left by downtime is drained
+    at a controlled rate by BacklogCatchUp, in one process at a time. Sweeps
+    in every process leave that backlog to it but keep publishing posts that
+    fall due meanwhile.
+    """
+
+    BATCH_SIZE = 100  # Maximum number of due posts handled per poll
+    POLL_INTERVAL = 5  # Seconds between polls when the queue is drained
+    MAX_WORKERS = 8  # Concurrent create_tweet calls per batch
+    LEASE_SECONDS = 120  # How long a claimed post stays reserved for one worker
+    DEFER_SECONDS = 60  # Delay for a deferred post when the limit's reset time is unknown
+    HOSTNAME_LENGTH = 64  # Hostname characters kept in a worker id, so lease tokens fit Post.lease_owner
+
+    def __init__(self, app=None, worker_id=None):
+        self.app = app
+        self.worker_id = worker_id or (
+            f"{socket.gethostname()[:self.HOSTNAME_LENGTH]}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        )
+        self.scheduler = None
+        self.timer = None
+        self.catch_up_cutoff = None  # Cutoff of this process's pending or running catch-up
+
+    def claim_due_posts(self, now=None, batch_size=None, post_ids=None, status='scheduled', due_after=None):
+        """
+        Atomically claim a batch of the oldest due posts in the given status.
+
+        The due posts are found with a bounded range scan over the
+        (status, scheduled_at) index, so the cost of a poll does not depend on
+        how many posts are scheduled. Only rows still in `status` when the
+        UPDATE runs are claimed, so concurrent workers never share a post.
+
+        Args:
+            now: Cut-off time (default: current UTC time)
+            batch_size: Maximum number of posts to claim
+            post_ids: Only consider these posts (used by the timer and outbox)
+            status: Status to claim from, `scheduled` or `queued`
+            due_after: Only claim posts due after this time (skips a catch-up backlog)
+
+        Returns:
+            tuple: (lease token, list of claimed Post objects oldest first)
+        """
+        now = now or datetime.utcnow()
+        batch_size = batch_size or current_app.config.get('POST_DISPATCH_BATCH_SIZE', self.BATCH_SIZE)
+        lease_seconds = current_app.config.get('POST_DISPATCH_LEASE_SECONDS', self.LEASE_SECONDS)
+
+        # Every claim gets its own token so a batch can be told apart from
+        # earlier batches claimed by the same worker
+        lease_token = f"{self.worker_id}:{uuid.uuid4().hex[:8]}"
+
+        due_ids = select(Post.id).where(
+            Post.status == status,
+            Post.scheduled_at <= now,
+            # Deferred posts wait until their limit resets
+            or_(Post.not_before.is_(None), Post.not_before <= now)
+        )
+        if post_ids is not None:
+            due_ids = due_ids.where(Post.id.in_(post_ids))
+        if due_after is not None:
+            due_ids = due_ids.where(Post.scheduled_at > due_after)
+        due_ids = due_ids.order_by(Post.scheduled_at.asc()).limit(batch_size).with_for_update(skip_locked=True)
+
+        db.session.execute(
+            update(Post)
+            .where(Post.id.in_(due_ids.scalar_subquery()), Post.status == status)
+            .values(status='dispatching',
+                    lease_owner=lease_token,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    publish_attempts=Post.publish_attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        posts = Post.query.filter_by(
+            status='dispatching',
+            lease_owner=lease_token
+        ).order_by(Post.scheduled_at.asc()).all()
+
+        return lease_token, posts
+
+    @staticmethod
+    def reclaim_expired_leases(now=None):
+        """
+        Return posts whose dispatch lease has expired to the `scheduled` state.
+
+        Args:
+            now: Reference time (default: current UTC time)
+
+        Returns:
+            int: Number of posts reclaimed
+        """
+        now = now or datetime.utcnow()
+
+        result = db.session.execute(
+            update(Post)
+            .where(Post.status == 'dispatching', Post.lease_expires_at < now)
+            .values(status='scheduled', lease_owner=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        if result.rowcount:
+            current_app.logger.warning(f"Reclaimed {result.rowcount} posts with expired dispatch leases")
+        return result.rowcount
+
+    @staticmethod
+    def finish(post, lease_token, **values):
+        """
+        Record the outcome of a claimed post, provided the lease is still held.
+
+        Args:
+            post: The claimed Post
+            lease_token: Token returned by claim_due_posts
+            **values: Column values to set (status, twitter_id, posted_at...)
+
+        Returns:
+            bool: False if the lease was lost to another worker
+        """
+        result = db.session.execute(
+            update(Post)
+            .where(Post.id == post.id, Post.lease_owner == lease_token)
+            .values(lease_owner=None, lease_expires_at=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+
+        if not result.rowcount:
+            current_app.logger.error(f"Lost dispatch lease for post {post.id} before it was finished")
+            return False
+        return True
+
+    @staticmethod
+    def release(post, lease_token, status, retry_after=None):
+        """
+        Hand a claimed post back unpublished, e.g. when a limit defers it.
+
+        The claim did not lead to a publish attempt, so it is not counted in
+        `publish_attempts` (which would otherwise trigger a reconcile lookup).
+
+        With `retry_after`, the post is not claimed again before its
+        `not_before` time, when the limit resets; the user's `scheduled_at`
+        is left alone. Claims take the oldest due posts first, so a post left
+        claimable would be claimed and deferred again by every sweep and
+        crowd out the posts of users who are within their limits.
+
+        Args:
+            post: The claimed Post
+            lease_token: Token returned by claim_due_posts
+            status: Status to return the post to
+            retry_after: Seconds until the post may be published
+
+        Returns:
+            bool: False if the lease was lost to another worker
+        """
+        not_before = None
+        if retry_after is not None:
+            not_before = datetime.utcnow() + timedelta(seconds=max(1, retry_after))
+        return PostDispatcher.finish(post, lease_token, status=status, not_before=not_before,
+                                     publish_attempts=Post.publish_attempts - 1)
+
+    @classmethod
+    def get_retry_after(cls, error):
+        """Seconds until the rate limit behind `error` resets (DEFER_SECONDS if unknown)."""
+        reset_at = ApiRetry.get_reset_at(error)
+        if reset_at is None:
+            return cls.DEFER_SECONDS
+        return max(1, round(reset_at - time.time()))
+
+    @staticmethod
+    def find_published(client, author_id, text, since):
+        """
+        Look for a post with this text that the author published after `since`.
+
+        Used to reconcile an attempt whose outcome is unknown (timeout, crash
+        before the result was recorded) before publishing again.
+
+        The Free tier cannot read timelines (403), in which case the outcome
+        stays unknown and the publish attempt relies on 𝕏 rejecting a
+        duplicate instead.
+
+        Returns:
+            str: The 𝕏 id of the matching post, or None if not found or unknown
+        """
+        try:
+            response = client.get_users_tweets(author_id, start_time=since, max_results=10, user_auth=True)
+        except tweepy.Forbidden:
+            return None
+        for tweet in getattr(response, 'data', None) or []:
+            if html.unescape(tweet.text) == text:
+                return str(tweet.id)
+        return None
+
+    @staticmethod
+    def publish(credentials, text, author_id=None, since=None, reconcile_first=False):
+        """
+        Publish a single post through the v2 API, retrying transient errors.
+
+        Runs without an application context so it can be called from worker threads.
+
+        Args:
+            credentials: Tuple of (consumer_key, consumer_secret, access_token, access_token_secret)
+            text: Post text
+            author_id: 𝕏 id of the author, used to reconcile uncertain attempts
+            since: Earliest time the post can have been published
+            reconcile_first: An earlier claim may already have published the post
+
+        Returns:
+            str: The 𝕏 id of the new post, or None if the response had no data
+                or an earlier attempt published it and its id is unknown
+        """
+        client = ClientRegistry.get_client(*credentials)
+
+        def create():
+            twitter_response = client.create_tweet(text=text)
+            response_data = getattr(twitter_response, 'data', None)
+            return response_data['id'] if response_data else None
+
+        reconcile = None
+        if author_id and since:
+            def reconcile():
+                return PostDispatcher.find_published(client, author_id, text, since)
+
+            if reconcile_first:
+                twitter_id = reconcile()
+                if twitter_id:
+                    return twitter_id
+
+        return ApiRetry.call(create, reconcile=reconcile, description="Publishing post",
+                             maybe_applied=reconcile_first)
+
+    def dispatch_due_posts(self, now=None, batch_size=None, post_ids=None, status='scheduled', due_after=None):
+        """
+        Claim and publish one batch of due posts.
+
+        Args:
+            now: Cut-off time (default: current UTC time)
+            batch_size: Maximum number of posts to handle
+            post_ids: Only consider these posts (used by the timer and outbox)
+            status: Status to claim from, `scheduled` or `queued`
+            due_after: Only handle posts due after this time (skips a catch-up backlog)
+
+        Posts whose owner has no create_tweet budget left are released back
+        to `status` (counted as deferred) with `not_before` set to when the
+        limit resets, and picked up again by a later sweep.
+
+        Returns:
+            dict: Counts of posts that were posted, failed and deferred
+        """
+        lease_token, posts = self.claim_due_posts(now, batch_size, post_ids, status, due_after)
+        result = {"posted": 0, "failed": 0, "deferred": 0}
+
+        if not posts:
+            return result
+
+        # Reserve a unit of monthly quota per post; fail posts whose owner is out of quota
+        ready = []
+        reservations = {}
+        for post in posts:
+            reservation_id = QuotaTracker.reserve(post.user_id, post.id)
+            if reservation_id is None:
+                current_app.logger.warning(f"Quota limit reached, failing {status} post {post.id}")
+                if self.finish(post, lease_token, status='failed'):
+                    result["failed"] += 1
+                continue
+
+            # Rolling 15-minute/24-hour and app-wide caps
+            admission = QuotaEngine.check(post.user, reserved=True)
+            if not admission["allowed"]:
+                current_app.logger.warning(f"Deferring {status} post {post.id}: {QuotaEngine.describe(admission)}")
+                QuotaTracker.release_reservation(reservation_id, post.user_id)
+                if self.release(post, lease_token, status, retry_after=admission["retry_after"]):
+                    result["deferred"] += 1
+                continue
+
+            try:
+                RateLimitRegistry.acquire(post.user.consumer_key, post.user.access_token, RateLimitRegistry.CREATE_TWEET)
+            except RateLimitExceeded as e:
+                current_app.logger.warning(f"Deferring {status} post {post.id}: {str(e)}")
+                QuotaTracker.release_reservation(reservation_id, post.user_id)
+                if self.release(post, lease_token, status, retry_after=self.get_retry_after(e)):
+                    result["deferred"] += 1
+                continue
+
+            reservations[post.id] = reservation_id
+            ready.append(post)
+
+        # Network calls run concurrently; database updates stay on this thread
+        max_workers = current_app.config.get('POST_DISPATCH_WORKERS', self.MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                (post, executor.submit(
+                    self.publish,
+                    (
+                        post.user.consumer_key,
+                        post.user.consumer_secret,
+                        post.user.access_token,
+                        post.user.access_token_secret
+                    ),
+                    post.text,
+                    author_id=post.user.twitter_id,
+                    # Allow for clock skew between us and 𝕏
+                    since=(post.scheduled_at or post.created_at) - timedelta(minutes=1),
+                    reconcile_first=post.publish_attempts > 1
+                ))
+                for post in ready
+            ]
+
+            for post, future in futures:
+                try:
+                    twitter_id = future.result()
+                except tweepy.TooManyRequests as e:
+                    current_app.logger.warning(f"Rate limited publishing {status} post {post.id}, deferring: {str(e)}")
+                    QuotaTracker.release_reservation(reservations[post.id], post.user_id)
+                    if self.release(post, lease_token, status, retry_after=self.get_retry_after(e)):
+                        result["deferred"] += 1
+                    continue
+                except tweepy.TweepyException as e:
+                    current_app.logger.error(f"Twitter API error publishing {status} post {post.id}: {str(e)}")
+                    QuotaTracker.release_reservation(reservations[post.id], post.user_id)
+                    if self.finish(post, lease_token, status='failed'):
+                        result["failed"] += 1
+                    continue
+                except Exception as e:
+                    current_app.logger.error(f"Unexpected error publishing {status} post {post.id}: {str(e)}")
+                    QuotaTracker.release_reservation(reservations[post.id], post.user_id)
+                    if self.finish(post, lease_token, status='failed'):
+                        result["failed"] += 1
+                    continue
+
+                if not twitter_id:
+                    current_app.logger.warning(f"No 𝕏 id returned for post {post.id}, recording a placeholder")
+                    twitter_id = str(datetime.utcnow().timestamp())  # Use timestamp as fallback ID
+
+                if self.finish(post, lease_token,
+                               status='posted',
+                               twitter_id=twitter_id,
+                               posted_at=datetime.utcnow()):
+                    result["posted"] += 1
+
+                # Turn the reservation into a used unit
+                QuotaTracker.commit_reservation(reservations[post.id], post.user_id)
+
+        db.session.commit()
+
+        current_app.logger.info(
+            f"Dispatched {status} posts: {result['posted']} posted, "
+            f"{result['failed']} failed, {result['deferred']} deferred"
+        )
+        return result
+
+    def dispatch_posts(self, post_ids):
+        """
+        Publish specific posts that the timer reported as due.
+
+        Posts that were already claimed, deleted or rescheduled are skipped by the claim.
+
+        Args:
+            post_ids: List of post ids
+        """
+        batch_size = current_app.config.get('POST_DISPATCH_BATCH_SIZE', self.BATCH_SIZE)
+        for start in range(0, len(post_ids), batch_size):
+            self.dispatch_due_posts(post_ids=post_ids[start:start + batch_size])
+
+    def sweep(self):
+        """Reconcile the timer with the database, then publish anything it missed."""
+        if self.timer:
+            with self.app.app_context():
+                self.timer.reconcile()
+
+        return self.drain()
+
+    def catch_up(self, on_progress=None):
+        """
+        Drain the overdue backlog at the catch-up rate.
+
+        Args:
+            on_progress: Optional callable receiving progress dicts
+
+        Returns:
+            dict: Final progress counters
+        """
+        self.catch_up_cutoff = self.catch_up_cutoff or datetime.utcnow()
+        try:
+            with self.app.app_context():
+                self.reclaim_expired_leases()
+                return BacklogCatchUp(self, on_progress=on_progress).run(now=self.catch_up_cutoff)
+        finally:
+            self.catch_up_cutoff = None
+
+    def get_sweep_interval(self):
+        """Seconds between database sweeps; the timer makes frequent polling unnecessary."""
+        if self.timer:
+            return self.app.config.get('POST_TIMER_RECONCILE_INTERVAL', ScheduledPostTimer.RECONCILE_INTERVAL)
+        return self.app.config.get('POST_DISPATCH_INTERVAL', self.POLL_INTERVAL)
+
+    def start_timer(self):
+        """Start the in-process timer if enabled and register it on the app."""
+        if self.timer or not self.app.config.get('POST_TIMER_ENABLED'):
+            return self.timer
+
+        self.timer = ScheduledPostTimer(self.app, self.dispatch_posts)
+        self.timer.start()
+        self.app.extensions['post_timer'] = self.timer
+        return self.timer
+
+    def drain(self, include_scheduled=True):
+        """
+        Dispatch batches back to back until no due posts remain.
+
+        Scheduled posts that belong to a catch-up run (in this or another
+        process) are left to it; posts that fell due after its cutoff are
+        drained as usual.
+
+        Args:
+            include_scheduled: Also drain scheduled posts, not only leftover queued ones
+
+        Returns:
+            int: Total number of posts handled
+        """
+        batch_size = self.app.config.get('POST_DISPATCH_BATCH_SIZE', self.BATCH_SIZE)
+        statuses = ('queued', 'scheduled') if include_scheduled else ('queued',)
+        total = 0
+
+        with self.app.app_context():
+            self.reclaim_expired_leases()
+            QuotaTracker.expire_reservations()
+            # A catch-up scheduled in this process may not have taken its lock yet
+            backlog_cutoff = BacklogCatchUp.current_cutoff() or self.catch_up_cutoff
+
+            for status in statuses:
+                due_after = backlog_cutoff if status == 'scheduled' else None
+                while True:
+                    result = self.dispatch_due_posts(batch_size=batch_size, status=status, due_after=due_after)
+                    total += result["posted"] + result["failed"]
+
+                    # A short batch means we have caught up with everything due;
+                    # deferred posts are no longer due, so they count towards the batch
+                    if sum(result.values()) < batch_size:
+                        break
+
+        return total
+
+    def run_forever(self):
+        """Poll for due posts until interrupted (used by `flask dispatch-posts`)."""
+        if self.app.config.get('POST_CATCH_UP_ENABLED'):
+            self.catch_up()
+
+        self.start_timer()
+        interval = self.get_sweep_interval()
+        self.app.logger.info(f"Post dispatcher {self.worker_id} running, polling every {interval}s")
+
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                self.app.logger.error(f"Post dispatcher error: {str(e)}")
+            time.sleep(interval)
+
+    def start(self):
+        """Start polling in a background thread inside the web process."""
+        if self.scheduler:
+            return self.scheduler
+
+        self.start_timer()
+        interval = self.get_sweep_interval()
+        self.scheduler = BackgroundScheduler(daemon=True)
+        self.scheduler.add_job(
+            self.sweep,
+            'interval',
+            seconds=interval,
+            id='dispatch_scheduled_posts',
+            max_instances=1,
+            coalesce=True
+        )
+        if self.app.config.get('POST_CATCH_UP_ENABLED'):
+            self.catch_up_cutoff = datetime.utcnow()
+            self.scheduler.add_job(self.catch_up, id='catch_up_backlog')
+        self.scheduler.start()
+
+        self.app.logger.info(f"Background post dispatcher {self.worker_id} started, polling every {interval}s")
+        return self.scheduler
+
+    def shutdown(self):
+        """Stop the background scheduler and timer if they are running."""
+        if self.scheduler:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+        if self.timer:
+            self.timer.stop()
+            self.app.extensions.pop('post_timer', None)
+            self.timer = None
@@ -0,0 +1,59 @@
+"""
+Outbox worker pool that publishes "post now" posts to 𝕏 off the request thread.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from utils.post_dispatcher import PostDispatcher
+
+
+class PostOutbox:
+    """
+    Publishes `queued` posts in background threads.
+
+    posts.compose writes the post as `queued` and returns immediately; a worker
+    then claims it through the dispatcher's lease protocol, publishes it and
+    records `twitter_id`/`posted_at`. The `posts` table is the outbox, so a
+    queued post that this process never gets to (e.g. after a restart) is
+    picked up by the next dispatcher sweep.
+    """
+
+    MAX_WORKERS = 4  # Concurrent publishes per web process
+
+    def __init__(self, app):
+        self.app = app
+        self.dispatcher = PostDispatcher(app)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('POST_OUTBOX_WORKERS', self.MAX_WORKERS),
+            thread_name_prefix='post-outbox'
+        )
+
+    @staticmethod
+    def enqueue(post):
+        """
+        Hand a committed `queued` post to this process's worker pool.
+
+        Args:
+            post: The queued Post
+        """
+        outbox = current_app.extensions.get('post_outbox')
+        if outbox:
+            outbox.submit(post.id)
+        else:
+            current_app.logger.warning(f"No outbox running, post {post.id} will wait for the dispatcher")
+
+    def submit(self, post_id):
+        """Publish a post in a worker thread."""
+        return self.executor.submit(self._publish, post_id)
+
+    def _publish(self, post_id):
+        with self.app.app_context():
+            try:
+                return self.dispatcher.dispatch_due_posts(post_ids=[post_id], status='queued')
+            except Exception as e:
+                current_app.logger.error(f"Error publishing queued post {post_id}: {str(e)}")
+
+    def shutdown(self, wait=True):
+        """Stop accepting posts and optionally wait for in-flight publishes."""
+        self.executor.shutdown(wait=wait)
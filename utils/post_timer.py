@@ -0,0 +1,258 @@
+"""
+In-process timer that fires scheduled posts close to their scheduled time.
+"""
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app.models import db, Post
+
+
+class ScheduledPostTimer:
+    """
+    Min-heap of upcoming scheduled posts with a thread that sleeps until the next one is due.
+
+    The database stays the source of truth: the heap only holds posts due within
+    the next HORIZON seconds, it is updated incrementally when posts are
+    scheduled or deleted, and a periodic reconcile() sweep repairs any drift
+    (edits made directly in the database, lost notifications...).
+
+    notify_scheduled() only reaches the timer of the process that scheduled
+    the post. Posts scheduled by other processes (web workers scheduling for
+    a standalone `flask dispatch-posts`) are picked up by poll(), a cheap
+    query every POLL_INTERVAL seconds for posts due before the next
+    reconcile, so they fire on time rather than after the next reconcile.
+    """
+
+    HORIZON = 3600  # Seconds ahead of now that are kept in memory
+    RECONCILE_INTERVAL = 60  # Seconds between reconciliation sweeps
+    POLL_INTERVAL = 5  # Seconds between polls for posts scheduled by other processes
+    POLL_LIMIT = 100  # Posts loaded per poll
+    FIRE_WORKERS = 2  # Threads handing due posts to the dispatcher
+
+    def __init__(self, app, on_due):
+        """
+        Args:
+            app: Flask application instance
+            on_due: Callable receiving a list of due post ids, run inside an app context
+        """
+        self.app = app
+        self.on_due = on_due
+        self._heap = []  # (fire_at, post_id), may contain stale entries
+        self._entries = {}  # post_id -> fire_at for live entries
+        self._cond = threading.Condition()
+        self._thread = None
+        self._poller = None
+        self._executor = None
+        self._stopped = False
+        self._stop_polling = threading.Event()
+
+    @staticmethod
+    def get_timer():
+        """Return the timer running in this process, if any."""
+        return current_app.extensions.get('post_timer')
+
+    @staticmethod
+    def notify_scheduled(post):
+        """Tell the in-process timer (if running) that a post was scheduled or rescheduled."""
+        timer = ScheduledPostTimer.get_timer()
+        if timer and post.status == 'scheduled' and post.scheduled_at:
+            timer.schedule(post.id, post.scheduled_at)
+
+    @staticmethod
+    def notify_removed(post_id):
+        """Tell the in-process timer (if running) that a post was deleted or unscheduled."""
+        timer = ScheduledPostTimer.get_timer()
+        if timer:
+            timer.cancel(post_id)
+
+    def schedule(self, post_id, fire_at):
+        """Add or move a post in the timer."""
+        with self._cond:
+            self._entries[post_id] = fire_at
+            heapq.heappush(self._heap, (fire_at, post_id))
+            self._cond.notify()
+
+    def cancel(self, post_id):
+        """Remove a post from the timer. Its heap entry is discarded lazily."""
+        with self._cond:
+            if self._entries.pop(post_id, None) is not None:
+                self._compact()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._entries)
+
+    def _compact(self):
+        """Rebuild the heap once stale entries outnumber live ones."""
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(fire_at, post_id) for post_id, fire_at in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now):
+        """Pop every live entry due at or before now."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, post_id = heapq.heappop(self._heap)
+            if self._entries.get(post_id) == fire_at:
+                del self._entries[post_id]
+                due.append(post_id)
+        return due
+
+    def reconcile(self):
+        """
+        Sync the timer with scheduled posts due within the horizon.
+
+        Only posts that are not yet due are loaded; overdue posts are left to
+        the dispatcher's sweep (or catch-up run) so a restart cannot fire a
+        whole backlog at once.
+
+        Must be called inside an application context.
+
+        Returns:
+            int: Number of posts now held by the timer
+        """
+        now = datetime.utcnow()
+        horizon_end = now + timedelta(seconds=self.HORIZON)
+
+        rows = db.session.query(Post.id, Post.scheduled_at).filter(
+            Post.status == 'scheduled',
+            Post.scheduled_at > now,
+            Post.scheduled_at <= horizon_end
+        ).all()
+        in_db = dict(rows)
+
+        with self._cond:
+            # Drop posts that are no longer scheduled within the horizon
+            for post_id, fire_at in list(self._entries.items()):
+                if now < fire_at <= horizon_end and post_id not in in_db:
+                    del self._entries[post_id]
+
+            for post_id, fire_at in in_db.items():
+                if self._entries.get(post_id) != fire_at:
+                    self._entries[post_id] = fire_at
+                    heapq.heappush(self._heap, (fire_at, post_id))
+
+            self._compact()
+            self._cond.notify()
+            return len(self._entries)
+
+    def poll(self):
+        """
+        Load scheduled posts due before the next reconcile that the timer
+        does not hold yet, e.g. ones scheduled by another process.
+
+        Range scans over the (status, scheduled_at) index, POLL_LIMIT posts
+        at a time. Posts the timer already holds are skipped, so a post due
+        after the timer's next entry is found as well.
+        Must be called inside an application context.
+
+        Returns:
+            int: Number of posts added to the timer
+        """
+        now = datetime.utcnow()
+        until = now + timedelta(seconds=self.RECONCILE_INTERVAL)
+
+        added = 0
+        last = None  # (scheduled_at, id) of the previous page's last post
+        while True:
+            query = db.session.query(Post.id, Post.scheduled_at).filter(
+                Post.status == 'scheduled',
+                Post.scheduled_at > now,
+                Post.scheduled_at <= until
+            )
+            if last:
+                query = query.filter(or_(
+                    Post.scheduled_at > last[0],
+                    and_(Post.scheduled_at == last[0], Post.id > last[1])
+                ))
+            rows = query.order_by(Post.scheduled_at.asc(), Post.id.asc()).limit(self.POLL_LIMIT).all()
+
+            with self._cond:
+                for post_id, fire_at in rows:
+                    if self._entries.get(post_id) != fire_at:
+                        self._entries[post_id] = fire_at
+                        heapq.heappush(self._heap, (fire_at, post_id))
+                        added += 1
+                if added:
+                    self._cond.notify()
+
+            if len(rows) < self.POLL_LIMIT:
+                return added
+            last = (rows[-1][1], rows[-1][0])
+
+    def _poll(self, interval):
+        while not self._stop_polling.wait(interval):
+            with self.app.app_context():
+                try:
+                    self.poll()
+                except Exception as e:
+                    current_app.logger.error(f"Error polling for scheduled posts: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    def _fire(self, post_ids):
+        with self.app.app_context():
+            try:
+                self.on_due(post_ids)
+            except Exception as e:
+                current_app.logger.error(f"Error dispatching posts {post_ids} from timer: {str(e)}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+
+                now = datetime.utcnow()
+                due = self._pop_due(now)
+
+                if not due:
+                    # Sleep until the next post is due, or until woken by schedule()
+                    timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+
+            self._executor.submit(self._fire, due)
+
+    def start(self):
+        """Load upcoming posts from the database and start the timer thread."""
+        if self._thread:
+            return
+
+        with self.app.app_context():
+            count = self.reconcile()
+
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=self.FIRE_WORKERS, thread_name_prefix='post-timer')
+        self._thread = threading.Thread(target=self._run, name='post-timer', daemon=True)
+        self._thread.start()
+
+        interval = self.app.config.get('POST_TIMER_POLL_INTERVAL', self.POLL_INTERVAL)
+        if interval:
+            self._stop_polling.clear()
+            self._poller = threading.Thread(target=self._poll, args=(interval,), name='post-timer-poll', daemon=True)
+            self._poller.start()
+
+        self.app.logger.info(f"Scheduled post timer started with {count} upcoming posts")
+
+    def stop(self):
+        """Stop the timer thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._stop_polling.set()
+
+        if self._poller:
+            self._poller.join(timeout=5)
+            self._poller = None
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,151 @@
+"""
+Stale-while-revalidate cache of 𝕏 profile data.
+"""
+import threading
+import time
+
+from flask import current_app
+
+from app.models import db, User
+from utils.client_registry import ClientRegistry
+from utils.quota_tracker import QuotaTracker
+from utils.rate_limit import RateLimitRegistry
+
+
+class ProfileCache:
+    """
+    Per-user cache of the profile fields fetched with `client.get_user`.
+
+    Within PROFILE_CACHE_TTL seconds a profile is served from memory, so
+    repeated views cost no API call and no quota. Once it is stale the last
+    known data is still served straight away while one background thread per
+    user fetches a fresh copy. Only a user's first view waits for the API.
+
+    A failed fetch keeps serving the previous data (if any) and is retried
+    after FAILURE_TTL seconds rather than on every view.
+    """
+
+    TTL = 300  # Seconds a profile is served without refreshing
+    FAILURE_TTL = 60  # Seconds before a failed fetch is retried
+
+    USER_FIELDS = ["description", "created_at", "profile_image_url", "public_metrics", "verified", "verified_type"]
+
+    _entries = {}  # user_id -> (refresh after, monotonic; profile dict or None)
+    _refreshing = set()  # user_ids with a background refresh in flight
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _fetch(user_id, bearer_token):
+        """
+        Fetch a user's profile from 𝕏 and save their verification status.
+
+        Must be called inside an application context.
+
+        Returns:
+            dict: Profile fields, or None if the fetch failed
+        """
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+
+        try:
+            # Fall back to cached or database data rather than spend a call on a certain 429
+            RateLimitRegistry.acquire(
+                ClientRegistry.bearer_key(bearer_token),
+                None,
+                RateLimitRegistry.GET_USER_BY_USERNAME
+            )
+            client = ClientRegistry.get_bearer_client(bearer_token)
+            response = client.get_user(username=user.username, user_fields=ProfileCache.USER_FIELDS)
+            # Only calls that went through count against the quota
+            QuotaTracker.track_api_call(user, "profile")
+            data = getattr(response, 'data', None)
+            if not data:
+                current_app.logger.warning(f"No profile data returned for {user.username}")
+                return None
+        except Exception as e:
+            current_app.logger.error(f"Error fetching profile from Twitter API: {str(e)}")
+            return None
+
+        verified = getattr(data, 'verified', None)
+        verified_type = getattr(data, 'verified_type', None)
+        if (verified is not None and user.is_verified != verified) or user.verified_type != verified_type:
+            if verified is not None:
+                user.is_verified = verified
+            user.verified_type = verified_type
+            db.session.commit()
+
+        metrics = getattr(data, 'public_metrics', None) or {}
+        current_app.logger.info(f"Successfully fetched profile data for {user.username}")
+        return {
+            'following_count': metrics.get('following_count', 0),
+            'followers_count': metrics.get('followers_count', 0),
+            'created_at': getattr(data, 'created_at', None),
+            'description': getattr(data, 'description', None),
+            'profile_image_url': getattr(data, 'profile_image_url', None),
+            'verified': bool(verified),
+            'verified_type': verified_type
+        }
+
+    @classmethod
+    def _store(cls, user_id, profile, previous):
+        """Cache a fetch result; a failure keeps the previous profile."""
+        if profile is None:
+            refresh_after = time.monotonic() + cls.FAILURE_TTL
+            profile = previous
+        else:
+            refresh_after = time.monotonic() + current_app.config.get('PROFILE_CACHE_TTL', cls.TTL)
+        with cls._lock:
+            cls._entries[user_id] = (refresh_after, profile)
+        return profile
+
+    @classmethod
+    def _refresh_in_background(cls, user_id, bearer_token, previous):
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                try:
+                    cls._store(user_id, cls._fetch(user_id, bearer_token), previous)
+                except Exception as e:
+                    app.logger.error(f"Error refreshing profile of user {user_id}: {str(e)}")
+                finally:
+                    db.session.remove()
+                    with cls._lock:
+                        cls._refreshing.discard(user_id)
+
+        threading.Thread(target=run, name=f'profile-refresh-{user_id}', daemon=True).start()
+
+    @classmethod
+    def get(cls, user, bearer_token):
+        """
+        Get a user's 𝕏 profile data, fetching it only if none is cached.
+
+        Args:
+            user: The User
+            bearer_token: App bearer token used to call the API
+
+        Returns:
+            dict: Profile fields (following_count, followers_count, created_at,
+                description, profile_image_url, verified, verified_type), or
+                None if the profile has never been fetched successfully
+        """
+        with cls._lock:
+            entry = cls._entries.get(user.id)
+            stale = entry is not None and entry[0] <= time.monotonic()
+            start_refresh = stale and user.id not in cls._refreshing
+            if start_refresh:
+                cls._refreshing.add(user.id)
+
+        if entry is None:
+            return cls._store(user.id, cls._fetch(user.id, bearer_token), None)
+
+        if start_refresh:
+            cls._refresh_in_background(user.id, bearer_token, entry[1])
+        return entry[1]
+
+    @classmethod
+    def clear(cls):
+        """Forget every cached profile."""
+        with cls._lock:
+            cls._entries.clear()
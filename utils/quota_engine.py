@@ -0,0 +1,155 @@
+"""
+Multi-window quota engine for 𝕏 API posting limits.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, select, union_all
+
+from app.models import db, QuotaEvent, QuotaReservation, QuotaUsage, User
+from utils.quota_tracker import QuotaTracker
+
+
+class QuotaEngine:
+    """
+    Admission control for posts against 𝕏's rolling and monthly caps.
+
+    Every user and every app (consumer key) has a 15-minute and a 24-hour
+    rolling window, and each app also has a monthly cap shared by all of its
+    users. The per-user monthly limit stays with QuotaTracker. A limit of 0
+    disables that window.
+
+    Windows are counted in the database, so every web, outbox and dispatcher
+    process sees the same totals. A window holds the posts published in it
+    (the append-only `quota_events` log, so deleting a post does not free its
+    slot) plus the posts being published right now (open QuotaTracker
+    reservations, by `created_at`). A publish attempt that is deferred or
+    fails releases its reservation, which gives its slot back.
+
+    The dispatcher checks a post only after reserving it, so the post is
+    already counted. When two processes race for the last slot, each sees the
+    other's reservation and at worst both defer. A limit is never exceeded.
+    """
+
+    WINDOWS = {
+        "15m": 15 * 60,  # Window length in seconds
+        "24h": 24 * 3600,
+    }
+
+    # Defaults follow the free tier; tune them to the app's API plan
+    LIMITS = {
+        ("user", "15m"): 25,
+        ("user", "24h"): 50,
+        ("app", "15m"): 100,
+        ("app", "24h"): 500,
+        ("app", "month"): 1500,
+    }
+
+    @classmethod
+    def configure(cls, config):
+        """Read limits from QUOTA_<SCOPE>_<WINDOW>_LIMIT settings (called from the app factory)."""
+        for (scope, window) in cls.LIMITS:
+            name = f"QUOTA_{scope.upper()}_{window.upper()}_LIMIT"
+            if config.get(name) is not None:
+                cls.LIMITS[(scope, window)] = config[name]
+
+    @staticmethod
+    def _events(scope, key, since):
+        """Times of the posts published or being published by a user or app since `since`."""
+        posted = select(QuotaEvent.created_at.label('at')).where(QuotaEvent.created_at >= since)
+        reserved = select(QuotaReservation.created_at.label('at')).where(QuotaReservation.created_at >= since)
+        if scope == "user":
+            posted = posted.where(QuotaEvent.user_id == key)
+            reserved = reserved.where(QuotaReservation.user_id == key)
+        else:
+            app_users = select(User.id).where(User.consumer_key == key)
+            posted = posted.where(QuotaEvent.user_id.in_(app_users))
+            reserved = reserved.where(QuotaReservation.user_id.in_(app_users))
+        return union_all(posted, reserved).subquery()
+
+    @classmethod
+    def _counts(cls, scope, key, now):
+        """Number of posts in each rolling window of a user or app, in one query."""
+        longest = max(cls.WINDOWS.values())
+        events = cls._events(scope, key, now - timedelta(seconds=longest))
+        row = db.session.execute(select(*(
+            func.coalesce(func.sum(case((events.c.at >= now - timedelta(seconds=seconds), 1), else_=0)), 0).label(name)
+            for name, seconds in cls.WINDOWS.items()
+        ))).one()
+        return row._asdict()
+
+    @classmethod
+    def _retry_after(cls, scope, key, name, now, excess):
+        """Seconds until `excess` posts have left a window."""
+        seconds = cls.WINDOWS[name]
+        events = cls._events(scope, key, now - timedelta(seconds=seconds))
+        oldest = db.session.scalar(
+            select(events.c.at).order_by(events.c.at.asc()).offset(excess - 1).limit(1)
+        )
+        if oldest is None:
+            return 0
+        return max(0, round((oldest + timedelta(seconds=seconds) - now).total_seconds()))
+
+    @staticmethod
+    def _app_month_count(consumer_key):
+        """Posts used or reserved this period by every user of an app."""
+        month, year, _ = QuotaTracker.get_period()
+        total = db.session.query(
+            func.coalesce(func.sum(QuotaUsage.posts_used + func.coalesce(QuotaUsage.posts_reserved, 0)), 0)
+        ).join(
+            User, QuotaUsage.user_id == User.id
+        ).filter(
+            User.consumer_key == consumer_key,
+            QuotaUsage.month == month,
+            QuotaUsage.year == year
+        ).scalar()
+        return int(total)
+
+    @classmethod
+    def check(cls, user, reserved=False):
+        """
+        Check whether a post by `user` would currently be accepted.
+
+        Must be called inside an application context.
+
+        Args:
+            user: The User posting
+            reserved: The caller already holds a QuotaTracker reservation for
+                the post, so it is counted in every window already
+
+        Returns:
+            dict: allowed, and for a rejection the scope ("user"/"app"),
+                window ("15m"/"24h"/"month") and retry_after in seconds
+        """
+        now = datetime.utcnow()
+        pending = 0 if reserved else 1  # The post itself, if not counted yet
+
+        for scope, key in (("user", user.id), ("app", user.consumer_key)):
+            for name, count in cls._counts(scope, key, now).items():
+                limit = cls.LIMITS.get((scope, name))
+                if limit and count + pending > limit:
+                    return {
+                        "allowed": False,
+                        "scope": scope,
+                        "window": name,
+                        "retry_after": cls._retry_after(scope, key, name, now, count + pending - limit)
+                    }
+
+        limit = cls.LIMITS.get(("app", "month"))
+        if limit and cls._app_month_count(user.consumer_key) + pending > limit:
+            _, _, _, _, reset_date = QuotaTracker._get_period()
+            return {
+                "allowed": False,
+                "scope": "app",
+                "window": "month",
+                "retry_after": round((reset_date - now).total_seconds())
+            }
+
+        return {"allowed": True, "scope": None, "window": None, "retry_after": 0}
+
+    @staticmethod
+    def describe(result):
+        """Human readable reason for a rejected admission."""
+        scope = "Your account" if result["scope"] == "user" else "This app"
+        window = {"15m": "15-minute", "24h": "24-hour", "month": "monthly"}[result["window"]]
+        minutes = max(1, round(result["retry_after"] / 60))
+        return f"{scope} has reached its {window} posting limit. Try again in {minutes} min."
@@ -1,14 +1,166 @@
 """
 Utility for tracking 𝕏 API quota usage.
 """
+import atexit
+import threading
+import time
 from datetime import datetime, timedelta
 from flask import current_app
-from app.models import db, QuotaUsage, User
+from sqlalchemy import delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app.models import db, QuotaEvent, QuotaReservation, QuotaUsage
+from utils.user_cache import UserCache
 
 class QuotaTracker:
-    """Utility for tracking 𝕏 API quota usage."""
+    """
+    Utility for tracking 𝕏 API quota usage.
+
+    Counters are only ever changed with single atomic statements
+    (`posts_used = posts_used + 1`, as an upsert on `_user_month_year_uc`
+    where the database supports it), so concurrent workers never lose an
+    increment and the get-or-create of a month's row cannot race.
+
+    With QUOTA_WRITE_BEHIND enabled, read-only call types are counted in
+    memory and flushed in one batch every QUOTA_FLUSH_INTERVAL seconds, so a
+    page view does not cost a database commit.
+
+    get_quota_status serves a per-user snapshot cached for QUOTA_CACHE_TTL
+    seconds. track_api_call invalidates the caller's snapshot, and snapshots
+    never outlive the quota period they were read in.
+
+    Publishing goes through reserve() / commit_reservation() /
+    release_reservation(): a unit is reserved with a conditional UPDATE
+    (`posts_used + posts_reserved < limit`) before the API call, so concurrent
+    publishers stop exactly at the limit. Reservations that are neither
+    committed nor released expire after QUOTA_RESERVATION_TTL seconds.
+
+    Every published post is also appended to the quota_events log, which
+    QuotaEngine counts its rolling windows from. Events are never changed,
+    only pruned once they are older than EVENT_RETENTION seconds.
+    """
 
     MONTHLY_LIMIT = 1500  # Standard 𝕏 API limit for posts
+    READ_ONLY_CALL_TYPES = ("profile", "tokens")  # Calls counted in reads_used
+    FLUSH_INTERVAL = 30  # Seconds between write-behind flushes
+    CACHE_TTL = 30  # Seconds a quota snapshot is served from memory
+    RESERVATION_TTL = 300  # Seconds before an unfinished reservation is returned
+    EVENT_RETENTION = 2 * 24 * 3600  # Seconds quota events are kept; longer than any rolling window
+
+    _period = None  # (month, year, reset_date_str, period start, reset date) of the current period
+    _status_cache = {}  # user_id -> (expires_at monotonic, period reset date, status dict)
+    _status_lock = threading.Lock()
+
+    _pending_reads = {}  # (user_id, month, year, reset_date) -> unflushed read calls
+    _pending_lock = threading.Lock()
+    _flush_thread = None
+
+    @staticmethod
+    def get_period(now=None):
+        """
+        Get the quota period containing `now`.
+
+        Returns:
+            tuple: (month, year, reset date as YYYY-MM-DD string)
+        """
+        return QuotaTracker._get_period(now)[:3]
+
+    @staticmethod
+    def _get_period(now=None):
+        """Like get_period, plus the period's start and reset datetimes. Computed once per period."""
+        now = now or datetime.utcnow()
+
+        period = QuotaTracker._period
+        if period and period[3] <= now < period[4]:
+            return period
+
+        # Calculate reset date (first day of next month)
+        if now.month == 12:
+            reset_month = 1
+            reset_year = now.year + 1
+        else:
+            reset_month = now.month + 1
+            reset_year = now.year
+
+        period = (
+            now.month,
+            now.year,
+            f"{reset_year}-{reset_month:02d}-01",
+            datetime(now.year, now.month, 1),
+            datetime(reset_year, reset_month, 1)
+        )
+        QuotaTracker._period = period
+        return period
+
+    @staticmethod
+    def _upsert(values, increments=None):
+        """
+        Insert a quota row, or add `increments` to the existing one, in one statement.
+
+        Returns:
+            Result of the statement, or None if the dialect has no ON CONFLICT support
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            insert = postgresql.insert
+        elif dialect == 'sqlite':
+            insert = sqlite.insert
+        else:
+            return None
+
+        table = QuotaUsage.__table__
+        stmt = insert(table).values(**values)
+        conflict = ['user_id', 'month', 'year']
+
+        if not increments:
+            return db.session.execute(stmt.on_conflict_do_nothing(index_elements=conflict))
+
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict,
+            set_={column: table.c[column] + amount for column, amount in increments.items()}
+        )
+        return db.session.execute(stmt.returning(table.c.posts_used))
+
+    @staticmethod
+    def _ensure_quota(user_id, month, year, reset_date_str):
+        """Create the user's quota row for a period unless it already exists."""
+        values = dict(user_id=user_id, month=month, year=year, posts_used=0, reads_used=0,
+                      reset_date=reset_date_str)
+
+        if QuotaTracker._upsert(values) is None:
+            # No ON CONFLICT: insert in a savepoint and ignore a lost race
+            try:
+                with db.session.begin_nested():
+                    db.session.add(QuotaUsage(**values))
+            except IntegrityError:
+                pass
+
+    @staticmethod
+    def _increment(user_id, period, posts=0, reads=0):
+        """
+        Atomically add to a user's counters for a period, creating the row if needed.
+
+        Returns:
+            int: posts_used after the increment
+        """
+        month, year, reset_date_str = period
+        values = dict(user_id=user_id, month=month, year=year, posts_used=posts, reads_used=reads,
+                      reset_date=reset_date_str)
+
+        result = QuotaTracker._upsert(values, {"posts_used": posts, "reads_used": reads})
+        if result is not None:
+            return result.scalar_one()
+
+        QuotaTracker._ensure_quota(user_id, month, year, reset_date_str)
+        db.session.execute(
+            update(QuotaUsage)
+            .where(QuotaUsage.user_id == user_id, QuotaUsage.month == month, QuotaUsage.year == year)
+            .values(posts_used=QuotaUsage.posts_used + posts, reads_used=QuotaUsage.reads_used + reads)
+            .execution_options(synchronize_session=False)
+        )
+        return db.session.query(QuotaUsage.posts_used).filter_by(
+            user_id=user_id, month=month, year=year
+        ).scalar()
 
     @staticmethod
     def track_api_call(user, call_type="post"):
@@ -30,8 +182,8 @@ class QuotaTracker:
         if not isinstance(user, int):
             username = user.username
         else:
-            # Try to get the username from the database for logging
-            user_obj = User.query.get(user_id)
+            # Try to get the username for logging, usually without a query
+            user_obj = UserCache.get(user_id)
             if user_obj:
                 username = user_obj.username
 
@@ -40,63 +192,36 @@ class QuotaTracker:
         else:
             current_app.logger.info(f"Tracking API call for user ID {user_id}, type: {call_type}")
 
-        now = datetime.utcnow()
-        current_month = now.month
-        current_year = now.year
+        period = QuotaTracker.get_period()
 
-        # Calculate reset date (first day of next month)
-        if current_month == 12:
-            reset_month = 1
-            reset_year = current_year + 1
+        if call_type in QuotaTracker.READ_ONLY_CALL_TYPES:
+            if current_app.config.get('QUOTA_WRITE_BEHIND'):
+                QuotaTracker._defer_read(user_id, period)
+                return QuotaTracker.get_quota_status(user_id)
+            QuotaTracker._increment(user_id, period, reads=1)
         else:
-            reset_month = current_month + 1
-            reset_year = current_year
-
-        # Format reset date as YYYY-MM-DD string for storage
-        reset_date_str = f"{reset_year}-{reset_month:02d}-01"
-        # Parse for return value
-        reset_date = datetime.strptime(reset_date_str, "%Y-%m-%d")
-
-        # Get or create quota usage for current month
-        quota = QuotaUsage.query.filter_by(
-            user_id=user_id,
-            month=current_month,
-            year=current_year
-        ).first()
-
-        if not quota:
-            # Create a new quota usage record
-            quota = QuotaUsage()
-            quota.user_id = user_id
-            quota.month = current_month
-            quota.year = current_year
-            quota.posts_used = 0
-            quota.reset_date = reset_date_str
-            db.session.add(quota)
-
-        # Update posts used based on call type
-        if call_type == "post":
-            quota.posts_used += 1
+            # Only posts count against the monthly limit
+            QuotaTracker._increment(user_id, period, posts=1 if call_type == "post" else 0)
 
         db.session.commit()
+        QuotaTracker.invalidate(user_id)
+        return QuotaTracker.get_quota_status(user_id)
 
-        # Calculate percentage used
-        percentage = min(round((quota.posts_used / QuotaTracker.MONTHLY_LIMIT) * 100), 100)
-
-        return {
-            "posts_used": quota.posts_used,
-            "monthly_limit": QuotaTracker.MONTHLY_LIMIT,
-            "percentage": percentage,
-            "reset_date": reset_date
-        }
+    @staticmethod
+    def invalidate(user):
+        """Drop the cached quota snapshot of a user (or user_id)."""
+        user_id = user if isinstance(user, int) else user.id
+        with QuotaTracker._status_lock:
+            QuotaTracker._status_cache.pop(user_id, None)
 
     @staticmethod
-    def get_quota_status(user):
+    def get_quota_status(user, fresh=False):
         """
         Get the current quota status for a user.
 
         Args:
             user: The user or user_id to check quota for
+            fresh: Bypass the cached snapshot, e.g. before admitting a post
 
         Returns:
             dict: Information about quota status
@@ -104,40 +229,26 @@ class QuotaTracker:
         # Handle both user object and user_id
         user_id = user if isinstance(user, int) else user.id
 
-        now = datetime.utcnow()
-        current_month = now.month
-        current_year = now.year
-
-        # Calculate reset date (first day of next month)
-        if current_month == 12:
-            reset_month = 1
-            reset_year = current_year + 1
-        else:
-            reset_month = current_month + 1
-            reset_year = current_year
+        month, year, reset_date_str, _, reset_date = QuotaTracker._get_period()
 
-        # Format reset date as YYYY-MM-DD string for storage
-        reset_date_str = f"{reset_year}-{reset_month:02d}-01"
-        # Parse for return value
-        reset_date = datetime.strptime(reset_date_str, "%Y-%m-%d")
+        if not fresh:
+            with QuotaTracker._status_lock:
+                entry = QuotaTracker._status_cache.get(user_id)
+            # Snapshots from an earlier period are stale even within their TTL
+            if entry and entry[0] > time.monotonic() and entry[1] == reset_date:
+                return dict(entry[2])
 
         # Get or create quota usage for current month
         quota = QuotaUsage.query.filter_by(
             user_id=user_id,
-            month=current_month,
-            year=current_year
+            month=month,
+            year=year
         ).first()
 
         if not quota:
-            # Create a new quota usage record
-            quota = QuotaUsage()
-            quota.user_id = user_id
-            quota.month = current_month
-            quota.year = current_year
-            quota.posts_used = 0
-            quota.reset_date = reset_date_str
-            db.session.add(quota)
+            QuotaTracker._ensure_quota(user_id, month, year, reset_date_str)
             db.session.commit()
+            quota = QuotaUsage.query.filter_by(user_id=user_id, month=month, year=year).first()
 
         # Calculate percentage used
         percentage = min(round((quota.posts_used / QuotaTracker.MONTHLY_LIMIT) * 100), 100)
@@ -145,9 +256,244 @@ class QuotaTracker:
         # Convert string date from database to datetime for the return
         quota_reset_date = datetime.strptime(quota.reset_date, "%Y-%m-%d") if quota.reset_date else reset_date
 
-        return {
+        status = {
             "posts_used": quota.posts_used,
             "monthly_limit": QuotaTracker.MONTHLY_LIMIT,
             "percentage": percentage,
             "reset_date": quota_reset_date
         }
+
+        ttl = current_app.config.get('QUOTA_CACHE_TTL', QuotaTracker.CACHE_TTL)
+        with QuotaTracker._status_lock:
+            QuotaTracker._status_cache[user_id] = (time.monotonic() + ttl, reset_date, status)
+
+        return dict(status)
+
+    @staticmethod
+    def reserve(user, post_id=None):
+        """
+        Reserve one post from a user's monthly quota before publishing.
+
+        Args:
+            user: The user or user_id publishing
+            post_id: The post being published, for bookkeeping
+
+        Returns:
+            int: Reservation id, or None if the quota is used up
+        """
+        user_id = user if isinstance(user, int) else user.id
+        month, year, reset_date_str = QuotaTracker.get_period()
+        now = datetime.utcnow()
+
+        QuotaTracker.expire_reservations(now, user_id=user_id)
+        QuotaTracker._ensure_quota(user_id, month, year, reset_date_str)
+
+        # Succeeds only while a unit is free, however many workers race for it
+        result = db.session.execute(
+            update(QuotaUsage)
+            .where(
+                QuotaUsage.user_id == user_id,
+                QuotaUsage.month == month,
+                QuotaUsage.year == year,
+                QuotaUsage.posts_used + QuotaUsage.posts_reserved < QuotaTracker.MONTHLY_LIMIT
+            )
+            .values(posts_reserved=QuotaUsage.posts_reserved + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            db.session.commit()
+            return None
+
+        ttl = current_app.config.get('QUOTA_RESERVATION_TTL', QuotaTracker.RESERVATION_TTL)
+        reservation = QuotaReservation(
+            user_id=user_id,
+            post_id=post_id,
+            month=month,
+            year=year,
+            expires_at=now + timedelta(seconds=ttl)
+        )
+        db.session.add(reservation)
+        db.session.commit()
+
+        QuotaTracker.invalidate(user_id)
+        return reservation.id
+
+    @staticmethod
+    def _close_reservation(reservation_id, used):
+        """Delete a reservation and move its unit to posts_used (or back). Returns False if it was gone."""
+        reservation = db.session.get(QuotaReservation, reservation_id)
+        if not reservation:
+            return False
+
+        # Only the caller that deletes the row adjusts the counters
+        deleted = db.session.execute(
+            delete(QuotaReservation)
+            .where(QuotaReservation.id == reservation_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not deleted:
+            return False
+
+        db.session.execute(
+            update(QuotaUsage)
+            .where(
+                QuotaUsage.user_id == reservation.user_id,
+                QuotaUsage.month == reservation.month,
+                QuotaUsage.year == reservation.year
+            )
+            .values(posts_reserved=QuotaUsage.posts_reserved - 1,
+                    posts_used=QuotaUsage.posts_used + (1 if used else 0))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expunge(reservation)
+        return True
+
+    @staticmethod
+    def commit_reservation(reservation_id, user):
+        """
+        Count a reserved post as used after it was published.
+
+        Args:
+            reservation_id: Id returned by reserve()
+            user: The user or user_id the reservation belongs to
+        """
+        user_id = user if isinstance(user, int) else user.id
+
+        if not QuotaTracker._close_reservation(reservation_id, used=True):
+            # The reservation expired mid-publish; the post still counts
+            current_app.logger.warning(f"Quota reservation {reservation_id} expired before it was committed")
+            QuotaTracker._increment(user_id, QuotaTracker.get_period(), posts=1)
+
+        # In the same transaction that drops the reservation, so the post is always counted once
+        QuotaTracker.record_post(user_id)
+        db.session.commit()
+        QuotaTracker.invalidate(user_id)
+
+    @staticmethod
+    def record_post(user, at=None):
+        """
+        Append a published post to the quota event log; the caller commits.
+
+        The user's events older than EVENT_RETENTION are pruned on the way,
+        which keeps the log bounded without a separate cleanup job.
+
+        Args:
+            user: The user or user_id who published
+            at: Publish time (default: current UTC time)
+        """
+        user_id = user if isinstance(user, int) else user.id
+        at = at or datetime.utcnow()
+        retention = timedelta(seconds=QuotaTracker.EVENT_RETENTION)
+
+        db.session.execute(
+            delete(QuotaEvent)
+            .where(QuotaEvent.user_id == user_id, QuotaEvent.created_at < at - retention)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.add(QuotaEvent(user_id=user_id, created_at=at))
+
+    @staticmethod
+    def release_reservation(reservation_id, user):
+        """
+        Return a reserved unit after a publish attempt failed or was deferred.
+
+        Args:
+            reservation_id: Id returned by reserve()
+            user: The user or user_id the reservation belongs to
+        """
+        QuotaTracker._close_reservation(reservation_id, used=False)
+        db.session.commit()
+        QuotaTracker.invalidate(user)
+
+    @staticmethod
+    def expire_reservations(now=None, user_id=None):
+        """
+        Return the units of reservations that outlived their TTL.
+
+        Args:
+            now: Reference time (default: current UTC time)
+            user_id: Only expire this user's reservations
+
+        Returns:
+            int: Number of reservations expired
+        """
+        now = now or datetime.utcnow()
+        query = db.session.query(QuotaReservation.id).filter(QuotaReservation.expires_at < now)
+        if user_id is not None:
+            query = query.filter(QuotaReservation.user_id == user_id)
+
+        expired = 0
+        for (reservation_id,) in query.all():
+            if QuotaTracker._close_reservation(reservation_id, used=False):
+                expired += 1
+
+        if expired:
+            db.session.commit()
+            current_app.logger.warning(f"Expired {expired} abandoned quota reservations")
+        return expired
+
+    @staticmethod
+    def _defer_read(user_id, period):
+        """Count a read-only call in memory until the next flush."""
+        key = (user_id,) + period
+        with QuotaTracker._pending_lock:
+            QuotaTracker._pending_reads[key] = QuotaTracker._pending_reads.get(key, 0) + 1
+
+    @staticmethod
+    def flush_pending():
+        """
+        Write buffered read counts to the database in one transaction.
+
+        Must be called inside an application context.
+
+        Returns:
+            int: Number of read calls flushed
+        """
+        with QuotaTracker._pending_lock:
+            pending = QuotaTracker._pending_reads
+            QuotaTracker._pending_reads = {}
+
+        if not pending:
+            return 0
+
+        try:
+            for (user_id, month, year, reset_date_str), count in pending.items():
+                QuotaTracker._increment(user_id, (month, year, reset_date_str), reads=count)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Put the counts back so they are retried on the next flush
+            with QuotaTracker._pending_lock:
+                for key, count in pending.items():
+                    QuotaTracker._pending_reads[key] = QuotaTracker._pending_reads.get(key, 0) + count
+            raise
+
+        return sum(pending.values())
+
+    @staticmethod
+    def start_write_behind(app):
+        """Flush buffered read counts every QUOTA_FLUSH_INTERVAL seconds, and at exit."""
+        if QuotaTracker._flush_thread:
+            return
+
+        interval = app.config.get('QUOTA_FLUSH_INTERVAL', QuotaTracker.FLUSH_INTERVAL)
+        stopped = threading.Event()
+
+        def flush():
+            with app.app_context():
+                try:
+                    QuotaTracker.flush_pending()
+                except Exception as e:
+                    app.logger.error(f"Error flushing quota counters: {str(e)}")
+
+        def run():
+            while not stopped.wait(interval):
+                flush()
+
+        def stop():
+            stopped.set()
+            flush()
+
+        QuotaTracker._flush_thread = threading.Thread(target=run, name='quota-flush', daemon=True)
+        QuotaTracker._flush_thread.start()
+        atexit.register(stop)
@@ -0,0 +1,231 @@
+"""
+Rate limiting helpers for calls to the 𝕏 API.
+"""
+import re
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import tweepy
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Tokens refill continuously at `rate` per second up to `capacity`, so short
+    bursts of up to `capacity` calls are allowed while the long-run rate never
+    exceeds `rate`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of stored tokens (default: max(1, rate))
+        """
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self):
+        """Number of tokens currently available."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens if they are available right now.
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` will be available."""
+        with self._lock:
+            self._refill()
+            missing = tokens - self._tokens
+            return max(0.0, missing / self.rate)
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available, then take them."""
+        while not self.try_acquire(tokens):
+            time.sleep(self.wait_time(tokens))
+
+
+class RateLimitExceeded(tweepy.TweepyException):
+    """Raised locally, instead of making the call, when an endpoint's budget is exhausted."""
+
+    def __init__(self, endpoint, reset_at):
+        self.endpoint = endpoint
+        self.reset_at = reset_at
+        retry_after = max(0, round(reset_at - time.time()))
+        super().__init__(f"Rate limit for {endpoint} exhausted, resets in {retry_after}s")
+
+
+class RateLimitRegistry:
+    """
+    Last known 𝕏 rate-limit budget per (app, user, endpoint).
+
+    Every pooled client session records the `x-rate-limit-*` headers of its
+    responses here. Callers then call acquire() before a request so a call
+    that would be rejected with a 429 (and still count against the quota)
+    fails locally instead. Each acquire() also takes one call from the local
+    budget so concurrent callers cannot all spend the last remaining call;
+    the next response's headers replace the estimate with the real value.
+
+    Endpoints are identified as "METHOD /path" with ids replaced by
+    placeholders, e.g. "DELETE /2/tweets/:id".
+    """
+
+    CREATE_TWEET = 'POST /2/tweets'
+    DELETE_TWEET = 'DELETE /2/tweets/:id'
+    GET_USER_BY_USERNAME = 'GET /2/users/by/username/:username'
+    VERIFY_CREDENTIALS = 'GET /1.1/account/verify_credentials.json'
+
+    MAX_ENTRIES = 10000  # Expired windows are pruned past this size
+
+    _limits = {}  # (app_key, user_key, endpoint) -> [limit, remaining, reset epoch]
+    _lock = threading.Lock()
+
+    @staticmethod
+    def endpoint_for(method, url):
+        """Normalise a request into its endpoint name."""
+        path = urlsplit(url).path
+        path = re.sub(r'/by/username/[^/]+', '/by/username/:username', path)
+        # Numeric segments after the API version are ids
+        path = re.sub(r'(?<=.)/\d+(?=/|$)', '/:id', path)
+        return f"{method.upper()} {path}"
+
+    @classmethod
+    def record(cls, app_key, user_key, endpoint, headers):
+        """
+        Store the budget reported by a response's rate-limit headers.
+
+        Args:
+            app_key: Consumer key (or bearer token digest) the call was made with
+            user_key: Access token of the user context, or None for app-only auth
+            endpoint: Endpoint name from endpoint_for()
+            headers: Response headers
+        """
+        try:
+            limit = int(headers['x-rate-limit-limit'])
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset_at = int(headers['x-rate-limit-reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        with cls._lock:
+            cls._limits[(app_key, user_key, endpoint)] = [limit, remaining, reset_at]
+            if len(cls._limits) > cls.MAX_ENTRIES:
+                cls._prune(time.time())
+
+    @classmethod
+    def response_hook(cls, app_key, user_key):
+        """Build a `requests` response hook that records rate-limit headers."""
+        def hook(response, *args, **kwargs):
+            endpoint = cls.endpoint_for(response.request.method, response.request.url)
+            cls.record(app_key, user_key, endpoint, response.headers)
+            return response
+        return hook
+
+    @classmethod
+    def _prune(cls, now):
+        """Drop windows that have already reset. Caller holds the lock."""
+        for key in [key for key, entry in cls._limits.items() if entry[2] <= now]:
+            del cls._limits[key]
+
+    @classmethod
+    def check(cls, app_key, user_key, endpoint):
+        """
+        Seconds until a call to `endpoint` would be accepted.
+
+        Returns:
+            float: 0.0 if the call can be made now
+        """
+        now = time.time()
+        with cls._lock:
+            entry = cls._limits.get((app_key, user_key, endpoint))
+            if not entry or entry[2] <= now or entry[1] > 0:
+                return 0.0
+            return entry[2] - now
+
+    @classmethod
+    def acquire(cls, app_key, user_key, endpoint):
+        """
+        Take one call from the local budget.
+
+        Raises:
+            RateLimitExceeded: If the budget is exhausted until the window resets
+        """
+        now = time.time()
+        with cls._lock:
+            key = (app_key, user_key, endpoint)
+            entry = cls._limits.get(key)
+            if not entry:
+                return
+            if entry[2] <= now:
+                # Window has reset; the next response will report the new budget
+                del cls._limits[key]
+                return
+            if entry[1] <= 0:
+                raise RateLimitExceeded(endpoint, entry[2])
+            entry[1] -= 1
+
+    @classmethod
+    def get_budget(cls, app_key, user_key):
+        """
+        Current budget of every endpoint seen for an app/user pair.
+
+        Returns:
+            list: Dicts with endpoint, limit, remaining and reset_at (UTC datetime)
+        """
+        now = time.time()
+        with cls._lock:
+            entries = [
+                (key[2], entry[:]) for key, entry in cls._limits.items()
+                if key[0] == app_key and key[1] == user_key and entry[2] > now
+            ]
+
+        return [
+            {
+                "endpoint": endpoint,
+                "limit": limit,
+                "remaining": max(0, remaining),
+                "reset_at": datetime.utcfromtimestamp(reset_at)
+            }
+            for endpoint, (limit, remaining, reset_at) in sorted(entries)
+        ]
+
+    @classmethod
+    def forget(cls, app_key, user_key):
+        """Drop every budget recorded for an app/user pair (e.g. after token rotation)."""
+        with cls._lock:
+            for key in [key for key in cls._limits if key[0] == app_key and key[1] == user_key]:
+                del cls._limits[key]
+
+    @classmethod
+    def clear(cls):
+        """Drop every recorded budget."""
+        with cls._lock:
+            cls._limits.clear()
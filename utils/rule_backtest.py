@@ -0,0 +1,258 @@
+"""
+Backtesting of 𝕏 filtered-stream rules against stored stream results.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import create_engine, func, select
+
+from app.models import db, Stream, StreamResult
+from utils.rule_matcher import RuleCompiler, RuleMatcher
+from utils.stream_archive import StreamArchive
+
+_engines = {}  # database URL -> engine, one per worker process
+_pool = None  # Worker pool shared by every backtest run in this process
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """
+    Return the process-wide worker pool, starting it on first use.
+
+    Spawned rather than forked: the web process runs threads that must not be
+    copied mid-flight. Spawning is slow (each worker starts a fresh
+    interpreter), so the pool is kept for the life of the process instead of
+    being started for every run.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool():
+    """Drop a pool that can no longer run tasks (e.g. a worker was killed)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _match_rows(rules, rows, sample_size):
+    """
+    Match the rules against (id, post_id, post_text, created_at, data) rows.
+
+    Returns:
+        dict: scanned row count, hit posts as {post_id: (hour, matched rule
+            indexes)} and the newest `sample_size` hits
+    """
+    matcher = RuleMatcher()
+    matcher.load({index: [rule] for index, rule in enumerate(rules)})
+
+    scanned = 0
+    hits = {}
+    sample = []
+    for row_id, post_id, post_text, created_at, data in rows:
+        scanned += 1
+        post = dict(data or {})
+        post['text'] = post_text
+        matched = matcher.match(post)
+        if not matched or post_id in hits:
+            continue
+
+        hour = created_at.strftime('%Y-%m-%dT%H:00') if created_at else None
+        hits[post_id] = (hour, tuple(matched))
+        sample.append((row_id, post_id, post_text, created_at))
+        if len(sample) > sample_size:
+            sample.pop(0)
+
+    return {'scanned': scanned, 'hits': hits, 'sample': sample}
+
+
+def _scan_rows(conn, rules, start_id, end_id, stream_ids, since, sample_size):
+    """Match the rules against the results with ids in [start_id, end_id]."""
+    table = StreamResult.__table__
+    query = select(table.c.id, table.c.post_id, table.c.post_text, table.c.created_at, table.c.data).where(
+        table.c.id.between(start_id, end_id)
+    )
+    if stream_ids is not None:
+        query = query.where(table.c.stream_id.in_(stream_ids))
+    if since is not None:
+        query = query.where(table.c.created_at >= since)
+
+    return _match_rows(rules, conn.execution_options(yield_per=5000).execute(query), sample_size)
+
+
+def _scan_shard(database_url, rules, start_id, end_id, stream_ids, since, sample_size):
+    """
+    Run _scan_rows in a worker process.
+
+    Only takes picklable arguments and opens the worker's own database connection.
+    """
+    engine = _engines.get(database_url)
+    if engine is None:
+        engine = _engines[database_url] = create_engine(database_url)
+
+    with engine.connect() as conn:
+        return _scan_rows(conn, rules, start_id, end_id, stream_ids, since, sample_size)
+
+
+def _scan_segment(archive_dir, path, rules, since, sample_size):
+    """Match the rules against one archive segment, in a worker process."""
+    records = StreamArchive.read_segment(archive_dir, path, since=since)
+    rows = (
+        (record['id'], record['post_id'], record['post_text'], record['created_at'], record['data'])
+        for record in records
+    )
+    return _match_rows(rules, rows, sample_size)
+
+
+class RuleBacktest:
+    """
+    Estimates the traffic a candidate rule set would have captured.
+
+    The stored `stream_results` are split into id ranges that, together with
+    any archive segments in the time range, are matched in parallel by a
+    shared pool of worker processes (BACKTEST_WORKERS, default one per CPU),
+    each running the same RuleMatcher that tags live posts. Small inputs, up
+    to INLINE_ROWS results, are matched in the calling process, where handing
+    them to the pool would cost more than the scan. A post stored for several
+    streams is counted once.
+    """
+
+    SHARDS_PER_WORKER = 4  # Smaller shards balance the load between workers
+    INLINE_ROWS = 20000  # Results scanned in-process rather than by the pool
+    SAMPLE_SIZE = 20  # Matched posts returned as examples
+
+    @staticmethod
+    def validate(rules):
+        """
+        Check that every rule parses.
+
+        Raises:
+            RuleSyntaxError: For the first malformed rule
+        """
+        for rule in rules:
+            RuleCompiler.parse(rule)
+
+    @classmethod
+    def shard(cls, min_id, max_id, count):
+        """Split [min_id, max_id] into at most `count` contiguous id ranges."""
+        size = max(1, -(-(max_id - min_id + 1) // count))
+        return [(start, min(start + size - 1, max_id)) for start in range(min_id, max_id + 1, size)]
+
+    @classmethod
+    def run(cls, rules, user_id=None, days=None, workers=None, sample_size=None):
+        """
+        Run rules over the stored stream results, live and archived.
+
+        Must be called inside an application context.
+
+        Args:
+            rules: List of rule strings
+            user_id: Only scan results of this user's streams (default: all)
+            days: Only scan results received in the last `days` days (default: all)
+            workers: Worker processes (default: BACKTEST_WORKERS or the CPU count);
+                only used when the process-wide pool is first started
+            sample_size: Number of matched posts to return (default: SAMPLE_SIZE)
+
+        Returns:
+            dict: rules, scanned, hits (distinct posts), hits_by_rule (one
+                count per rule, in the order of `rules`, so repeated rules are
+                reported separately), hits_per_hour (sorted
+                "YYYY-MM-DDTHH:00" -> hits), sample (newest matches) and
+                elapsed seconds
+
+        Raises:
+            RuleSyntaxError: If a rule is malformed
+        """
+        started = datetime.utcnow()
+        rules = [rule.strip() for rule in rules if rule and rule.strip()]
+        cls.validate(rules)
+        sample_size = sample_size or cls.SAMPLE_SIZE
+        workers = workers or current_app.config.get('BACKTEST_WORKERS') or os.cpu_count() or 1
+        since = datetime.utcnow() - timedelta(days=days) if days else None
+
+        stream_ids = None
+        bounds = db.session.query(func.min(StreamResult.id), func.max(StreamResult.id))
+        if user_id is not None:
+            stream_ids = [stream_id for stream_id, in db.session.query(Stream.id).filter(Stream.user_id == user_id)]
+            bounds = bounds.filter(StreamResult.stream_id.in_(stream_ids))
+        min_id, max_id = bounds.one()
+        segments = StreamArchive.segments_for(stream_ids, since=since)
+
+        result = {
+            'rules': rules,
+            'scanned': 0,
+            'hits': 0,
+            'hits_by_rule': [0] * len(rules),
+            'hits_per_hour': {},
+            'sample': []
+        }
+        if not rules or (min_id is None and not segments):
+            result['elapsed'] = 0.0
+            return result
+
+        archive_dir = StreamArchive.archive_dir()
+        # Id ranges can have gaps, so this overestimates the live rows
+        estimate = (max_id - min_id + 1 if min_id is not None else 0) + sum(segment.row_count for segment in segments)
+
+        if workers <= 1 or estimate <= cls.INLINE_ROWS:
+            parts = [_scan_segment(archive_dir, segment.path, rules, since, sample_size) for segment in segments]
+            if min_id is not None:
+                with db.engine.connect() as conn:
+                    parts.append(_scan_rows(conn, rules, min_id, max_id, stream_ids, since, sample_size))
+        else:
+            shards = cls.shard(min_id, max_id, workers * cls.SHARDS_PER_WORKER) if min_id is not None else []
+            database_url = db.engine.url.render_as_string(hide_password=False)
+            pool = _get_pool(workers)
+            try:
+                futures = [
+                    pool.submit(_scan_shard, database_url, rules, start, end, stream_ids, since, sample_size)
+                    for start, end in shards
+                ] + [
+                    pool.submit(_scan_segment, archive_dir, segment.path, rules, since, sample_size)
+                    for segment in segments
+                ]
+                parts = [future.result() for future in futures]
+            except BrokenProcessPool:
+                _reset_pool()
+                raise
+
+        hits = {}
+        for part in parts:
+            result['scanned'] += part['scanned']
+            for post_id, hit in part['hits'].items():
+                hits.setdefault(post_id, hit)
+            result['sample'].extend(part['sample'])
+
+        per_hour = {}
+        for hour, matched in hits.values():
+            if hour:
+                per_hour[hour] = per_hour.get(hour, 0) + 1
+            for index in matched:
+                result['hits_by_rule'][index] += 1
+
+        sample = sorted(result['sample'], key=lambda match: match[0], reverse=True)
+        seen = set()
+        result['sample'] = []
+        for _, post_id, text, created_at in sample:
+            if post_id not in seen and len(result['sample']) < sample_size:
+                seen.add(post_id)
+                result['sample'].append({
+                    'post_id': post_id,
+                    'text': text,
+                    'created_at': created_at.isoformat() if created_at else None
+                })
+
+        result['hits'] = len(hits)
+        result['hits_per_hour'] = dict(sorted(per_hour.items()))
+        result['elapsed'] = round((datetime.utcnow() - started).total_seconds(), 3)
+        return result
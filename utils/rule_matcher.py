@@ -0,0 +1,585 @@
+"""
+Local matcher for 𝕏 filtered-stream rules, used to tag posts with every Stream they match.
+"""
+import logging
+import re
+import threading
+from collections import deque
+
+from flask import current_app, has_app_context
+
+
+class RuleSyntaxError(ValueError):
+    """Raised when a rule cannot be parsed."""
+
+
+_TOKEN_PATTERN = re.compile(r'[#@$]?\w+')
+_SIGILS = '#@$'
+
+
+def tokenize(text):
+    """Split text into case-folded words; hashtags, mentions and cashtags keep their sigil."""
+    return _TOKEN_PATTERN.findall((text or '').casefold())
+
+
+def normalize(text):
+    """Canonical form of a literal: its words joined by single spaces."""
+    return ' '.join(tokenize(text))
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton finding every occurrence of many literals in one pass.
+
+    The automaton runs over words rather than characters: a literal is a
+    sequence of one or more words (a keyword, #hashtag or "exact phrase"),
+    so matches always fall on word boundaries ("cat" matches "a cat!" but
+    not "concatenate") and a post costs one dictionary lookup per word.
+    As upstream, a keyword also matches the hashtag, mention or cashtag of
+    the same word ("cat" matches "#cat"), but "#cat" does not match "cat".
+    """
+
+    def __init__(self, literals):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for literal in literals:
+            if not literal:
+                continue
+            state = 0
+            for word in literal.split(' '):
+                next_state = self.goto[state].get(word)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][word] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] = self.output[state] + (literal,)
+
+        # Breadth-first, so every state's fail target is finished before it is used
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for word, next_state in self.goto[state].items():
+                pending.append(next_state)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(word, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, words):
+        """
+        Find the literals that occur in a sequence of words.
+
+        Args:
+            words: Words of the text, as returned by tokenize()
+
+        Returns:
+            set: The literals found
+        """
+        found = self._find(words)
+        # A second pass with the sigils stripped, for keywords that appear as #hashtags or @mentions
+        bare = [word.lstrip(_SIGILS) for word in words]
+        if bare != words:
+            found |= self._find(bare)
+        return found
+
+    def _find(self, words):
+        found = set()
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for word in words:
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class RuleCompiler:
+    """
+    Parser for the 𝕏 filtered-stream rule grammar.
+
+    Supports keywords, "exact phrases", #hashtags, @mentions, $cashtags,
+    implicit AND, OR (which binds looser than AND, as upstream), grouping
+    with parentheses, negation with '-', and operators such as from:, to:,
+    lang:, url:, conversation_id:, is:retweet/reply/quote/verified/nullcast
+    and has:links/mentions/hashtags/media/images/videos/geo.
+
+    Rules compile to nested tuples:
+    ('and', [...]), ('or', [...]), ('not', node), ('literal', text) and
+    ('operator', name, value).
+    """
+
+    # Operators evaluated against the post
+    OPERATORS = {'from', 'to', 'lang', 'url', 'conversation_id', 'is', 'has', 'in_reply_to_tweet_id'}
+    # Upstream operators that need data a post does not carry (user profiles, places,
+    # annotations); they evaluate to unknown, so they never hide a post upstream matched
+    UNCHECKED_OPERATORS = {
+        'bio', 'bio_name', 'bio_location', 'place', 'place_country', 'point_radius', 'bounding_box',
+        'context', 'entity', 'sample', 'followers_count', 'tweets_count', 'following_count',
+        'listed_count', 'url_title', 'url_description', 'url_contains', 'source', 'retweets_of',
+        'retweets_of_tweet_id', 'quotes_of_tweet_id',
+    }
+
+    _TOKEN = re.compile(
+        r'\s*(?:(\()|(\))|(-)?(\w+):"((?:[^"\\]|\\.)*)"|(-)?"((?:[^"\\]|\\.)*)"|(-)?(\()|(-)?([^\s()"]+))'
+    )
+
+    @classmethod
+    def _tokenize(cls, rule):
+        tokens = []
+        position = 0
+        rule = rule.strip()
+        while position < len(rule):
+            match = cls._TOKEN.match(rule, position)
+            if not match or match.end() == position:
+                raise RuleSyntaxError(f"Unexpected character at {position} in rule: {rule!r}")
+            position = match.end()
+            (lparen, rparen, quoted_neg, name, quoted, phrase_neg, phrase,
+             group_neg, neg_lparen, word_neg, word) = match.groups()
+            if lparen:
+                tokens.append(('(', False))
+            elif rparen:
+                tokens.append((')', False))
+            elif name is not None:
+                # An operator with a quoted value, e.g. url:"https://example.com/a b"
+                tokens.append(('word', bool(quoted_neg), name + ':' + quoted.replace('\\"', '"')))
+            elif phrase is not None:
+                tokens.append(('phrase', bool(phrase_neg), phrase.replace('\\"', '"')))
+            elif neg_lparen:
+                tokens.append(('(', bool(group_neg)))
+            elif word:
+                if word == 'OR' and not word_neg:
+                    tokens.append(('OR', False))
+                else:
+                    tokens.append(('word', bool(word_neg), word))
+        return tokens
+
+    @classmethod
+    def parse(cls, rule):
+        """
+        Parse one rule.
+
+        Args:
+            rule: Rule text, e.g. '(cats OR dogs) -is:retweet lang:en'
+
+        Returns:
+            tuple: The rule's syntax tree
+
+        Raises:
+            RuleSyntaxError: If the rule is malformed
+        """
+        tokens = cls._tokenize(rule)
+        if not tokens:
+            raise RuleSyntaxError("Empty rule")
+        node, position = cls._parse_or(tokens, 0)
+        if position != len(tokens):
+            raise RuleSyntaxError(f"Unbalanced ')' in rule: {rule!r}")
+        return node
+
+    @classmethod
+    def _parse_or(cls, tokens, position):
+        nodes = []
+        node, position = cls._parse_and(tokens, position)
+        nodes.append(node)
+        while position < len(tokens) and tokens[position][0] == 'OR':
+            node, position = cls._parse_and(tokens, position + 1)
+            nodes.append(node)
+        return (nodes[0] if len(nodes) == 1 else ('or', nodes)), position
+
+    @classmethod
+    def _parse_and(cls, tokens, position):
+        nodes = []
+        while position < len(tokens) and tokens[position][0] not in ('OR', ')'):
+            node, position = cls._parse_term(tokens, position)
+            nodes.append(node)
+        if not nodes:
+            raise RuleSyntaxError("Expected a term")
+        return (nodes[0] if len(nodes) == 1 else ('and', nodes)), position
+
+    @classmethod
+    def _parse_term(cls, tokens, position):
+        token = tokens[position]
+        kind, negated = token[0], token[1]
+
+        if kind == '(':
+            node, position = cls._parse_or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position][0] != ')':
+                raise RuleSyntaxError("Missing ')'")
+            position += 1
+        elif kind == 'phrase':
+            node = ('literal', normalize(token[2]))
+            position += 1
+        else:
+            node = cls._word(token[2])
+            position += 1
+
+        return (('not', node) if negated else node), position
+
+    @classmethod
+    def _word(cls, word):
+        name, separator, value = word.partition(':')
+        name = name.lower()
+        if separator and value and (name in cls.OPERATORS or name in cls.UNCHECKED_OPERATORS):
+            return ('operator', name, value.strip('"'))
+        return ('literal', normalize(word))
+
+    @classmethod
+    def triggers(cls, node):
+        """
+        Literals of which at least one must occur for the rule to match.
+
+        Returns:
+            set: The literals, or None if the rule can match without any
+                (e.g. it only has operators or negations)
+        """
+        kind = node[0]
+        if kind == 'literal':
+            return {node[1]}
+        if kind == 'and':
+            best = None
+            for child in node[1]:
+                found = cls.triggers(child)
+                if found is not None and (best is None or len(found) < len(best)):
+                    best = found
+            return best
+        if kind == 'or':
+            found = set()
+            for child in node[1]:
+                child_triggers = cls.triggers(child)
+                if child_triggers is None:
+                    return None
+                found |= child_triggers
+            return found
+        return None
+
+    @classmethod
+    def literals(cls, node):
+        """Every literal in a rule."""
+        kind = node[0]
+        if kind == 'literal':
+            return {node[1]}
+        if kind in ('and', 'or'):
+            return set().union(*(cls.literals(child) for child in node[1]))
+        if kind == 'not':
+            return cls.literals(node[1])
+        return set()
+
+
+def _referenced_types(post):
+    # Always requested by the ingestor, and left out by 𝕏 when there are none
+    return {ref.get('type') for ref in post.get('referenced_tweets') or []}
+
+
+def _entities(post, kind):
+    return (post.get('entities') or {}).get(kind)
+
+
+def _known(post, field, check):
+    """check(value of the field), or None (unknown) if the post does not carry the field."""
+    return check(post[field]) if field in post else None
+
+
+def _media_types(post):
+    """Types of the post's media, or None if they are unknown."""
+    if 'media' in post:
+        return {media.get('type') for media in post['media'] or []}
+    if 'attachments' in post and not (post['attachments'] or {}).get('media_keys'):
+        return set()
+    return None
+
+
+def _operator_predicate(name, value):
+    """
+    Build a function of (post, case-folded text) checking one operator.
+
+    Posts are 𝕏 API v2 post objects. The function returns True or False,
+    or None when the post does not carry what the operator needs (a field
+    the stream was not asked for, or data such as user profiles that posts
+    never carry). Unknown is not the same as False: negating it is still
+    unknown, so '-is:verified' cannot reject a post whose author is unknown.
+    """
+    value = value.casefold()
+
+    if name in ('from', 'to'):
+        value = value.lstrip('@')
+        if not value.isdigit():
+            # Posts carry user ids only, not usernames
+            return lambda post, text: None
+        field = 'author_id' if name == 'from' else 'in_reply_to_user_id'
+        return lambda post, text: _known(post, field, lambda user_id: value == str(user_id or ''))
+    if name == 'lang':
+        return lambda post, text: _known(post, 'lang', lambda lang: value == str(lang or '').casefold())
+    if name == 'conversation_id':
+        return lambda post, text: _known(post, 'conversation_id', lambda conversation: value == str(conversation))
+    if name == 'in_reply_to_tweet_id':
+        return lambda post, text: any(
+            ref.get('type') == 'replied_to' and str(ref.get('id')) == value
+            for ref in post.get('referenced_tweets') or []
+        )
+    if name == 'url':
+        def check_url(post, text):
+            if value in text:
+                return True
+            # Links in the text are shortened; only the entities have the full URL
+            return _known(post, 'entities', lambda entities: any(
+                value in (url.get('expanded_url') or url.get('url') or '').casefold()
+                for url in (entities or {}).get('urls') or []
+            ))
+        return check_url
+    if name == 'is':
+        reference = {'retweet': 'retweeted', 'reply': 'replied_to', 'quote': 'quoted'}.get(value)
+        if reference:
+            return lambda post, text: reference in _referenced_types(post)
+        if value == 'verified':
+            return lambda post, text: _known(post, 'author_verified', bool)
+        if value == 'nullcast':
+            # Promoted-only posts are never delivered by the stream, so no stored post is one
+            return lambda post, text: False
+    if name == 'has':
+        if value == 'links':
+            return lambda post, text: bool(_entities(post, 'urls')) or 'http://' in text or 'https://' in text
+        if value in ('mentions', 'hashtags'):
+            sigil = re.compile(r'(?:^|\W)' + ('@' if value == 'mentions' else '#') + r'\w')
+            return lambda post, text: bool(_entities(post, value)) or sigil.search(text) is not None
+        if value == 'media':
+            return lambda post, text: _known(
+                post, 'attachments', lambda attachments: bool((attachments or {}).get('media_keys'))
+            )
+        if value in ('images', 'videos'):
+            wanted = {'photo'} if value == 'images' else {'video', 'animated_gif'}
+            def check_media(post, text):
+                types = _media_types(post)
+                return None if types is None else not types.isdisjoint(wanted)
+            return check_media
+        if value == 'geo':
+            return lambda post, text: _known(post, 'geo', bool)
+
+    # Not checkable from the post alone
+    return lambda post, text: None
+
+
+def compile_predicate(node):
+    """
+    Turn a syntax tree into a function of (found literals, post, case-folded text).
+
+    The function returns True, False or None (unknown, see
+    _operator_predicate()), combined the way SQL combines NULLs: NOT
+    unknown is unknown, AND is False if any child is False, OR is True if
+    any child is True. A rule matches unless it is definitely False.
+
+    Dispatching on node types happens once here instead of on every post,
+    and the literal children of AND/OR nodes are checked with one set
+    operation.
+    """
+    kind = node[0]
+    if kind == 'literal':
+        literal = node[1]
+        return lambda found, post, text: literal in found
+    if kind == 'not':
+        child = compile_predicate(node[1])
+
+        def negation(found, post, text):
+            result = child(found, post, text)
+            return None if result is None else not result
+        return negation
+    if kind == 'operator':
+        check = _operator_predicate(node[1], node[2])
+        return lambda found, post, text: check(post, text)
+
+    literals = frozenset(child[1] for child in node[1] if child[0] == 'literal')
+    others = [compile_predicate(child) for child in node[1] if child[0] != 'literal']
+
+    if kind == 'and':
+        def predicate(found, post, text):
+            if not literals <= found:
+                return False
+            result = True
+            for child in others:
+                value = child(found, post, text)
+                if value is False:
+                    return False
+                if value is None:
+                    result = None
+            return result
+    else:
+        def predicate(found, post, text):
+            if not literals.isdisjoint(found):
+                return True
+            result = False
+            for child in others:
+                value = child(found, post, text)
+                if value:
+                    return True
+                if value is None:
+                    result = None
+            return result
+    return predicate
+
+
+class _CompiledRules:
+    """Immutable snapshot of every stream's compiled rules, swapped in whole by RuleMatcher."""
+
+    def __init__(self, streams):
+        """
+        Args:
+            streams: stream_id -> list of (predicate, literals, trigger literals) per rule
+        """
+        self.rules = []  # (stream_id, compiled predicate)
+        self.by_literal = {}  # trigger literal -> indexes into self.rules
+        self.always = []  # indexes of rules without trigger literals
+        literals = set()
+
+        for stream_id, rules in streams.items():
+            for predicate, rule_literals, triggers in rules:
+                index = len(self.rules)
+                self.rules.append((stream_id, predicate))
+                literals |= rule_literals
+                if triggers is None:
+                    self.always.append(index)
+                else:
+                    for literal in triggers:
+                        self.by_literal.setdefault(literal, []).append(index)
+
+        self.automaton = AhoCorasick(sorted(literals))
+
+    def match(self, post):
+        text = (post.get('text') or '').casefold()
+        found = self.automaton.find(tokenize(text))
+
+        candidates = set(self.always)
+        for literal in found:
+            candidates.update(self.by_literal.get(literal, ()))
+
+        matched = set()
+        for index in candidates:
+            stream_id, predicate = self.rules[index]
+            if stream_id not in matched and predicate(found, post, text) is not False:
+                matched.add(stream_id)
+        return matched
+
+
+class RuleMatcher:
+    """
+    Classifies posts against the rules of many streams at once.
+
+    Every literal of every rule goes into one Aho-Corasick automaton, so a
+    post's text is scanned once however many rules there are. Each rule is
+    indexed by a small set of literals of which one must occur for it to
+    match, so only rules whose literals were found (plus the few made only
+    of operators or negations) are evaluated.
+
+    Rules are compiled per stream and kept until that stream's rules change;
+    sync() and update_stream() only recompile streams that changed and then
+    swap in a new index and automaton. match() is safe to call from other threads
+    while the matcher is being updated.
+    """
+
+    def __init__(self):
+        self._sources = {}  # stream_id -> rules as given, to detect changes
+        self._rules = {}  # stream_id -> list of (predicate, literals, trigger literals)
+        self._compiled = _CompiledRules({})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _rule_values(rules):
+        for rule in rules or []:
+            value = rule.get('value') if isinstance(rule, dict) else rule
+            if value and value.strip():
+                yield value.strip()
+
+    def _compile(self, stream_id, rules):
+        compiled = []
+        for value in self._rule_values(rules):
+            try:
+                tree = RuleCompiler.parse(value)
+            except RuleSyntaxError as e:
+                # Upstream rejects the same rule, so skipping it here keeps both sides in step
+                logger = current_app.logger if has_app_context() else logging.getLogger(__name__)
+                logger.warning(f"Skipping rule of stream {stream_id}: {str(e)}")
+                continue
+            compiled.append((compile_predicate(tree), RuleCompiler.literals(tree), RuleCompiler.triggers(tree)))
+        return compiled
+
+    def _rebuild(self):
+        self._compiled = _CompiledRules(dict(self._rules))
+
+    def update_stream(self, stream_id, rules):
+        """
+        Set (or replace) the rules of one stream.
+
+        Args:
+            stream_id: The Stream's id
+            rules: The Stream's rules_list
+        """
+        with self._lock:
+            if self._sources.get(stream_id) == rules:
+                return
+            self._sources[stream_id] = list(rules)
+            self._rules[stream_id] = self._compile(stream_id, rules)
+            self._rebuild()
+
+    def remove_stream(self, stream_id):
+        """Stop matching a stream."""
+        with self._lock:
+            if self._sources.pop(stream_id, None) is not None:
+                self._rules.pop(stream_id, None)
+                self._rebuild()
+
+    def sync(self, streams):
+        """
+        Match exactly the given streams, recompiling only those whose rules changed.
+
+        Args:
+            streams: Iterable of active Stream objects
+
+        Returns:
+            int: Number of streams added, changed or removed
+        """
+        return self.load({stream.id: list(stream.rules_list) for stream in streams})
+
+    def load(self, wanted):
+        """
+        Match exactly the given rule sets, recompiling only those that changed.
+
+        Args:
+            wanted: Mapping of key (usually a stream id) -> list of rules
+
+        Returns:
+            int: Number of rule sets added, changed or removed
+        """
+        with self._lock:
+            changed = 0
+            for stream_id in list(self._sources):
+                if stream_id not in wanted:
+                    del self._sources[stream_id]
+                    del self._rules[stream_id]
+                    changed += 1
+            for stream_id, rules in wanted.items():
+                if self._sources.get(stream_id) != rules:
+                    self._sources[stream_id] = rules
+                    self._rules[stream_id] = self._compile(stream_id, rules)
+                    changed += 1
+            if changed:
+                self._rebuild()
+            return changed
+
+    def match(self, post):
+        """
+        Find every stream whose rules match a post.
+
+        Args:
+            post: 𝕏 API v2 post object (dict with text and, when requested,
+                author_id, lang, entities, referenced_tweets...)
+
+        Returns:
+            set: Ids of the matching streams
+        """
+        return self._compiled.match(post)
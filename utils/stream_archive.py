@@ -0,0 +1,441 @@
+"""
+Tiered storage for 𝕏 stream results: old rows move out of the hot
+`stream_results` table into compressed, append-only segment files.
+"""
+import gzip
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import chain
+
+try:
+    import fcntl
+except ImportError:  # Windows: overlapping rollovers are only kept apart by prune()'s grace period
+    fcntl = None
+
+from flask import current_app
+from sqlalchemy import delete, select
+
+from app.models import db, json_serializer, json_deserializer, Stream, StreamResult, StreamArchiveSegment
+
+
+def _post_key(post_id):
+    """Sort key of a post id: numerically for 𝕏's digit strings, without overflowing."""
+    return (len(post_id), post_id)
+
+
+class StreamArchive:
+    """
+    Moves stream results older than their stream's retention into segment files.
+
+    A segment holds up to SEGMENT_ROWS results of one stream as gzip-compressed
+    JSON lines, written as independent gzip members of BLOCK_ROWS lines each.
+    A sidecar "<segment>.idx.json" records every block's byte range, time
+    range and post id range, so a read decompresses only the blocks it needs.
+    Each segment also gets a StreamArchiveSegment row with its overall ranges,
+    which is how reads pick segments without touching the disk.
+
+    Files are written (and fsynced) before the transaction that records the
+    segment and deletes the archived rows, so a crash can leave an unrecorded
+    file but never lose a result; unrecorded files are removed by a later
+    rollover once they are PRUNE_GRACE seconds old. Segments are never
+    modified once written, and hold their results in id order. Rollovers take
+    a lock file in the archive directory, so overlapping runs (e.g. two cron
+    jobs) skip instead of pruning each other's files in progress. Readers
+    that need results to stay where they are (exports) hold the same lock
+    shared through paused(), which makes rollovers skip until they finish.
+
+    Retention is Stream.retention_days, falling back to STREAM_RETENTION_DAYS;
+    0 keeps a stream's results in the table forever.
+    """
+
+    RETENTION_DAYS = 30  # Default days results stay in stream_results
+    SEGMENT_ROWS = 50000  # Results per segment file
+    BLOCK_ROWS = 1000  # Results per independently compressed block
+    DELETE_CHUNK = 500  # Ids per DELETE statement
+    PRUNE_GRACE = 3600  # Seconds before an unrecorded file counts as left behind
+
+    LOCK_NAME = '.rollover.lock'
+
+    SEGMENT_SUFFIX = '.jsonl.gz'
+    INDEX_SUFFIX = '.idx.json'
+
+    @staticmethod
+    def archive_dir():
+        """Directory holding the segment files (STREAM_ARCHIVE_DIR)."""
+        return current_app.config.get('STREAM_ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'stream_archive')
+
+    @classmethod
+    def retention_for(cls, stream):
+        """Days a stream's results stay in stream_results, or 0 to keep them there."""
+        if stream.retention_days is not None:
+            return stream.retention_days
+        return current_app.config.get('STREAM_RETENTION_DAYS', cls.RETENTION_DAYS)
+
+    # Writing
+
+    @classmethod
+    @contextmanager
+    def _locked(cls, shared=False):
+        """
+        Hold the rollover lock; yields whether it was acquired.
+
+        Exclusive (rollovers) fails at once if the lock is held. Shared
+        (readers) waits for a running rollover, and never fails.
+        """
+        root = cls.archive_dir()
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, cls.LOCK_NAME), 'a') as f:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @classmethod
+    @contextmanager
+    def paused(cls):
+        """Keep rollovers from moving results between the table and the archive meanwhile."""
+        with cls._locked(shared=True):
+            yield
+
+    @classmethod
+    def rollover(cls, now=None):
+        """
+        Archive every stream's results that are older than its retention.
+
+        Does nothing if another rollover is running, or while a reader holds
+        paused(). Must be called inside an application context.
+
+        Args:
+            now: Reference time for the retention cutoff (default: now)
+
+        Returns:
+            dict: Stream id -> number of results archived, for streams with any
+        """
+        now = now or datetime.utcnow()
+
+        archived = {}
+        with cls._locked() as acquired:
+            if not acquired:
+                current_app.logger.warning("Stream archive rollover already running or paused by an export, skipping")
+                return archived
+
+            cls.prune()
+            for stream in Stream.query.order_by(Stream.id).all():
+                days = cls.retention_for(stream)
+                if not days or days <= 0:
+                    continue
+                count = cls.archive_stream(stream.id, now - timedelta(days=days))
+                if count:
+                    archived[stream.id] = count
+
+        if archived:
+            current_app.logger.info(f"Archived {sum(archived.values())} stream results from {len(archived)} streams")
+        return archived
+
+    @classmethod
+    def archive_stream(cls, stream_id, cutoff):
+        """
+        Move one stream's results received before `cutoff` into new segments.
+
+        Must be called inside an application context.
+
+        Returns:
+            int: Number of results archived
+        """
+        table = StreamResult.__table__
+        query = (
+            select(table.c.id, table.c.post_id, table.c.post_text, table.c.author_id, table.c.created_at, table.c.data)
+            .where(table.c.stream_id == stream_id, table.c.created_at < cutoff)
+            .order_by(table.c.id)
+            .limit(cls.SEGMENT_ROWS)
+        )
+
+        total = 0
+        while True:
+            rows = db.session.execute(query).all()
+            if not rows:
+                return total
+
+            segment, paths = cls._write_segment(stream_id, rows)
+            try:
+                db.session.add(segment)
+                ids = [row.id for row in rows]
+                for start in range(0, len(ids), cls.DELETE_CHUNK):
+                    db.session.execute(delete(StreamResult).where(StreamResult.id.in_(ids[start:start + cls.DELETE_CHUNK])))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for path in paths:
+                    os.remove(path)
+                raise
+
+            total += len(rows)
+            if len(rows) < cls.SEGMENT_ROWS:
+                return total
+
+    @classmethod
+    def _write_segment(cls, stream_id, rows):
+        """Write rows to a new segment and its index; returns (unsaved StreamArchiveSegment, file paths)."""
+        base = os.path.join(str(stream_id), f"{min(row.id for row in rows):012d}-{max(row.id for row in rows):012d}")
+        segment_path = os.path.join(cls.archive_dir(), base + cls.SEGMENT_SUFFIX)
+        index_path = os.path.join(cls.archive_dir(), base + cls.INDEX_SUFFIX)
+        os.makedirs(os.path.dirname(segment_path), exist_ok=True)
+
+        blocks = []
+        with open(segment_path + '.tmp', 'wb') as f:
+            for start in range(0, len(rows), cls.BLOCK_ROWS):
+                block = rows[start:start + cls.BLOCK_ROWS]
+                lines = [json_serializer({
+                    'id': row.id,
+                    'post_id': row.post_id,
+                    'post_text': row.post_text,
+                    'author_id': row.author_id,
+                    'created_at': row.created_at.isoformat() if row.created_at else None,
+                    'data': row.data
+                }) for row in block]
+                compressed = gzip.compress(('\n'.join(lines) + '\n').encode(), mtime=0)
+
+                times = [row.created_at.isoformat() for row in block if row.created_at]
+                post_ids = sorted((row.post_id for row in block), key=_post_key)
+                blocks.append({
+                    'offset': f.tell(),
+                    'length': len(compressed),
+                    'rows': len(block),
+                    'min_created_at': min(times) if times else None,
+                    'max_created_at': max(times) if times else None,
+                    'min_post_id': post_ids[0],
+                    'max_post_id': post_ids[-1]
+                })
+                f.write(compressed)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump({'format': 1, 'stream_id': stream_id, 'rows': len(rows), 'blocks': blocks}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(segment_path + '.tmp', segment_path)
+        os.replace(index_path + '.tmp', index_path)
+
+        times = [row.created_at for row in rows if row.created_at]
+        post_ids = sorted((row.post_id for row in rows), key=_post_key)
+        segment = StreamArchiveSegment(
+            stream_id=stream_id,
+            path=base + cls.SEGMENT_SUFFIX,
+            row_count=len(rows),
+            min_created_at=min(times) if times else datetime.min,
+            max_created_at=max(times) if times else datetime.min,
+            min_post_id=post_ids[0],
+            max_post_id=post_ids[-1]
+        )
+        return segment, [segment_path, index_path]
+
+    @classmethod
+    def prune(cls, grace=None):
+        """
+        Delete segment files no StreamArchiveSegment refers to (left by a crash,
+        or by a deleted stream).
+
+        Files modified in the last `grace` seconds are kept: they may belong to
+        a segment whose transaction has not committed yet.
+
+        Must be called inside an application context.
+
+        Args:
+            grace: Minimum age in seconds of a deleted file (default: PRUNE_GRACE)
+
+        Returns:
+            int: Number of files deleted
+        """
+        root = cls.archive_dir()
+        if not os.path.isdir(root):
+            return 0
+
+        grace = cls.PRUNE_GRACE if grace is None else grace
+        known = set(db.session.scalars(select(StreamArchiveSegment.path)))
+        removed = 0
+        for directory, _, files in os.walk(root, topdown=False):
+            for name in files:
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, root)
+                if relative == cls.LOCK_NAME:
+                    continue
+                if relative.endswith(cls.INDEX_SUFFIX):
+                    relative = relative[:-len(cls.INDEX_SUFFIX)] + cls.SEGMENT_SUFFIX
+                if relative not in known and time.time() - os.path.getmtime(path) >= grace:
+                    os.remove(path)
+                    removed += 1
+            if directory != root and not os.listdir(directory):
+                os.rmdir(directory)
+
+        if removed:
+            current_app.logger.warning(f"Removed {removed} unrecorded stream archive files")
+        return removed
+
+    # Reading
+
+    @classmethod
+    def read_segment(cls, root, path, since=None, until=None, post_id=None):
+        """
+        Yield the records of one segment, decompressing only matching blocks.
+
+        Needs no application context, so worker processes can call it.
+
+        Args:
+            root: Archive directory
+            path: Segment path relative to `root`
+            since: Only records received at or after this time
+            until: Only records received before this time
+            post_id: Only records of this post
+
+        Yields:
+            dict: StreamResult column values, with created_at as a datetime
+        """
+        segment_path = os.path.join(root, path)
+        with open(segment_path[:-len(cls.SEGMENT_SUFFIX)] + cls.INDEX_SUFFIX) as f:
+            index = json.load(f)
+
+        since_iso = since.isoformat() if since else None
+        until_iso = until.isoformat() if until else None
+        with open(segment_path, 'rb') as f:
+            for block in index['blocks']:
+                if since_iso and block['max_created_at'] and block['max_created_at'] < since_iso:
+                    continue
+                if until_iso and block['min_created_at'] and block['min_created_at'] >= until_iso:
+                    continue
+                if post_id and not (_post_key(block['min_post_id']) <= _post_key(post_id) <= _post_key(block['max_post_id'])):
+                    continue
+
+                f.seek(block['offset'])
+                for line in gzip.decompress(f.read(block['length'])).splitlines():
+                    record = json_deserializer(line)
+                    created_at = record['created_at']
+                    if (since_iso and (created_at is None or created_at < since_iso)) or \
+                            (until_iso and (created_at is None or created_at >= until_iso)) or \
+                            (post_id and record['post_id'] != post_id):
+                        continue
+                    record['created_at'] = datetime.fromisoformat(created_at) if created_at else None
+                    yield record
+
+    @classmethod
+    def id_range(cls, path):
+        """The (lowest, highest) result id in a segment, from its file name."""
+        first, last = os.path.basename(path)[:-len(cls.SEGMENT_SUFFIX)].split('-')
+        return int(first), int(last)
+
+    @classmethod
+    def segments_for(cls, stream_ids, since=None, until=None, post_id=None):
+        """
+        Segments that may hold results of the given streams (None: all) in the time range.
+
+        Must be called inside an application context.
+
+        Returns:
+            list: StreamArchiveSegment rows, oldest first
+        """
+        query = StreamArchiveSegment.query
+        if stream_ids is not None:
+            query = query.filter(StreamArchiveSegment.stream_id.in_(stream_ids))
+        if since is not None:
+            query = query.filter(StreamArchiveSegment.max_created_at >= since)
+        if until is not None:
+            query = query.filter(StreamArchiveSegment.min_created_at < until)
+        segments = query.order_by(StreamArchiveSegment.min_created_at, StreamArchiveSegment.id).all()
+        if post_id:
+            key = _post_key(post_id)
+            segments = [
+                segment for segment in segments
+                if _post_key(segment.min_post_id) <= key <= _post_key(segment.max_post_id)
+            ]
+        return segments
+
+    @classmethod
+    def archived_pairs(cls, pairs):
+        """
+        Which (stream_id, post_id) pairs already have a result in the archive.
+
+        Segments are picked by their post id ranges, so a post newer than
+        everything archived for its stream costs no file read, and only the
+        blocks whose range covers a post are decompressed.
+
+        Must be called inside an application context.
+
+        Args:
+            pairs: Iterable of (stream_id, post_id)
+
+        Returns:
+            set: The pairs found in an archive segment
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return set()
+
+        segments = db.session.execute(
+            select(StreamArchiveSegment.stream_id, StreamArchiveSegment.path,
+                   StreamArchiveSegment.min_post_id, StreamArchiveSegment.max_post_id)
+            .where(StreamArchiveSegment.stream_id.in_({stream_id for stream_id, _ in pairs}))
+        ).all()
+
+        root = cls.archive_dir()
+        found = set()
+        for stream_id, path, min_post_id, max_post_id in segments:
+            low, high = _post_key(min_post_id), _post_key(max_post_id)
+            for pair in pairs - found:
+                if pair[0] == stream_id and low <= _post_key(pair[1]) <= high:
+                    if next(cls.read_segment(root, path, post_id=pair[1]), None) is not None:
+                        found.add(pair)
+        return found
+
+    @classmethod
+    def archived_results(cls, stream_id, since=None, until=None, post_id=None):
+        """
+        Stream a stream's archived results, oldest segment first.
+
+        Must be iterated inside an application context.
+
+        Yields:
+            StreamResult: Transient (unsaved) results rebuilt from the archive
+        """
+        root = cls.archive_dir()
+        for segment in cls.segments_for([stream_id], since, until, post_id):
+            for record in cls.read_segment(root, segment.path, since, until, post_id):
+                yield StreamResult(stream_id=stream_id, **record)
+
+    @classmethod
+    def results(cls, stream_id, since=None, until=None, post_id=None):
+        """
+        All of a stream's results, archived and live, in arrival order.
+
+        Archived results come first: they are all older than anything still
+        in the table. Must be iterated inside an application context.
+
+        Args:
+            stream_id: The Stream's id
+            since: Only results received at or after this time
+            until: Only results received before this time
+            post_id: Only results of this post
+
+        Returns:
+            iterator: StreamResult objects (archived ones are transient)
+        """
+        query = StreamResult.query.filter(StreamResult.stream_id == stream_id)
+        if since is not None:
+            query = query.filter(StreamResult.created_at >= since)
+        if until is not None:
+            query = query.filter(StreamResult.created_at < until)
+        if post_id:
+            query = query.filter(StreamResult.post_id == post_id)
+        live = query.order_by(StreamResult.created_at, StreamResult.id).yield_per(1000)
+        return chain(cls.archived_results(stream_id, since, until, post_id), live)
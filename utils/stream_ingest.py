@@ -0,0 +1,481 @@
+"""
+Filtered-stream ingestion for the 𝕏 API v2: keeps the upstream rules in sync
+with active streams and stores matched posts as StreamResult rows.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import requests
+from flask import current_app
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import db, Stream, StreamResult
+from utils.bloom_filter import RotatingBloomFilter
+from utils.rule_matcher import RuleMatcher
+from utils.stream_archive import StreamArchive
+
+
+class StreamIngestor:
+    """
+    Long-running filtered-stream consumer.
+
+    The pipeline has two threads joined by a bounded queue:
+
+    - the reader holds the streaming HTTP connection open and only splits it
+      into lines, so it keeps up with the connection even while the
+      database is busy. It reconnects with the backoff 𝕏 asks for.
+    - the writer drains the queue in batches of up to STREAM_BATCH_SIZE posts
+      (or whatever arrived within STREAM_FLUSH_INTERVAL seconds) and stores
+      each batch with one multi-row INSERT and one commit.
+
+    If the writer falls behind far enough to fill the queue, new posts are
+    dropped and counted rather than stalling the connection, which 𝕏 would
+    disconnect. A batch that fails to store (e.g. the database is locked or
+    restarting) is retried with backoff and only dropped after
+    STORE_ATTEMPTS failures.
+
+    A post is stored once per Stream: reconnects and overlapping rules
+    deliver the same post repeatedly, and a rotating Bloom filter of recently
+    stored (stream, post) pairs drops most repeats before they reach the
+    database. Whatever gets past it is skipped by the unique
+    (stream_id, post_id) index through INSERT ... ON CONFLICT DO NOTHING,
+    or, if its earlier copy has been moved out of the table by StreamArchive,
+    found in the archive segments covering its post id.
+
+    Each active Stream's rules are registered upstream with the tag
+    "<TAG_PREFIX><stream id>", which is how a matched post finds its way
+    back to the Stream. Upstream rules without that prefix are left alone.
+    Every post is also run through a local RuleMatcher, so it is stored for
+    every active Stream whose rules it matches, not only for the rules
+    upstream reported.
+
+    The API base URL is configurable (STREAM_API_URL), so the service can run
+    against a local fake stream server.
+    """
+
+    API_URL = 'https://api.twitter.com/2'
+    BATCH_SIZE = 500  # Posts per INSERT/commit
+    FLUSH_INTERVAL = 1.0  # Seconds a partial batch waits for more posts
+    QUEUE_SIZE = 10000  # Posts buffered between the reader and the writer
+    RULE_SYNC_INTERVAL = 60  # Seconds between rule syncs while running
+    DEDUP_CAPACITY = 1000000  # (stream, post) pairs per Bloom filter generation
+    DEDUP_ERROR_RATE = 1e-6  # Chance a new post is mistaken for a repeat, per generation
+    STORE_ATTEMPTS = 3  # Tries per batch before it is dropped
+    STORE_RETRY_DELAY = 0.5  # Seconds before the first retry, doubled after each failure
+    READ_TIMEOUT = 30  # 𝕏 sends a keep-alive every 20 seconds
+    TAG_PREFIX = 'xpilot-stream:'
+    POST_FIELDS = (
+        'created_at,author_id,lang,conversation_id,referenced_tweets,in_reply_to_user_id,entities,attachments,geo'
+    )
+    # Fields 𝕏 leaves out of a post that has none of them
+    OPTIONAL_FIELDS = ('in_reply_to_user_id', 'entities', 'attachments', 'geo')
+
+    def __init__(self, app, bearer_token=None):
+        self.app = app
+        self.api_url = app.config.get('STREAM_API_URL', self.API_URL).rstrip('/')
+        self.batch_size = app.config.get('STREAM_BATCH_SIZE', self.BATCH_SIZE)
+        self.flush_interval = app.config.get('STREAM_FLUSH_INTERVAL', self.FLUSH_INTERVAL)
+
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {bearer_token or os.environ.get('BEARER_TOKEN')}"
+
+        self.matcher = RuleMatcher()
+        self.recent = RotatingBloomFilter(
+            app.config.get('STREAM_DEDUP_CAPACITY', self.DEDUP_CAPACITY),
+            app.config.get('STREAM_DEDUP_ERROR_RATE', self.DEDUP_ERROR_RATE)
+        )
+        self.queue = queue.Queue(maxsize=app.config.get('STREAM_QUEUE_SIZE', self.QUEUE_SIZE))
+        self.stopped = threading.Event()
+        self.stats = {'received': 0, 'stored': 0, 'duplicates': 0, 'dropped': 0, 'reconnects': 0}
+
+        self._response = None  # Open streaming response, closed by stop()
+        self._reader = None
+        self._writer = None
+
+    # Rules
+
+    @classmethod
+    def tag_for(cls, stream_id):
+        """Upstream rule tag of a Stream."""
+        return f"{cls.TAG_PREFIX}{stream_id}"
+
+    @classmethod
+    def stream_id_for(cls, tag):
+        """Stream id encoded in a rule tag, or None for rules that are not ours."""
+        if not tag or not tag.startswith(cls.TAG_PREFIX):
+            return None
+        try:
+            return int(tag[len(cls.TAG_PREFIX):])
+        except ValueError:
+            return None
+
+    @classmethod
+    def desired_rules(cls, streams):
+        """The (value, tag) pairs the given streams need upstream."""
+        rules = set()
+        for stream in streams:
+            for rule in stream.rules_list:
+                value = rule.get('value') if isinstance(rule, dict) else rule
+                if value:
+                    rules.add((value.strip(), cls.tag_for(stream.id)))
+        return rules
+
+    def sync_rules(self):
+        """
+        Add and delete upstream rules so they match the active streams, and
+        recompile the local matcher for streams whose rules changed.
+
+        Must be called inside an application context.
+
+        Returns:
+            dict: Number of rules added and deleted
+        """
+        response = self.session.get(f"{self.api_url}/tweets/search/stream/rules", timeout=10)
+        response.raise_for_status()
+        current = {
+            (rule['value'], rule.get('tag')): rule['id']
+            for rule in response.json().get('data') or []
+            if self.stream_id_for(rule.get('tag')) is not None
+        }
+        streams = Stream.query.filter_by(active=True).all()
+        self.matcher.sync(streams)
+        desired = self.desired_rules(streams)
+
+        stale_ids = [rule_id for key, rule_id in current.items() if key not in desired]
+        missing = [{'value': value, 'tag': tag} for value, tag in sorted(desired) if (value, tag) not in current]
+
+        if stale_ids:
+            self._post_rules({'delete': {'ids': stale_ids}})
+        if missing:
+            self._post_rules({'add': missing})
+
+        if stale_ids or missing:
+            current_app.logger.info(f"Synced stream rules: {len(missing)} added, {len(stale_ids)} deleted")
+        return {'added': len(missing), 'deleted': len(stale_ids)}
+
+    def _post_rules(self, body):
+        response = self.session.post(f"{self.api_url}/tweets/search/stream/rules", json=body, timeout=10)
+        response.raise_for_status()
+        # Invalid rules are reported per rule in a 200 response
+        for error in response.json().get('errors') or []:
+            current_app.logger.warning(f"Stream rule rejected: {error.get('title')}: {error.get('value') or error}")
+
+    # Reader
+
+    @staticmethod
+    def get_backoff(error_kind, failures):
+        """
+        Seconds to wait before reconnecting, as recommended by 𝕏.
+
+        Args:
+            error_kind: "network", "http" or "rate_limit"
+            failures: Consecutive failed connection attempts (1 for the first)
+
+        Returns:
+            float: Delay in seconds
+        """
+        if error_kind == 'network':
+            return min(0.25 * failures, 16)
+        if error_kind == 'rate_limit':
+            return min(60 * 2 ** (failures - 1), 960)
+        return min(5 * 2 ** (failures - 1), 320)
+
+    def _read(self):
+        failures = 0
+        while not self.stopped.is_set():
+            error_kind = 'network'
+            try:
+                with self.session.get(
+                    f"{self.api_url}/tweets/search/stream",
+                    params={
+                        'tweet.fields': self.POST_FIELDS,
+                        'expansions': 'attachments.media_keys,author_id',
+                        'media.fields': 'type',
+                        'user.fields': 'verified'
+                    },
+                    stream=True,
+                    timeout=(10, self.READ_TIMEOUT)
+                ) as response:
+                    if response.status_code != 200:
+                        error_kind = 'rate_limit' if response.status_code == 429 else 'http'
+                        raise requests.HTTPError(f"{response.status_code} {response.text[:200]}")
+
+                    self._response = response
+                    failures = 0
+                    for line in response.iter_lines():
+                        if self.stopped.is_set():
+                            break
+                        if line:  # Blank lines are keep-alives
+                            self._enqueue(line)
+            except Exception as e:
+                if self.stopped.is_set():
+                    break
+                failures += 1
+                self.app.logger.warning(f"Stream connection failed ({type(e).__name__}: {str(e)})")
+            finally:
+                self._response = None
+
+            if not self.stopped.is_set():
+                self.stats['reconnects'] += 1
+                self.stopped.wait(self.get_backoff(error_kind, max(failures, 1)))
+
+    def _enqueue(self, line):
+        self.stats['received'] += 1
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            if self.stats['dropped'] % 1000 == 1:
+                self.app.logger.warning(f"Stream queue full, {self.stats['dropped']} posts dropped so far")
+
+    # Writer
+
+    @classmethod
+    def expand(cls, post, includes):
+        """
+        Fold what the rule matcher needs from a line's includes into its post.
+
+        Optional fields the post lacks are stored as None, so the matcher (and
+        later backtests over the stored data) can tell "none" from "not
+        requested"; media types go into 'media' and the author's verified
+        flag into 'author_verified'.
+
+        Args:
+            post: The line's post object
+            includes: The line's expanded objects
+
+        Returns:
+            dict: A copy of the post
+        """
+        post = dict(post)
+        for field in cls.OPTIONAL_FIELDS:
+            post.setdefault(field, None)
+
+        media = {item.get('media_key'): item for item in includes.get('media') or []}
+        media_keys = (post['attachments'] or {}).get('media_keys') or []
+        if all(key in media for key in media_keys):
+            post['media'] = [{'media_key': key, 'type': media[key].get('type')} for key in media_keys]
+
+        for user in includes.get('users') or []:
+            if user.get('id') == post.get('author_id') and 'verified' in user:
+                post['author_verified'] = bool(user['verified'])
+        return post
+
+    def rows_for(self, line, received_at=None):
+        """
+        Turn one line of the stream into StreamResult rows, one per matched Stream.
+
+        Args:
+            line: Raw JSON line from the stream
+            received_at: Time the line was read (default: now)
+
+        Returns:
+            list: Dicts of StreamResult column values
+        """
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            self.app.logger.warning(f"Skipping malformed stream line: {line[:200]!r}")
+            return []
+
+        post = payload.get('data')
+        if not post:
+            for error in payload.get('errors') or []:
+                self.app.logger.warning(f"Stream error: {error.get('title')}: {error.get('detail')}")
+            return []
+
+        post = self.expand(post, payload.get('includes') or {})
+        stream_ids = {
+            self.stream_id_for(rule.get('tag')) for rule in payload.get('matching_rules') or []
+        } - {None}
+        stream_ids |= self.matcher.match(post)
+
+        received_at = received_at or datetime.utcnow()
+        return [{
+            'stream_id': stream_id,
+            'post_id': post['id'],
+            'post_text': post.get('text', ''),
+            'author_id': post.get('author_id', ''),
+            'created_at': received_at,
+            'data': post
+        } for stream_id in sorted(stream_ids)]
+
+    def _next_batch(self):
+        """Wait for up to batch_size lines, or flush_interval seconds after the first one."""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _key(row):
+        return f"{row['stream_id']}:{row['post_id']}"
+
+    @staticmethod
+    def _insert_new(rows):
+        """
+        Insert rows, skipping (stream_id, post_id) pairs that are already stored.
+
+        Returns:
+            int: Number of rows inserted, or -1 if the driver does not report it
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert_(StreamResult.__table__).on_conflict_do_nothing(index_elements=['stream_id', 'post_id'])
+            return db.session.execute(stmt, rows).rowcount
+
+        # No ON CONFLICT: look the pairs up first
+        table = StreamResult.__table__
+        stored = set(db.session.execute(
+            select(table.c.stream_id, table.c.post_id).where(
+                tuple_(table.c.stream_id, table.c.post_id).in_([(row['stream_id'], row['post_id']) for row in rows])
+            )
+        ).all())
+        rows = [row for row in rows if (row['stream_id'], row['post_id']) not in stored]
+        if rows:
+            db.session.execute(insert(StreamResult), rows)
+        return len(rows)
+
+    def store(self, lines):
+        """
+        Store a batch of stream lines with one INSERT and one commit,
+        skipping posts already stored for the same Stream.
+
+        Must be called inside an application context.
+
+        Returns:
+            int: Number of StreamResult rows inserted
+        """
+        received_at = datetime.utcnow()
+        rows = {}
+        duplicates = 0
+        for line in lines:
+            for row in self.rows_for(line, received_at):
+                key = self._key(row)
+                if key in rows or key in self.recent:
+                    duplicates += 1
+                else:
+                    rows[key] = row
+        if not rows:
+            self.stats['duplicates'] += duplicates
+            return 0
+
+        # Streams deleted since their rules were synced have nowhere to store results
+        stream_ids = {row['stream_id'] for row in rows.values()}
+        existing = set(db.session.scalars(select(Stream.id).where(Stream.id.in_(stream_ids))))
+        rows = {key: row for key, row in rows.items() if row['stream_id'] in existing}
+
+        # The unique index no longer covers results that were archived
+        archived = StreamArchive.archived_pairs((row['stream_id'], row['post_id']) for row in rows.values())
+        if archived:
+            for key in [key for key, row in rows.items() if (row['stream_id'], row['post_id']) in archived]:
+                del rows[key]
+                self.recent.add(key)
+                duplicates += 1
+        if not rows:
+            self.stats['duplicates'] += duplicates
+            return 0
+
+        inserted = self._insert_new(list(rows.values()))
+        db.session.execute(
+            update(Stream).where(Stream.id.in_(existing)).values(last_run=received_at)
+        )
+        db.session.commit()
+
+        for key in rows:
+            self.recent.add(key)
+        if inserted < 0:
+            self.stats['duplicates'] += duplicates
+            return len(rows)
+        # Counted only once the batch is committed, so a retried batch is not counted twice
+        self.stats['duplicates'] += duplicates + len(rows) - inserted
+        return inserted
+
+    def _store_with_retry(self, batch):
+        """Store a batch, retrying failures with backoff before dropping it."""
+        for attempt in range(self.STORE_ATTEMPTS):
+            try:
+                self.stats['stored'] += self.store(batch)
+                return
+            except Exception as e:
+                db.session.rollback()
+                if attempt == self.STORE_ATTEMPTS - 1:
+                    self.stats['dropped'] += len(batch)
+                    current_app.logger.error(f"Error storing {len(batch)} stream posts, dropping them: {str(e)}")
+                    return
+
+                delay = self.STORE_RETRY_DELAY * 2 ** attempt
+                current_app.logger.warning(
+                    f"Error storing {len(batch)} stream posts ({str(e)}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt + 2}/{self.STORE_ATTEMPTS})"
+                )
+                time.sleep(delay)
+
+    def _write(self):
+        with self.app.app_context():
+            # Keep draining after stop() until everything read has been stored
+            while not (self.stopped.is_set() and self.queue.empty()):
+                batch = self._next_batch()
+                if batch:
+                    self._store_with_retry(batch)
+            db.session.remove()
+
+    # Lifecycle
+
+    def start(self):
+        """Sync the rules, then start the writer and reader threads."""
+        with self.app.app_context():
+            self.sync_rules()
+
+        self.stopped.clear()
+        self._writer = threading.Thread(target=self._write, name='stream-writer', daemon=True)
+        self._reader = threading.Thread(target=self._read, name='stream-reader', daemon=True)
+        self._writer.start()
+        self._reader.start()
+        self.app.logger.info(f"Stream ingestion started against {self.api_url}")
+
+    def stop(self, timeout=None):
+        """Disconnect, then wait for the writer to store what was already read."""
+        self.stopped.set()
+        response = self._response
+        if response is not None:
+            response.close()
+        if self._reader:
+            self._reader.join(timeout)
+        if self._writer:
+            self._writer.join(timeout)
+        self.session.close()
+        self.app.logger.info(f"Stream ingestion stopped: {self.stats}")
+
+    def run_forever(self):
+        """Ingest until interrupted, re-syncing the rules every STREAM_RULE_SYNC_INTERVAL seconds."""
+        interval = self.app.config.get('STREAM_RULE_SYNC_INTERVAL', self.RULE_SYNC_INTERVAL)
+        self.start()
+        try:
+            while not self.stopped.wait(interval):
+                with self.app.app_context():
+                    try:
+                        self.sync_rules()
+                    except Exception as e:
+                        current_app.logger.error(f"Error syncing stream rules: {str(e)}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
@@ -7,6 +7,9 @@ from urllib.parse import urlencode
 import os
 import requests
 
+from utils.client_registry import ClientRegistry
+from utils.rate_limit import RateLimitRegistry
+
 class TwitterOAuth:
     """Handler for Twitter OAuth 1.0a authentication."""
 
@@ -152,15 +155,14 @@ class TwitterOAuth:
             current_app.logger.error("No access tokens available")
             return None
 
-        current_app.logger.debug(f"Creating API client with consumer key: {consumer_key[:4]}...")
+        current_app.logger.debug(f"Getting API client with consumer key: {consumer_key[:4]}...")
         try:
-            auth = tweepy.OAuth1UserHandler(
+            return ClientRegistry.get_api(
                 consumer_key,
                 consumer_secret,
                 access_token,
                 access_token_secret
             )
-            return tweepy.API(auth)
         except Exception as e:
             current_app.logger.error(f"Error creating API client: {e}")
             return None
@@ -186,6 +188,11 @@ class TwitterOAuth:
 
         try:
             current_app.logger.debug("Verifying credentials with Twitter API")
+            RateLimitRegistry.acquire(
+                current_app.config['TWITTER_CONSUMER_KEY'],
+                access_token or current_app.config.get('TWITTER_ACCESS_TOKEN'),
+                RateLimitRegistry.VERIFY_CREDENTIALS
+            )
             user_info = api.verify_credentials(include_email=True)
             current_app.logger.debug(f"Got user info for: {user_info.screen_name}")
             return {
@@ -0,0 +1,105 @@
+"""
+In-process identity cache for logged-in 𝕏-Pilot users.
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.models import db, User
+
+
+class UserCache:
+    """
+    Caches the column values of recently seen users for USER_CACHE_TTL seconds.
+
+    get() rebuilds a User from the cached values and attaches it to the
+    session, so the login manager's user_loader runs no query at all while
+    the entry is fresh. Relationships still lazy-load as usual.
+
+    Every UPDATE of a user bumps the version. Once an entry expires, only the
+    row's version is read: if it is unchanged the entry is renewed, otherwise
+    the row is reloaded. A change made by another worker process is
+    therefore seen within TTL seconds, and a write through a copy it has made
+    stale fails with StaleDataError (User's version_id_col) instead of
+    overwriting that change. Within this process, any flushed change to a
+    user drops their entry, and token changes in auth.py invalidate
+    explicitly.
+    """
+
+    TTL = 30  # Seconds a user is served from memory
+
+    _entries = {}  # user_id -> (expires_at monotonic, column values)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _snapshot(user):
+        return {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs}
+
+    @classmethod
+    def get(cls, user_id):
+        """
+        Get a user, from the session, the cache or the database (in that order).
+
+        Must be called inside an application context.
+
+        Args:
+            user_id: The user's id
+
+        Returns:
+            User: The user attached to the current session, or None if there is no such user
+        """
+        existing = db.session.identity_map.get(db.session.identity_key(User, user_id))
+        if existing is not None:
+            return existing
+
+        ttl = current_app.config.get('USER_CACHE_TTL', cls.TTL)
+        with cls._lock:
+            entry = cls._entries.get(user_id)
+
+        if entry and entry[0] <= time.monotonic():
+            # Expired: keep the copy only if nobody has changed the row since
+            version = db.session.scalar(select(User.version).where(User.id == user_id))
+            if version is not None and version == entry[1]['version']:
+                renewed = (time.monotonic() + ttl, entry[1])
+                with cls._lock:
+                    # Unless a local write dropped it meanwhile
+                    if cls._entries.get(user_id) is entry:
+                        cls._entries[user_id] = renewed
+                entry = renewed
+            else:
+                cls.invalidate(user_id)
+                entry = None
+
+        if entry:
+            user = User(**entry[1])
+            make_transient_to_detached(user)
+            db.session.add(user)
+            return user
+
+        user = db.session.get(User, user_id)
+        if user is not None:
+            with cls._lock:
+                cls._entries[user_id] = (time.monotonic() + ttl, cls._snapshot(user))
+        return user
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """Drop a user's cached copy, e.g. after their tokens changed."""
+        with cls._lock:
+            cls._entries.pop(user_id, None)
+
+    @classmethod
+    def clear(cls):
+        """Forget every cached user."""
+        with cls._lock:
+            cls._entries.clear()
+
+
+# Before, not after: a write that fails as stale must drop the entry too
+@event.listens_for(User, 'before_update')
+@event.listens_for(User, 'before_delete')
+def _invalidate_changed_user(mapper, connection, target):
+    UserCache.invalidate(target.id)